@@ -0,0 +1,103 @@
+"""Archival: move old returned loans out of borrowing_records.
+
+Loans returned before a cutoff are copied into borrowing_records_archive under
+their record_ids and deleted from borrowing_records, so the indexes that
+checkout, return and the overdue sweep use hold only open and recent loans.
+Works in bounded chunks, walking the primary key and committing after each
+chunk, so no transaction holds locks for long; an interrupted run leaves every
+record in exactly one of the tables, and the next run carries on. Single-record
+reads and the history export look in both tables (see crud.py).
+
+    python archive.py [--before YYYY-MM-DD] [--chunk-size N]
+
+Configuration (env):
+  ARCHIVE_AFTER_DAYS   days after its return a loan is archived (default 365)
+"""
+import logging
+import os
+import time
+from datetime import date, timedelta
+
+from sqlalchemy import delete, func, insert, literal, select
+
+import models
+from database import SessionLocal, init_engines
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_AFTER_DAYS = int(os.getenv('ARCHIVE_AFTER_DAYS', '365'))
+DEFAULT_CHUNK_SIZE = 5000
+
+Loan = models.BorrowingRecord
+Archived = models.ArchivedBorrowingRecord
+
+COPIED_COLUMNS = [column.key for column in Loan.__table__.columns]
+
+def default_cutoff(today: date = None):
+    return (today or date.today()) - timedelta(days=ARCHIVE_AFTER_DAYS)
+
+def _archive_chunk(db, before: date, after_id: int, below_id: int, chunk_size: int):
+    """Move the next chunk after `after_id`; returns the ids moved (in order) or []."""
+    ids = [
+        record_id for record_id, in db.query(Loan.record_id).filter(
+            Loan.record_id > after_id, Loan.record_id < below_id, Loan.return_date < before
+        ).order_by(Loan.record_id).limit(chunk_size).with_for_update()
+    ]
+    if not ids:
+        return ids
+    db.execute(insert(Archived).from_select(
+        COPIED_COLUMNS + ["archived_at"],
+        select(*[getattr(Loan, key) for key in COPIED_COLUMNS], literal(models.utcnow()))
+        .where(Loan.record_id.in_(ids))
+    ))
+    db.execute(delete(Loan).where(Loan.record_id.in_(ids)).execution_options(synchronize_session=False))
+    db.commit()
+    return ids
+
+def run_archive(db, before: date = None, chunk_size: int = DEFAULT_CHUNK_SIZE):
+    """Archive loans returned before `before` and return a report dict (see schemas.ArchiveReport)."""
+    before = before or default_cutoff()
+    started = time.perf_counter()
+    # The newest record always stays: an auto-increment counter that restarts
+    # from MAX(record_id) + 1 (SQLite, MySQL before 8.0 after a restart) would
+    # otherwise hand an archived record_id out again.
+    below_id = db.query(func.max(Loan.record_id)).scalar() or 0
+    archived = chunks = last_id = 0
+    while True:
+        ids = _archive_chunk(db, before, last_id, below_id, chunk_size)
+        if not ids:
+            break
+        archived += len(ids)
+        chunks += 1
+        last_id = ids[-1]
+    db.commit()
+
+    report = {
+        "before": before,
+        "archived": archived,
+        "chunks": chunks,
+        "elapsed_seconds": round(time.perf_counter() - started, 3),
+    }
+    logger.info(f"Archival finished: {report}")
+    return report
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Move old returned loans to borrowing_records_archive.")
+    parser.add_argument("--before", type=date.fromisoformat, default=None,
+                        help=f"archive loans returned before this date; defaults to {ARCHIVE_AFTER_DAYS} days ago")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    init_engines()
+    db = SessionLocal()
+    try:
+        report = run_archive(db, before=args.before, chunk_size=args.chunk_size)
+    finally:
+        db.close()
+    for key, value in report.items():
+        print(f"{key}: {value}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+from datetime import date
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+import audit
+import crud
+import models
+import schemas
+import stats
+
+# Async CRUD operations used by the route handlers.
+#
+# Primary-key lookups are native async queries. Everything else runs the
+# existing functions in crud.py through AsyncSession.run_sync(), which executes
+# them on the async engine: each statement still awaits the driver, so the
+# event loop is free while the database works, but the query logic and
+# validation rules live in one place. Writes that record audit events first
+# wait for room in the audit queue (see audit.py).
+
+# Column lookups by primary key: conditional requests (see http_cache.py) and
+# existence checks
+async def get_columns(db: AsyncSession, model, entity_id: int, fields):
+    """The `fields` columns of one row as a tuple, or None if it does not exist."""
+    primary_key = model.__mapper__.primary_key[0]
+    result = await db.execute(select(*(getattr(model, field) for field in fields)).where(primary_key == entity_id))
+    return result.first()
+
+# Member CRUD operations
+async def create_member(db: AsyncSession, member: schemas.MemberCreate):
+    return await db.run_sync(crud.create_member, member)
+
+async def get_member(db: AsyncSession, member_id: int):
+    return await db.get(models.Member, member_id)
+
+async def get_members(db: AsyncSession, skip: int = 0, limit: int = 100, cursor: str = None, sort_by: str = None, columns=None):
+    return await db.run_sync(crud.get_members, skip, limit, cursor, sort_by, columns)
+
+async def get_member_dashboards(db: AsyncSession, member_ids):
+    return await db.run_sync(crud.get_member_dashboards, member_ids)
+
+async def get_member_dashboard(db: AsyncSession, member_id: int):
+    return await db.run_sync(crud.get_member_dashboard, member_id)
+
+async def get_member_eligibility(db: AsyncSession, member_id: int):
+    return await db.run_sync(crud.get_member_eligibility, member_id)
+
+async def lookup_members(db: AsyncSession, member_ids=(), emails=()):
+    return await db.run_sync(crud.lookup_members, member_ids, emails)
+
+async def update_member(db: AsyncSession, member_id: int, member: schemas.MemberBase):
+    return await db.run_sync(crud.update_member, member_id, member)
+
+async def delete_member(db: AsyncSession, member_id: int):
+    return await db.run_sync(crud.delete_member, member_id)
+
+# Book CRUD operations
+async def create_book(db: AsyncSession, book: schemas.BookCreate):
+    return await db.run_sync(crud.create_book, book)
+
+async def get_book(db: AsyncSession, book_id: int):
+    return await db.get(models.Book, book_id)
+
+async def get_books(db: AsyncSession, skip: int = 0, limit: int = 100, search: str = None,
+                    cursor: str = None, sort_by: str = None, columns=None):
+    return await db.run_sync(crud.get_books, skip, limit, search, cursor, sort_by, columns)
+
+async def lookup_books(db: AsyncSession, book_ids=(), isbns=()):
+    return await db.run_sync(crud.lookup_books, book_ids, isbns)
+
+async def update_book(db: AsyncSession, book_id: int, book: schemas.BookBase):
+    return await db.run_sync(crud.update_book, book_id, book)
+
+async def delete_book(db: AsyncSession, book_id: int):
+    return await db.run_sync(crud.delete_book, book_id)
+
+# Staff CRUD operations
+async def create_staff(db: AsyncSession, staff: schemas.StaffCreate):
+    return await db.run_sync(crud.create_staff, staff)
+
+async def get_staff(db: AsyncSession, staff_id: int):
+    return await db.get(models.Staff, staff_id)
+
+async def get_staff_list(db: AsyncSession, skip: int = 0, limit: int = 100, cursor: str = None, sort_by: str = None, columns=None):
+    return await db.run_sync(crud.get_staff_list, skip, limit, cursor, sort_by, columns)
+
+async def update_staff(db: AsyncSession, staff_id: int, staff: schemas.StaffBase):
+    return await db.run_sync(crud.update_staff, staff_id, staff)
+
+async def delete_staff(db: AsyncSession, staff_id: int):
+    return await db.run_sync(crud.delete_staff, staff_id)
+
+# Borrowing Record CRUD operations
+async def create_borrowing_record(db: AsyncSession, borrowing: schemas.BorrowingRecordCreate):
+    await audit.log.wait_for_room()
+    return await db.run_sync(crud.create_borrowing_record, borrowing)
+
+async def return_borrowing_record(db: AsyncSession, record_id: int, return_date: date = None, staff_id: int = None):
+    await audit.log.wait_for_room()
+    return await db.run_sync(crud.return_borrowing_record, record_id, return_date, staff_id)
+
+async def get_borrowing_record(db: AsyncSession, record_id: int):
+    # Archived records are looked up only when the hot table misses.
+    return await db.get(models.BorrowingRecord, record_id) or await db.get(models.ArchivedBorrowingRecord, record_id)
+
+async def get_circulation_events(db: AsyncSession, record_id: int):
+    return await db.run_sync(crud.get_circulation_events, record_id)
+
+async def get_borrowing_records(db: AsyncSession, skip: int = 0, limit: int = 100, cursor: str = None, sort_by: str = None, columns=None):
+    return await db.run_sync(crud.get_borrowing_records, skip, limit, cursor, sort_by, columns)
+
+async def stream_borrowing_history(db: AsyncSession, columns, from_date: date = None, to_date: date = None,
+                                   status: str = None, chunk_size: int = 1000):
+    """Yield lists of row tuples from a server-side cursor, `chunk_size` at a time."""
+    statement = crud.borrowing_history_query(columns, from_date=from_date, to_date=to_date, status=status)
+    result = await db.stream(statement)
+    async for rows in result.partitions(chunk_size):
+        yield rows
+
+async def update_borrowing_record(db: AsyncSession, record_id: int, borrowing: schemas.BorrowingRecordBase):
+    await audit.log.wait_for_room()
+    return await db.run_sync(crud.update_borrowing_record, record_id, borrowing)
+
+async def batch_checkout(db: AsyncSession, checkout: schemas.BatchCheckout, mode: str = crud.BATCH_PARTIAL):
+    await audit.log.wait_for_room()
+    return await db.run_sync(crud.batch_checkout, checkout, mode)
+
+async def batch_return(db: AsyncSession, batch: schemas.BatchReturn, mode: str = crud.BATCH_PARTIAL):
+    await audit.log.wait_for_room()
+    return await db.run_sync(crud.batch_return, batch, mode)
+
+# Reservation CRUD operations
+async def create_reservation(db: AsyncSession, reservation: schemas.ReservationCreate):
+    return await db.run_sync(crud.create_reservation, reservation)
+
+async def get_reservation(db: AsyncSession, reservation_id: int):
+    return await db.get(models.Reservation, reservation_id)
+
+async def get_reservations(db: AsyncSession, skip: int = 0, limit: int = 100, cursor: str = None, sort_by: str = None, columns=None):
+    return await db.run_sync(crud.get_reservations, skip, limit, cursor, sort_by, columns)
+
+async def get_queue_position(db: AsyncSession, reservation_id: int):
+    return await db.run_sync(crud.get_queue_position, reservation_id)
+
+async def update_reservation(db: AsyncSession, reservation_id: int, reservation: schemas.ReservationBase):
+    return await db.run_sync(crud.update_reservation, reservation_id, reservation)
+
+# Bulk import. bulk.py and overdue.py only serve admin routes, so they are
+# imported on first use rather than when a worker starts.
+async def insert_import_batch(db: AsyncSession, target: str, rows):
+    import bulk
+    return await db.run_sync(bulk.insert_batch, target, rows)
+
+# Batch jobs
+async def run_overdue_sweep(db: AsyncSession, as_of: date = None, chunk_size: int = None):
+    import overdue
+    return await db.run_sync(overdue.run_overdue_sweep, as_of, chunk_size or overdue.DEFAULT_CHUNK_SIZE)
+
+async def run_archive(db: AsyncSession, before: date = None, chunk_size: int = None):
+    import archive
+    return await db.run_sync(archive.run_archive, before, chunk_size or archive.DEFAULT_CHUNK_SIZE)
+
+# Statistics
+async def get_loans_per_day(db: AsyncSession, from_date: date, to_date: date):
+    return await db.run_sync(stats.loans_per_day, from_date, to_date)
+
+async def get_top_titles(db: AsyncSession, limit: int = 10):
+    return await db.run_sync(stats.top_titles, limit)
+
+async def get_category_utilization(db: AsyncSession):
+    return await db.run_sync(stats.category_utilization)
+
+async def get_stats_summary(db: AsyncSession):
+    return await db.run_sync(stats.summary)
+
+async def compact_stats(db: AsyncSession):
+    return await db.run_sync(stats.run_compaction)
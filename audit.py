@@ -0,0 +1,197 @@
+import asyncio
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+import models
+from database import SessionLocal
+
+# Append-only circulation audit log (table circulation_audit_log).
+#
+# crud.py records an event after each checkout and return commits. Events go
+# into an in-memory queue and a background thread writes them in batches, so
+# a checkout never waits on the log's INSERT.
+#
+# The queue holds about AUDIT_QUEUE_SIZE events. In the API, record() runs on
+# the event loop and must not block, so the bound is applied before a
+# circulation request starts: async_crud awaits wait_for_room(), which holds
+# that request alone while the queue is full; requests already running still
+# record their events. Under a sustained burst, checkouts slow down to the rate
+# the log can absorb rather than events being dropped. Off the event loop
+# (scripts, benchmarks) record() itself waits for room.
+#
+# While the database rejects a batch the writer retries it with backoff.
+# Shutdown (main.py) and interpreter exit write out whatever is queued, for at
+# most AUDIT_CLOSE_SECONDS; events that still cannot be written are logged in
+# full at ERROR level, to be replayed by hand, rather than lost silently.
+#
+# Configuration (env):
+#   AUDIT_QUEUE_SIZE      events buffered before circulation waits (default 10000)
+#   AUDIT_BATCH_SIZE      events per INSERT batch (default 500)
+#   AUDIT_FLUSH_SECONDS   longest an event waits for a batch to fill (default 1.0)
+#   AUDIT_CLOSE_SECONDS   longest shutdown waits for the writer (default 10)
+
+AUDIT_QUEUE_SIZE = int(os.getenv('AUDIT_QUEUE_SIZE', '10000'))
+AUDIT_BATCH_SIZE = int(os.getenv('AUDIT_BATCH_SIZE', '500'))
+AUDIT_FLUSH_SECONDS = float(os.getenv('AUDIT_FLUSH_SECONDS', '1.0'))
+AUDIT_CLOSE_SECONDS = float(os.getenv('AUDIT_CLOSE_SECONDS', '10'))
+
+# Wait between attempts while the database rejects a batch.
+RETRY_SECONDS = (0.5, 1, 2, 5, 10, 30)
+# How often wait_for_room() looks at the queue again.
+ROOM_POLL_SECONDS = 0.05
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+def _on_event_loop():
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+class AuditLog:
+    def __init__(self, session_factory, max_queue: int = AUDIT_QUEUE_SIZE, batch_size: int = AUDIT_BATCH_SIZE,
+                 flush_seconds: float = AUDIT_FLUSH_SECONDS):
+        self.session_factory = session_factory
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        # Unbounded itself; max_queue is applied by wait_for_room and record.
+        self._queue = queue.Queue()
+        self._room = threading.Condition()
+        self._closing = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.written = 0
+        self.blocked = 0
+        self.write_errors = 0
+        self.dropped = 0
+
+    def _full(self):
+        return self._queue.qsize() >= self.max_queue
+
+    async def wait_for_room(self):
+        """Wait, without blocking the event loop, until the queue is below max_queue."""
+        if not self._full():
+            return
+        self.blocked += 1
+        while self._full() and self._thread is not None and self._thread.is_alive():
+            await asyncio.sleep(ROOM_POLL_SECONDS)
+
+    def record(self, event: str, record_id: int, book_id: int, member_id: int, staff_id: int = None):
+        entry = {
+            "event": event,
+            "record_id": record_id,
+            "book_id": book_id,
+            "member_id": member_id,
+            "staff_id": staff_id,
+            "occurred_at": models.utcnow(),
+        }
+        self._start()
+        if self._full() and not _on_event_loop():
+            self.blocked += 1
+            with self._room:
+                self._room.wait_for(lambda: not self._full() or not self._thread.is_alive())
+        self._queue.put(entry)
+
+    def _start(self):
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._closing.clear()
+                    self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_seconds
+            while batch[-1] is not _STOP and len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            stopping = batch[-1] is _STOP
+            entries = batch[:-1] if stopping else batch
+            if entries and self._closing.is_set():
+                self._drop(entries, "shutdown timed out")
+            elif entries:
+                self._write(entries)
+            for _ in batch:
+                self._queue.task_done()
+            with self._room:
+                self._room.notify_all()
+            if stopping:
+                return
+
+    def _write(self, entries):
+        for attempt, delay in enumerate((*RETRY_SECONDS, None)):
+            db = self.session_factory()
+            try:
+                db.bulk_insert_mappings(models.CirculationEvent, entries)
+                db.commit()
+                self.written += len(entries)
+                return
+            except Exception:
+                db.rollback()
+                self.write_errors += 1
+                if delay is None or self._closing.is_set():
+                    logger.warning(f"Writing {len(entries)} audit events failed", exc_info=True)
+                    self._drop(entries, f"{attempt + 1} failed writes")
+                    return
+                logger.warning(f"Writing {len(entries)} audit events failed; retrying in {delay}s", exc_info=True)
+                # close() cuts the wait short.
+                self._closing.wait(delay)
+            finally:
+                db.close()
+
+    def _drop(self, entries, reason: str):
+        self.dropped += len(entries)
+        logger.error(
+            f"Dropping {len(entries)} audit events ({reason}):\n"
+            + "\n".join(json.dumps(entry, default=str) for entry in entries)
+        )
+
+    def flush(self):
+        """Block until every event recorded so far has been written."""
+        if self._thread is not None:
+            self._queue.join()
+
+    def close(self, timeout: float = AUDIT_CLOSE_SECONDS):
+        """Write out the queue and stop the writer; after `timeout` seconds, log what is left instead."""
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join(timeout)
+            if self._thread.is_alive():
+                self._closing.set()
+                self._thread.join()
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def stats(self):
+        return {
+            "written": self.written,
+            "blocked": self.blocked,
+            "write_errors": self.write_errors,
+            "dropped": self.dropped,
+            "pending": self.pending(),
+        }
+
+log = AuditLog(SessionLocal)
+atexit.register(log.close)
+
+def configure(session_factory):
+    """Write through another session factory (used by tests)."""
+    log.flush()
+    log.session_factory = session_factory
@@ -0,0 +1,151 @@
+"""Measure what archival does to the size and speed of borrowing_records.
+
+Seeds a throwaway SQLite database with years of circulation history, mostly
+returned, then measures the hot table and its indexes and times the queries
+that run against it: checkout plus return through crud.py, a member's open
+loans, the overdue sweep's candidate scan and reads by record_id of records
+that stay and of records that move. Archives everything returned more than
+ARCHIVE_AFTER_DAYS before the last day of the history and measures again.
+
+    python bench_archive.py [--loans 200000] [--years 5] [--repeat 500]
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import date, timedelta
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+import archive
+import audit
+import crud
+import models
+import overdue
+import schemas
+from database import Base
+
+TODAY = date(2026, 1, 1)
+MEMBERS = 2000
+BOOKS = 5000
+
+def seed(session, loans: int, years: int):
+    session.bulk_insert_mappings(models.Member, [
+        {
+            "name": f"Bench Member {i}", "email": f"archive{i}@example.com", "phone": "0",
+            "address": "Bench", "membership_date": date(2000, 1, 1), "membership_status": "Active"
+        }
+        for i in range(MEMBERS)
+    ])
+    session.bulk_insert_mappings(models.Book, [
+        {
+            "title": f"Bench Book {i}", "author": "Bench Author", "isbn": f"{i:013d}", "publication_year": 2000,
+            "publisher": "Bench", "category": "Bench", "total_copies": 50, "available_copies": 50, "location": "B"
+        }
+        for i in range(BOOKS)
+    ])
+    rng = random.Random(1)
+    span = years * 365
+    rows = []
+    for i in range(loans):
+        borrowed = TODAY - timedelta(days=span - span * i // loans)
+        returned = borrowed + timedelta(days=rng.randint(1, 28))
+        rows.append({
+            "book_id": rng.randint(1, BOOKS), "member_id": rng.randint(1, MEMBERS),
+            "borrow_date": borrowed, "due_date": borrowed + timedelta(days=14),
+            "return_date": returned if returned < TODAY else None,
+            "status": "Returned" if returned < TODAY else "Borrowed",
+        })
+    session.execute(models.BorrowingRecord.__table__.insert(), rows)
+    session.commit()
+
+def hot_size(session):
+    """(rows, bytes in the table and its indexes) of borrowing_records."""
+    names = ["borrowing_records"] + [index.name for index in models.BorrowingRecord.__table__.indexes]
+    pages = session.execute(text(
+        f"SELECT SUM(pgsize) FROM dbstat WHERE name IN ({', '.join(repr(name) for name in names)})"
+    )).scalar()
+    return session.query(models.BorrowingRecord).count(), pages
+
+def timed(session, repeat, fn):
+    """Mean milliseconds per call."""
+    samples = []
+    for i in range(repeat):
+        started = time.perf_counter()
+        fn(i)
+        samples.append(time.perf_counter() - started)
+        session.expunge_all()
+    return statistics.mean(samples) * 1000
+
+def measure(session, repeat, kept_ids, archived_ids):
+    rng = random.Random(2)
+    Loan = models.BorrowingRecord
+
+    def checkout_and_return(i):
+        loan = crud.create_borrowing_record(session, schemas.BorrowingRecordCreate(
+            book_id=rng.randint(1, BOOKS), member_id=rng.randint(1, MEMBERS),
+            borrow_date=TODAY, due_date=TODAY + timedelta(days=14)
+        ))
+        crud.return_borrowing_record(session, loan.record_id, return_date=TODAY)
+
+    def open_loans(i):
+        session.query(Loan).filter(Loan.member_id == rng.randint(1, MEMBERS), Loan.return_date == None).all()
+
+    def sweep_scan(i):
+        session.query(Loan.record_id).filter(overdue._late(TODAY, 'Borrowed')).all()
+
+    def read(record_ids):
+        return lambda i: crud.get_borrowing_record(session, rng.choice(record_ids))
+
+    return {
+        "checkout + return": timed(session, repeat, checkout_and_return),
+        "member open loans": timed(session, repeat, open_loans),
+        "overdue scan": timed(session, repeat, sweep_scan),
+        "read kept by id": timed(session, repeat, read(kept_ids)),
+        "read archived by id": timed(session, repeat, read(archived_ids)),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--loans", type=int, default=200000, help="loans in the seeded history")
+    parser.add_argument("--years", type=int, default=5, help="years the history spans")
+    parser.add_argument("--repeat", type=int, default=500, help="calls per timed operation")
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), "bench_archive.db")
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(bind=engine)
+    audit.configure(sessionmaker(bind=engine))
+    session = sessionmaker(bind=engine)()
+    try:
+        seed(session, args.loans, args.years)
+        before = TODAY - timedelta(days=archive.ARCHIVE_AFTER_DAYS)
+        ids = session.query(models.BorrowingRecord.record_id, models.BorrowingRecord.return_date < before).all()
+        rng = random.Random(3)
+        kept = rng.sample([record_id for record_id, old in ids if not old], 1000)
+        archived = rng.sample([record_id for record_id, old in ids if old], 1000)
+        rows, size = hot_size(session)
+        print(f"{args.loans} loans over {args.years} years; archiving those returned before {before}")
+        print(f"before: {rows} rows, {size / 2**20:.1f} MiB in borrowing_records and its indexes")
+        timings = measure(session, args.repeat, kept, archived)
+
+        report = archive.run_archive(session, before=before)
+        rows, size = hot_size(session)
+        print(f"archived {report['archived']} loans in {report['chunks']} chunks, {report['elapsed_seconds']} s")
+        print(f"after:  {rows} rows, {size / 2**20:.1f} MiB in borrowing_records and its indexes")
+        after = measure(session, args.repeat, kept, archived)
+
+        print(f"{'operation':<20} {'before ms':>10} {'after ms':>10}")
+        for name, elapsed in timings.items():
+            print(f"{name:<20} {elapsed:>10.3f} {after[name]:>10.3f}")
+    finally:
+        audit.log.close()
+        session.close()
+        engine.dispose()
+        os.remove(path)
+
+if __name__ == "__main__":
+    main()
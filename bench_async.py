@@ -0,0 +1,127 @@
+"""Load test: blocking sessions on a threadpool vs. async sessions.
+
+Issues the same book lookups through the sync path (crud + SessionLocal on a
+40-thread pool, the limit FastAPI applies to plain `def` handlers) and the
+async path (async_crud + AsyncSessionLocal on the event loop), and reports
+throughput for each.
+
+Runs against the database configured in .env by default. `--delay` adds a
+server-side SLEEP to every lookup (MySQL only) to model slow queries, which is
+where the threadpool becomes the bottleneck.
+
+    python bench_async.py --requests 2000 --concurrency 200 --delay 0.02
+    python bench_async.py --sqlite   # local smoke run
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+import async_crud
+import crud
+import database
+import models
+
+THREADPOOL_SIZE = 40
+
+def lookup_sync(session_factory, book_id, delay):
+    db = session_factory()
+    try:
+        if delay:
+            db.execute(text("SELECT SLEEP(:delay)"), {"delay": delay})
+        return crud.get_book(db, book_id)
+    finally:
+        db.close()
+
+async def lookup_async(session_factory, book_id, delay):
+    async with session_factory() as db:
+        if delay:
+            await db.execute(text("SELECT SLEEP(:delay)"), {"delay": delay})
+        return await async_crud.get_book(db, book_id)
+
+def run_sync(session_factory, book_ids, delay):
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=THREADPOOL_SIZE) as pool:
+        list(pool.map(lambda book_id: lookup_sync(session_factory, book_id, delay), book_ids))
+    return time.perf_counter() - started
+
+async def run_async(session_factory, book_ids, delay, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(book_id):
+        async with semaphore:
+            await lookup_async(session_factory, book_id, delay)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(book_id) for book_id in book_ids))
+    return time.perf_counter() - started
+
+def seed_books(session_factory, count):
+    db = session_factory()
+    try:
+        if db.query(models.Book).count() < count:
+            db.bulk_insert_mappings(models.Book, [
+                {
+                    "title": f"Load Test Book {i}", "author": "Load Test", "isbn": f"LT{i:011d}",
+                    "publication_year": 2000, "publisher": "Load Test", "category": "Load Test",
+                    "total_copies": 1, "available_copies": 1, "location": "LT",
+                }
+                for i in range(count)
+            ])
+            db.commit()
+        return [book_id for (book_id,) in db.query(models.Book.book_id).limit(count)]
+    finally:
+        db.close()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--delay", type=float, default=0.0, help="server-side SLEEP per lookup, seconds (MySQL only)")
+    parser.add_argument("--sqlite", action="store_true", help="use a throwaway SQLite database")
+    args = parser.parse_args()
+
+    if args.sqlite:
+        if args.delay:
+            parser.error("--delay needs MySQL")
+        path = os.path.join(tempfile.mkdtemp(), "bench_async.db")
+        engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+        async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    else:
+        engine = create_engine(
+            database.SQLALCHEMY_DATABASE_URL, pool_size=THREADPOOL_SIZE, max_overflow=0
+        )
+        async_engine = create_async_engine(
+            database.ASYNC_SQLALCHEMY_DATABASE_URL, pool_size=args.concurrency, max_overflow=0
+        )
+    database.Base.metadata.create_all(bind=engine)
+    session_factory = sessionmaker(bind=engine)
+    async_session_factory = sessionmaker(async_engine, class_=AsyncSession, expire_on_commit=False)
+
+    book_ids = seed_books(session_factory, 100)
+    workload = [book_ids[i % len(book_ids)] for i in range(args.requests)]
+
+    sync_elapsed = run_sync(session_factory, workload, args.delay)
+
+    async def async_phase():
+        try:
+            return await run_async(async_session_factory, workload, args.delay, args.concurrency)
+        finally:
+            await async_engine.dispose()
+
+    async_elapsed = asyncio.run(async_phase())
+
+    print(f"{args.requests} lookups, concurrency {args.concurrency}, delay {args.delay}s")
+    print(f"  sync  ({THREADPOOL_SIZE} threads): {args.requests / sync_elapsed:10.1f} req/s")
+    print(f"  async (event loop): {args.requests / async_elapsed:10.1f} req/s")
+
+    engine.dispose()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+"""Mixed-workload load test for the API.
+
+Seeds a synthetic library (books, members and a returned-loan history), then
+drives the FastAPI app in-process over ASGI with a weighted mix of searches,
+lookups, checkouts, returns and reservations at a fixed concurrency. Prints
+per-endpoint p50/p95/p99 latency and throughput as JSON, so two runs can be
+diffed between commits. The random seed fixes both the data and the request
+sequence.
+
+By default everything runs on a throwaway SQLite database. With --mysql the
+app uses the database configured in .env, which must already be migrated
+(`alembic upgrade head`); seeded rows are tagged and reused across runs.
+
+    python bench_load.py --books 5000 --members 2000 --history 50000 \\
+        --requests 5000 --concurrency 50 --output before.json
+    python bench_load.py --mix search=50,lookup=50   # read-only run
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import date, timedelta
+
+import httpx
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+import database
+import models
+import stats
+
+WORDS = (
+    "river", "shadow", "garden", "winter", "empire", "silent", "golden", "ocean", "forest", "machine",
+    "secret", "stone", "broken", "last", "city", "night", "paper", "glass", "iron", "summer",
+)
+CATEGORIES = ("Fiction", "History", "Science", "Poetry", "Travel", "Computer Science", "Art", "Biography")
+DEFAULT_MIX = "search=25,lookup=40,checkout=15,return=12,reserve=8"
+ISBN_PREFIX = "LB"
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name not in OPERATIONS:
+            raise argparse.ArgumentTypeError(f"unknown operation {name!r}; choose from {', '.join(OPERATIONS)}")
+        mix[name] = float(weight)
+    return mix
+
+def seed(session_factory, rng, books, members, history):
+    """Insert the synthetic library unless a previous run already did."""
+    db = session_factory()
+    try:
+        if db.query(models.Book).filter(models.Book.isbn.like(f"{ISBN_PREFIX}%")).count() >= books:
+            return
+        db.bulk_insert_mappings(models.Book, [
+            {
+                "title": " ".join(rng.sample(WORDS, 3)).title(),
+                "author": f"{rng.choice(WORDS).title()} {rng.choice(WORDS).title()}",
+                "isbn": f"{ISBN_PREFIX}{i:011d}",
+                "publication_year": rng.randint(1900, 2024),
+                "publisher": f"{rng.choice(WORDS).title()} Press",
+                "category": rng.choice(CATEGORIES),
+                "total_copies": 3,
+                "available_copies": 3,
+                "location": f"L-{i % 100}",
+            }
+            for i in range(books)
+        ])
+        db.bulk_insert_mappings(models.Member, [
+            {
+                "name": f"Load Member {i}",
+                "email": f"load{i}@bench.example.com",
+                "phone": "555-0000",
+                "address": f"{i} Bench Street",
+                "membership_date": date(2020, 1, 1),
+                "membership_status": "Active",
+            }
+            for i in range(members)
+        ])
+        db.flush()
+        book_ids = [book_id for (book_id,) in db.query(models.Book.book_id).filter(models.Book.isbn.like(f"{ISBN_PREFIX}%"))]
+        member_ids = [member_id for (member_id,) in db.query(models.Member.member_id).filter(
+            models.Member.email.like("%@bench.example.com"))]
+        start = date(2015, 1, 1)
+        for offset in range(0, history, 10000):
+            batch = []
+            for _ in range(min(10000, history - offset)):
+                borrowed = start + timedelta(days=rng.randrange(3000))
+                batch.append({
+                    "book_id": rng.choice(book_ids),
+                    "member_id": rng.choice(member_ids),
+                    "borrow_date": borrowed,
+                    "due_date": borrowed + timedelta(days=14),
+                    "return_date": borrowed + timedelta(days=rng.randint(1, 20)),
+                    "status": "Returned",
+                })
+            db.bulk_insert_mappings(models.BorrowingRecord, batch)
+        db.commit()
+        stats.rebuild(db)
+    finally:
+        db.close()
+
+class Workload:
+    def __init__(self, client, rng, book_ids, member_ids):
+        self.client = client
+        self.rng = rng
+        self.book_ids = book_ids
+        self.member_ids = member_ids
+        self.open_loans = []
+        self.today = date.today().isoformat()
+
+    async def search(self):
+        # Drop the last letter so the final term is matched as a prefix.
+        terms = " ".join(self.rng.sample(WORDS, self.rng.randint(1, 2)))[:-1]
+        return "GET /books/?search", await self.client.get("/books/", params={"search": terms}), (200,)
+
+    async def lookup(self):
+        if self.rng.random() < 0.5:
+            return "GET /books/{id}", await self.client.get(f"/books/{self.rng.choice(self.book_ids)}"), (200,)
+        return "GET /members/{id}", await self.client.get(f"/members/{self.rng.choice(self.member_ids)}"), (200,)
+
+    async def checkout(self):
+        response = await self.client.post("/borrowing-records/", json={
+            "book_id": self.rng.choice(self.book_ids),
+            "member_id": self.rng.choice(self.member_ids),
+            "borrow_date": self.today,
+            "due_date": (date.today() + timedelta(days=14)).isoformat(),
+        })
+        if response.status_code == 200:
+            self.open_loans.append(response.json()["record_id"])
+        # 400: no copy left, a normal outcome under load
+        return "POST /borrowing-records/", response, (200, 400)
+
+    async def return_(self):
+        if not self.open_loans:
+            return await self.checkout()
+        record_id = self.open_loans.pop(self.rng.randrange(len(self.open_loans)))
+        return "POST /borrowing-records/{id}/return", await self.client.post(
+            f"/borrowing-records/{record_id}/return"
+        ), (200,)
+
+    async def reserve(self):
+        return "POST /reservations/", await self.client.post("/reservations/", json={
+            "book_id": self.rng.choice(self.book_ids),
+            "member_id": self.rng.choice(self.member_ids),
+            "reservation_date": self.today,
+        }), (200, 400)
+
+OPERATIONS = {
+    "search": Workload.search,
+    "lookup": Workload.lookup,
+    "checkout": Workload.checkout,
+    "return": Workload.return_,
+    "reserve": Workload.reserve,
+}
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+def summarize(samples, errors, elapsed):
+    def describe(latencies, error_count):
+        ordered = sorted(latencies)
+        return {
+            "requests": len(ordered),
+            "errors": error_count,
+            "throughput_rps": round(len(ordered) / elapsed, 1),
+            "mean_ms": round(statistics.mean(ordered) * 1000, 3),
+            "p50_ms": round(percentile(ordered, 0.50) * 1000, 3),
+            "p95_ms": round(percentile(ordered, 0.95) * 1000, 3),
+            "p99_ms": round(percentile(ordered, 0.99) * 1000, 3),
+        }
+    endpoints = {name: describe(latencies, errors[name]) for name, latencies in sorted(samples.items())}
+    everything = [latency for latencies in samples.values() for latency in latencies]
+    return {"overall": describe(everything, sum(errors.values())), "endpoints": endpoints}
+
+async def drive(app, rng, mix, requests, concurrency, book_ids, member_ids):
+    samples = defaultdict(list)
+    errors = defaultdict(int)
+    names, weights = zip(*mix.items())
+    plan = rng.choices(names, weights=weights, k=requests)
+    queue = asyncio.Queue()
+    for name in plan:
+        queue.put_nowait(name)
+
+    async with httpx.AsyncClient(app=app, base_url="http://bench") as client:
+        workload = Workload(client, rng, book_ids, member_ids)
+
+        async def worker():
+            while not queue.empty():
+                operation = OPERATIONS[queue.get_nowait()]
+                started = time.perf_counter()
+                endpoint, response, expected = await operation(workload)
+                samples[endpoint].append(time.perf_counter() - started)
+                if response.status_code not in expected:
+                    errors[endpoint] += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    return summarize(samples, errors, elapsed)
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)), check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--books", type=int, default=2000)
+    parser.add_argument("--members", type=int, default=1000)
+    parser.add_argument("--history", type=int, default=20000, help="returned loans to seed")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX),
+                        help=f"operation weights (default {DEFAULT_MIX})")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--mysql", action="store_true", help="use the database from .env instead of SQLite")
+    parser.add_argument("--output", help="write the JSON report here as well as to stdout")
+    args = parser.parse_args()
+
+    if args.mysql:
+        engine = database.engine
+        async_engine = database.async_engine
+    else:
+        path = os.path.join(tempfile.mkdtemp(), "bench_load.db")
+        engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+        async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+        database.Base.metadata.create_all(bind=engine)
+    session_factory = sessionmaker(bind=engine)
+    async_session_factory = sessionmaker(async_engine, class_=AsyncSession, expire_on_commit=False)
+
+    rng = random.Random(args.seed)
+    seeding_started = time.perf_counter()
+    seed(session_factory, rng, args.books, args.members, args.history)
+    seeding_seconds = time.perf_counter() - seeding_started
+    db = session_factory()
+    try:
+        book_ids = [book_id for (book_id,) in db.query(models.Book.book_id).filter(
+            models.Book.isbn.like(f"{ISBN_PREFIX}%")).limit(args.books)]
+        member_ids = [member_id for (member_id,) in db.query(models.Member.member_id).filter(
+            models.Member.email.like("%@bench.example.com")).limit(args.members)]
+    finally:
+        db.close()
+
+    import audit
+    import main as service
+    import metrics
+
+    async def session():
+        async with async_session_factory() as db:
+            yield db
+
+    service.app.dependency_overrides[database.get_async_db] = session
+    service.app.dependency_overrides[database.get_read_db] = session
+    metrics.instrument_engine(async_engine)
+    audit.configure(session_factory)
+
+    async def run():
+        try:
+            return await drive(service.app, rng, args.mix, args.requests, args.concurrency, book_ids, member_ids)
+        finally:
+            await async_engine.dispose()
+
+    results = asyncio.run(run())
+    report = {
+        "revision": git_revision(),
+        "database": async_engine.dialect.name,
+        "config": {
+            "books": args.books, "members": args.members, "history": args.history,
+            "requests": args.requests, "concurrency": args.concurrency, "mix": args.mix, "seed": args.seed,
+        },
+        "seeding_seconds": round(seeding_seconds, 2),
+        **results,
+    }
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    engine.dispose()
+    return 1 if report["overall"]["errors"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,95 @@
+"""Compare deep-page latency of OFFSET and cursor pagination.
+
+Seeds a throwaway SQLite database with borrowing records and fetches the same
+page near the end of the table with both modes.
+
+    python bench_pagination.py [--rows N] [--page-size N]
+"""
+import argparse
+import os
+import tempfile
+import time
+from datetime import date, timedelta
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import crud
+import models
+from database import Base
+from pagination import encode_cursor
+
+def seed(session, rows):
+    session.add(models.Book(
+        title="Bench Book", author="Bench Author", isbn="0000000000000",
+        publication_year=2000, publisher="Bench", category="Bench",
+        total_copies=1, available_copies=1, location="Bench"
+    ))
+    session.add(models.Member(
+        name="Bench Member", email="bench@example.com", phone="0", address="Bench",
+        membership_date=date.today(), membership_status="Active"
+    ))
+    session.flush()
+    start = date(2000, 1, 1)
+    batch = []
+    for i in range(rows):
+        borrow_date = start + timedelta(days=i % 3650)
+        batch.append({
+            "book_id": 1,
+            "member_id": 1,
+            "borrow_date": borrow_date,
+            "due_date": borrow_date + timedelta(days=14),
+            "status": "Returned",
+        })
+        if len(batch) == 10000:
+            session.bulk_insert_mappings(models.BorrowingRecord, batch)
+            batch = []
+    if batch:
+        session.bulk_insert_mappings(models.BorrowingRecord, batch)
+    session.commit()
+
+def timed(fn, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=200000, help="borrowing records to seed")
+    parser.add_argument("--page-size", type=int, default=100, help="records per page")
+    args = parser.parse_args()
+    rows, page_size = args.rows, args.page_size
+
+    path = os.path.join(tempfile.mkdtemp(), "bench_pagination.db")
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    try:
+        print(f"Seeding {rows} borrowing records...")
+        seed(session, rows)
+
+        skip = rows - page_size
+        offset_time, offset_page = timed(
+            lambda: crud.get_borrowing_records(session, skip=skip, limit=page_size)
+        )
+        # The cursor a client would hold after walking to the previous page.
+        cursor = encode_cursor(None, None, offset_page[0].record_id - 1)
+        cursor_time, cursor_page = timed(
+            lambda: crud.get_borrowing_records(session, cursor=cursor, limit=page_size)
+        )
+        assert [r.record_id for r in offset_page] == [r.record_id for r in cursor_page]
+
+        print(f"Deep page (skip={skip}, limit={page_size})")
+        print(f"  offset: {offset_time * 1000:8.2f} ms")
+        print(f"  cursor: {cursor_time * 1000:8.2f} ms")
+        print(f"  speedup: {offset_time / cursor_time:.1f}x")
+    finally:
+        session.close()
+        engine.dispose()
+        os.remove(path)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Measure hold-queue fulfillment latency as the queue grows.
+
+For each queue depth, seeds a throwaway SQLite database with one single-copy
+book and that many pending holds on it, then times returns: each return hands
+the copy to the head of the queue, and the new loan is returned again for the
+next measurement. Runs once with the queue index and once without it.
+
+    python bench_reservations.py [--repeat N] [--depths 100,10000,100000]
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+from datetime import date, timedelta
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+import audit
+import crud
+import models
+from database import Base
+
+def seed(session, depth):
+    session.add(models.Book(
+        title="Bench Book", author="Bench Author", isbn="0000000000000",
+        publication_year=2000, publisher="Bench", category="Bench",
+        total_copies=1, available_copies=0, location="Bench"
+    ))
+    session.bulk_insert_mappings(models.Member, [
+        {
+            "name": f"Bench Member {i}", "email": f"bench{i}@example.com", "phone": "0",
+            "address": "Bench", "membership_date": date(2000, 1, 1), "membership_status": "Active"
+        }
+        for i in range(depth + 1)
+    ])
+    session.flush()
+    session.add(models.BorrowingRecord(
+        book_id=1, member_id=1, borrow_date=date(2000, 1, 1), due_date=date(2000, 1, 15)
+    ))
+    start = date(2000, 1, 1)
+    batch = []
+    for i in range(depth):
+        batch.append({
+            "book_id": 1,
+            "member_id": i + 2,
+            "reservation_date": start + timedelta(days=i // 100),
+            "status": "Pending",
+        })
+        if len(batch) == 10000:
+            session.bulk_insert_mappings(models.Reservation, batch)
+            batch = []
+    if batch:
+        session.bulk_insert_mappings(models.Reservation, batch)
+    session.commit()
+
+def measure(session, returns):
+    timings = []
+    loan = session.query(models.BorrowingRecord).filter(models.BorrowingRecord.return_date == None).one()
+    for _ in range(returns):
+        started = time.perf_counter()
+        crud.return_borrowing_record(session, loan.record_id, return_date=date(2030, 1, 1))
+        timings.append(time.perf_counter() - started)
+        loan = session.query(models.BorrowingRecord).filter(models.BorrowingRecord.return_date == None).one()
+    return timings
+
+def run(depth, returns, with_index):
+    path = os.path.join(tempfile.mkdtemp(), "bench_reservations.db")
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(bind=engine)
+    audit.configure(sessionmaker(bind=engine))
+    session = sessionmaker(bind=engine)()
+    try:
+        if not with_index:
+            session.execute(text("DROP INDEX ix_reservations_book_id_status_queue"))
+        seed(session, depth)
+        return measure(session, returns)
+    finally:
+        audit.log.close()
+        session.close()
+        engine.dispose()
+        os.remove(path)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=50, help="returns timed per queue depth")
+    parser.add_argument("--depths", default="100,10000,100000", help="comma-separated queue depths")
+    args = parser.parse_args()
+    returns, depths = args.repeat, [int(depth) for depth in args.depths.split(",")]
+
+    print(f"Return -> fulfill next hold, median of {returns} returns")
+    print(f"{'depth':>8} {'queue index':>12} {'no index':>12}")
+    for depth in depths:
+        indexed = statistics.median(run(depth, returns, with_index=True))
+        scanned = statistics.median(run(depth, returns, with_index=False))
+        print(f"{depth:>8} {indexed * 1000:>9.2f} ms {scanned * 1000:>9.2f} ms")
+
+if __name__ == "__main__":
+    main()
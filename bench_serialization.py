@@ -0,0 +1,91 @@
+"""Compare the two ways a list page can be turned into JSON.
+
+Seeds a throwaway SQLite database with books and times one page through
+  - the response_model path: ORM objects -> schemas.Book.from_orm ->
+    jsonable_encoder -> json.dumps (what FastAPI does for a returned list)
+  - the fast path: schema columns as row tuples -> orjson (serialization.py)
+Both timings include the query; the documents are checked to be identical.
+
+    python bench_serialization.py [--page-size N] [--repeat N]
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import crud
+import models
+import schemas
+import serialization
+from database import Base
+
+def seed(session, rows):
+    session.bulk_insert_mappings(models.Book, [
+        {
+            "title": f"Bench Book {i}",
+            "author": f"Bench Author {i % 50}",
+            "isbn": f"{i:013d}",
+            "publication_year": 1900 + i % 120,
+            "publisher": "Bench Press",
+            "category": "Bench",
+            "total_copies": 3,
+            "available_copies": 2,
+            "location": f"B-{i % 20}",
+        }
+        for i in range(rows)
+    ])
+    session.commit()
+
+def timed(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--page-size", type=int, default=100, help="books per page")
+    parser.add_argument("--repeat", type=int, default=200, help="calls per timed path")
+    args = parser.parse_args()
+    page_size, repeat = args.page_size, args.repeat
+
+    path = os.path.join(tempfile.mkdtemp(), "bench_serialization.db")
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    columns = serialization.schema_columns(models.Book, schemas.Book)
+    try:
+        seed(session, page_size)
+
+        def response_model_path():
+            # A fresh session per call, as each request gets its own.
+            session.expunge_all()
+            books = crud.get_books(session, limit=page_size)
+            content = [jsonable_encoder(schemas.Book.from_orm(book)) for book in books]
+            return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode()
+
+        def fast_path():
+            return serialization.dump_rows(schemas.Book, crud.get_books(session, limit=page_size, columns=columns))
+
+        slow_time, slow_body = timed(response_model_path, repeat)
+        fast_time, fast_body = timed(fast_path, repeat)
+        assert json.loads(slow_body) == json.loads(fast_body)
+
+        print(f"GET /books/ page of {page_size} (best of {repeat})")
+        print(f"  response_model: {slow_time * 1000:8.2f} ms")
+        print(f"  rows + orjson:  {fast_time * 1000:8.2f} ms")
+        print(f"  speedup: {slow_time / fast_time:.1f}x")
+    finally:
+        session.close()
+        engine.dispose()
+        os.remove(path)
+
+if __name__ == "__main__":
+    main()
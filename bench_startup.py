@@ -0,0 +1,158 @@
+"""Cold-start benchmark: how long a new worker takes to answer its first request.
+
+Each run starts a fresh interpreter that imports main, runs the app's lifespan
+startup (engine creation and pool prewarming) and serves one GET /books/ over
+ASGI, timing each phase. Prints the median and worst of every phase as JSON,
+plus the modules that spend the most time importing (`python -X importtime`).
+
+By default the app runs on a throwaway SQLite database; with --mysql it uses
+the database configured in .env. --max-import-ms and --max-cold-start-ms turn
+the run into a regression check: the exit status is 1 when a median exceeds
+its limit.
+
+    python bench_startup.py [--runs 10] [--max-import-ms 900] [--output startup.json]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from sqlalchemy import create_engine
+
+import database
+import models  # noqa: F401  (registers the tables on Base.metadata)
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Runs in the fresh interpreter; argv[1] is the SQLite path or "" for MySQL.
+CHILD = r"""
+import sys, time
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+
+import asyncio, json
+import httpx
+import database
+
+async def run():
+    if sys.argv[1]:
+        from sqlalchemy import create_engine
+        from sqlalchemy.ext.asyncio import create_async_engine
+        database.engine = create_engine(f"sqlite:///{sys.argv[1]}")
+        database.async_engine = create_async_engine(f"sqlite+aiosqlite:///{sys.argv[1]}")
+        database.read_router = database.ReplicaRouter(database.async_engine)
+        database.SessionLocal.configure(bind=database.engine)
+        database.AsyncSessionLocal.configure(bind=database.async_engine)
+    lifespan = main.app.router.lifespan_context(main.app)
+    await lifespan.__anext__()
+    ready = time.perf_counter()
+    async with httpx.AsyncClient(app=main.app, base_url="http://bench") as client:
+        response = await client.get("/books/")
+    answered = time.perf_counter()
+    answered_at = time.time()
+    try:
+        await lifespan.__anext__()
+    except StopAsyncIteration:
+        pass
+    return {
+        "status": response.status_code,
+        "import_ms": (imported - started) * 1000,
+        "startup_ms": (ready - imported) * 1000,
+        "first_request_ms": (answered - ready) * 1000,
+        "answered_at": answered_at,
+    }
+
+print(json.dumps(asyncio.run(run())))
+"""
+
+PHASES = ("import_ms", "startup_ms", "first_request_ms", "cold_start_ms")
+
+def run_once(db_path):
+    spawned_at = time.time()
+    output = subprocess.run(
+        [sys.executable, "-c", CHILD, db_path], cwd=HERE, capture_output=True, text=True, check=True
+    ).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    if result["status"] != 200:
+        raise RuntimeError(f"first request answered {result['status']}")
+    # Interpreter start included: what a new pod waits before serving.
+    result["cold_start_ms"] = (result.pop("answered_at") - spawned_at) * 1000
+    return result
+
+def slowest_imports(count):
+    """The `count` modules with the most import time of their own under `import main`."""
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"], cwd=HERE, capture_output=True, text=True, check=True
+    ).stderr
+    modules = []
+    for line in stderr.splitlines():
+        fields = line[len("import time:"):].split("|")
+        if line.startswith("import time:") and fields[0].strip().isdigit():
+            modules.append({"module": fields[2].strip(), "self_ms": round(int(fields[0]) / 1000, 1)})
+    modules.sort(key=lambda module: module["self_ms"], reverse=True)
+    return modules[:count]
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, cwd=HERE, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--top", type=int, default=10, help="slowest imports to report")
+    parser.add_argument("--mysql", action="store_true", help="use the database from .env instead of SQLite")
+    parser.add_argument("--max-import-ms", type=float, help="fail if the median import exceeds this")
+    parser.add_argument("--max-cold-start-ms", type=float, help="fail if the median cold start exceeds this")
+    parser.add_argument("--output", help="write the JSON report here as well as to stdout")
+    args = parser.parse_args()
+
+    db_path = ""
+    if not args.mysql:
+        db_path = os.path.join(tempfile.mkdtemp(), "bench_startup.db")
+        engine = create_engine(f"sqlite:///{db_path}")
+        database.Base.metadata.create_all(bind=engine)
+        engine.dispose()
+    try:
+        runs = [run_once(db_path) for _ in range(args.runs)]
+    finally:
+        if db_path:
+            os.remove(db_path)
+
+    report = {
+        "revision": git_revision(),
+        "database": "mysql" if args.mysql else "sqlite",
+        "python": sys.version.split()[0],
+        "runs": args.runs,
+        **{
+            phase: {
+                "median": round(statistics.median(run[phase] for run in runs), 1),
+                "max": round(max(run[phase] for run in runs), 1),
+            }
+            for phase in PHASES
+        },
+        "slowest_imports": slowest_imports(args.top),
+    }
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+
+    failed = False
+    for limit, phase in ((args.max_import_ms, "import_ms"), (args.max_cold_start_ms, "cold_start_ms")):
+        if limit is not None and report[phase]["median"] > limit:
+            print(f"{phase} median {report[phase]['median']} exceeds {limit}", file=sys.stderr)
+            failed = True
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
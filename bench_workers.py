@@ -0,0 +1,182 @@
+"""Throughput of the production launcher (serve.py) across worker counts.
+
+For each worker count, starts `python serve.py` on a local port with the
+given DB_CONNECTION_BUDGET, waits until it answers, and drives it over HTTP
+with the mixed workload of bench_load.py from several client processes, so
+the load generator is not the bottleneck. Prints throughput and latency per
+worker count as JSON. Worker recycling is disabled during the runs.
+
+Runs against the database configured in .env, which must already be migrated
+(`alembic upgrade head`): worker processes cannot share an in-process SQLite
+database the way bench_load.py does. Seeded rows are tagged and reused, as
+with `bench_load.py --mysql`.
+
+    python bench_workers.py --workers 1,2,4,8 --requests 5000 --concurrency 64
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import signal
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+import httpx
+from sqlalchemy.orm import sessionmaker
+
+import bench_load
+import database
+import models
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+def start_server(workers: int, port: int, budget: int):
+    env = {
+        **os.environ,
+        "DB_CONNECTION_BUDGET": str(budget),
+        "WEB_MAX_REQUESTS": "0",
+        "WEB_MAX_WORKER_MEMORY_MB": "0",
+    }
+    server = subprocess.Popen(
+        [sys.executable, "serve.py", "--workers", str(workers), "--bind", f"127.0.0.1:{port}"],
+        cwd=HERE, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"serve.py exited with status {server.returncode}")
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/metrics").status_code == 200:
+                return server
+        except httpx.TransportError:
+            pass
+        time.sleep(0.2)
+    stop_server(server)
+    raise RuntimeError("serve.py did not start answering within 60 s")
+
+def stop_server(server):
+    server.send_signal(signal.SIGTERM)
+    try:
+        server.wait(timeout=60)
+    except subprocess.TimeoutExpired:
+        server.kill()
+
+def client(job):
+    """One load-generating process: its share of the requests at its share of the concurrency."""
+    base_url, seed, mix, requests, concurrency, book_ids, member_ids = job
+    rng = random.Random(seed)
+    samples = defaultdict(list)
+    errors = defaultdict(int)
+    names, weights = zip(*mix.items())
+    plan = rng.choices(names, weights=weights, k=requests)
+
+    async def run():
+        limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+        async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as http:
+            workload = bench_load.Workload(http, rng, book_ids, member_ids)
+
+            async def worker():
+                while plan:
+                    name = plan.pop()
+                    started = time.perf_counter()
+                    try:
+                        endpoint, response, expected = await bench_load.OPERATIONS[name](workload)
+                    except httpx.TransportError:
+                        # The connection failed or was dropped: an error, not a latency sample.
+                        errors[name] += 1
+                        continue
+                    samples[endpoint].append(time.perf_counter() - started)
+                    if response.status_code not in expected:
+                        errors[endpoint] += 1
+
+            await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+    started = time.perf_counter()
+    asyncio.run(run())
+    return dict(samples), dict(errors), time.perf_counter() - started
+
+def measure(pool, base_url, args, book_ids, member_ids):
+    jobs = [
+        (base_url, args.seed + i, args.mix, args.requests // args.clients,
+         max(1, args.concurrency // args.clients), book_ids, member_ids)
+        for i in range(args.clients)
+    ]
+    samples, errors = defaultdict(list), defaultdict(int)
+    elapsed = 0
+    for client_samples, client_errors, client_elapsed in pool.map(client, jobs):
+        for endpoint, latencies in client_samples.items():
+            samples[endpoint].extend(latencies)
+        for endpoint, count in client_errors.items():
+            errors[endpoint] += count
+        elapsed = max(elapsed, client_elapsed)
+    return bench_load.summarize(samples, errors, elapsed)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", default="1,2,4", help="comma-separated worker counts")
+    parser.add_argument("--budget", type=int, default=100, help="DB_CONNECTION_BUDGET for every run")
+    parser.add_argument("--books", type=int, default=2000)
+    parser.add_argument("--members", type=int, default=1000)
+    parser.add_argument("--history", type=int, default=20000, help="returned loans to seed")
+    parser.add_argument("--requests", type=int, default=4000, help="requests per worker count")
+    parser.add_argument("--warmup", type=int, default=200, help="untimed requests before each run")
+    parser.add_argument("--concurrency", type=int, default=64, help="requests in flight, over all clients")
+    parser.add_argument("--clients", type=int, default=4, help="load-generating processes")
+    parser.add_argument("--mix", type=bench_load.parse_mix, default=bench_load.parse_mix(bench_load.DEFAULT_MIX),
+                        help=f"operation weights (default {bench_load.DEFAULT_MIX})")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--port", type=int, default=8800)
+    parser.add_argument("--output", help="write the JSON report here as well as to stdout")
+    args = parser.parse_args()
+
+    session_factory = sessionmaker(bind=database.engine)
+    bench_load.seed(session_factory, random.Random(args.seed), args.books, args.members, args.history)
+    db = session_factory()
+    try:
+        book_ids = [book_id for (book_id,) in db.query(models.Book.book_id).filter(
+            models.Book.isbn.like(f"{bench_load.ISBN_PREFIX}%")).limit(args.books)]
+        member_ids = [member_id for (member_id,) in db.query(models.Member.member_id).filter(
+            models.Member.email.like("%@bench.example.com")).limit(args.members)]
+    finally:
+        db.close()
+    database.engine.dispose()
+
+    runs = []
+    with multiprocessing.Pool(args.clients) as pool:
+        for workers in (int(count) for count in args.workers.split(",")):
+            server = start_server(workers, args.port, args.budget)
+            base_url = f"http://127.0.0.1:{args.port}"
+            try:
+                if args.warmup:
+                    warmup = argparse.Namespace(**{**vars(args), "requests": args.warmup})
+                    measure(pool, base_url, warmup, book_ids, member_ids)
+                results = measure(pool, base_url, args, book_ids, member_ids)
+            finally:
+                stop_server(server)
+            runs.append({"workers": workers, **results["overall"]})
+            print(f"{workers} workers: {results['overall']['throughput_rps']} req/s, "
+                  f"p99 {results['overall']['p99_ms']} ms", file=sys.stderr)
+
+    report = {
+        "revision": bench_load.git_revision(),
+        "cpus": os.cpu_count(),
+        "config": {
+            "budget": args.budget, "books": args.books, "members": args.members, "history": args.history,
+            "requests": args.requests, "concurrency": args.concurrency, "clients": args.clients,
+            "mix": args.mix, "seed": args.seed,
+        },
+        "runs": runs,
+    }
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    return 1 if any(run["errors"] for run in runs) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
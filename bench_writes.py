@@ -0,0 +1,104 @@
+"""Measure write throughput and round trips per write for the CRUD paths.
+
+Runs create and update for members, books and reservations, plus duplicate
+inserts that must be rejected, through crud.py against a throwaway SQLite
+database. Each result is turned into its response schema, as the API does, so
+attributes a write left unloaded are paid for here too. SQLite runs in-process,
+so --latency-ms adds a fixed delay to every statement and commit to stand in
+for the network round trip to a database server.
+
+    python bench_writes.py [--writes 500] [--latency-ms 0.5]
+"""
+import argparse
+import os
+import tempfile
+import time
+from datetime import date
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+import crud
+import schemas
+from database import Base
+
+def member_payload(i):
+    return schemas.MemberCreate(
+        name=f"Bench Member {i}", email=f"writer{i}@example.com", phone="555-0100", address=f"{i} Bench Road"
+    )
+
+def book_payload(i):
+    return schemas.BookCreate(
+        title=f"Bench Book {i}", author="Bench Author", isbn=f"{i:013d}", publication_year=2000,
+        publisher="Bench Press", category="Bench", total_copies=2, available_copies=2, location="B-1"
+    )
+
+def rejected(fn, *args):
+    try:
+        fn(*args)
+    except ValueError:
+        return
+    raise AssertionError("duplicate write was accepted")
+
+def operations():
+    """(name, write, response schema) for each measured operation; updates change one field."""
+    return [
+        ("create_member", lambda db, i: crud.create_member(db, member_payload(i)), schemas.Member),
+        ("update_member", lambda db, i: crud.update_member(
+            db, i + 1, member_payload(i).copy(update={"phone": "555-0199"})
+        ), schemas.Member),
+        ("create_book", lambda db, i: crud.create_book(db, book_payload(i)), schemas.Book),
+        ("update_book", lambda db, i: crud.update_book(
+            db, i + 1, book_payload(i).copy(update={"location": "B-2"})
+        ), schemas.Book),
+        ("create_reservation", lambda db, i: crud.create_reservation(db, schemas.ReservationCreate(
+            book_id=i + 1, member_id=i + 1, reservation_date=date(2024, 1, 1)
+        )), schemas.Reservation),
+        ("duplicate_member", lambda db, i: rejected(crud.create_member, db, member_payload(i)), None),
+        ("duplicate_book", lambda db, i: rejected(crud.create_book, db, book_payload(i)), None),
+    ]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--writes", type=int, default=500, help="writes per operation")
+    parser.add_argument("--latency-ms", type=float, default=0.5, help="simulated round trip per statement")
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), "bench_writes.db")
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(bind=engine)
+    # As AsyncSessionLocal: committed objects stay loaded.
+    session = sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)()
+
+    round_trips = 0
+    delay = args.latency_ms / 1000
+
+    def round_trip(*_):
+        nonlocal round_trips
+        round_trips += 1
+        if delay:
+            time.sleep(delay)
+    event.listen(engine, "before_cursor_execute", round_trip)
+    event.listen(engine, "commit", round_trip)
+
+    print(f"{args.writes} writes per operation, {args.latency_ms} ms per round trip")
+    print(f"{'operation':<20} {'writes/s':>10} {'round trips':>12}")
+    try:
+        for name, write, schema in operations():
+            round_trips = 0
+            started = time.perf_counter()
+            for i in range(args.writes):
+                result = write(session, i)
+                if schema is not None:
+                    schema.from_orm(result)
+                # A fresh session per write, as each request gets its own.
+                session.expunge_all()
+            elapsed = time.perf_counter() - started
+            print(f"{name:<20} {args.writes / elapsed:>10.0f} {round_trips / args.writes:>12.1f}")
+    finally:
+        session.close()
+        engine.dispose()
+        os.remove(path)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+import csv
+import io
+import json
+from datetime import date
+
+from pydantic import ValidationError
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+import crud
+import models
+import schemas
+import serialization
+import stats
+
+# Bulk import/export of books and members.
+#
+# Uploads are parsed line by line as they stream in (CSV with a header row, or
+# NDJSON), validated against the same schemas as the single-row endpoints and
+# inserted in batches: one `IN (...)` query per batch finds keys that already
+# exist, then the remaining rows go in with a single executemany.
+
+# How each importable entity is keyed, validated and completed before insert.
+IMPORT_TARGETS = {
+    "books": (models.Book, "isbn", schemas.BookCreate, lambda: {}),
+    "members": (models.Member, "email", schemas.MemberCreate,
+                lambda: {"membership_date": date.today(), "membership_status": "Active"}),
+}
+# Row errors for unique violations, worded as the single-row endpoints word them.
+DUPLICATE_MESSAGES = {"books": crud.BOOK_DUPLICATES, "members": crud.MEMBER_DUPLICATES}
+
+def _decode(line: bytes, line_number: int):
+    try:
+        return line.decode("utf-8-sig").rstrip("\r")
+    except UnicodeDecodeError:
+        raise ValueError(f"Line {line_number} is not valid UTF-8") from None
+
+async def iter_lines(chunks):
+    """Split an async stream of byte chunks into decoded lines; raises ValueError on invalid UTF-8."""
+    pending = b""
+    line_number = 0
+    async for chunk in chunks:
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            line_number += 1
+            yield _decode(line, line_number)
+    if pending:
+        yield _decode(pending, line_number + 1)
+
+async def iter_records(lines, fmt: str):
+    """Yield (row_number, dict or error message) for each data row."""
+    row_number = 0
+    if fmt == "ndjson":
+        async for line in lines:
+            if not line.strip():
+                continue
+            row_number += 1
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield row_number, f"Invalid JSON: {e}"
+                continue
+            if not isinstance(record, dict):
+                yield row_number, "Expected a JSON object"
+                continue
+            yield row_number, record
+        return
+
+    header = None
+    buffered = ""
+    async for line in lines:
+        # A quoted field may contain newlines; keep reading until quotes balance.
+        buffered = f"{buffered}\n{line}" if buffered else line
+        if buffered.count('"') % 2:
+            continue
+        text, buffered = buffered, ""
+        if not text.strip():
+            continue
+        values = next(csv.reader([text]))
+        if header is None:
+            header = [name.strip() for name in values]
+            continue
+        row_number += 1
+        if len(values) != len(header):
+            yield row_number, f"Expected {len(header)} columns, got {len(values)}"
+            continue
+        # Empty cells mean "not provided" so schema defaults apply.
+        yield row_number, {name: value for name, value in zip(header, values) if value != ""}
+    if buffered:
+        yield row_number + 1, "Unterminated quoted field"
+
+def validate_record(target: str, record: dict):
+    """Return (validated schema, None) or (None, error message)."""
+    schema = IMPORT_TARGETS[target][2]
+    try:
+        return schema(**record), None
+    except ValidationError as e:
+        errors = "; ".join(f"{'.'.join(str(p) for p in err['loc'])}: {err['msg']}" for err in e.errors())
+        return None, errors
+
+def _record_inserted(db: Session, target: str, mappings):
+    if target != "books":
+        return
+    copies = {}
+    for mapping in mappings:
+        copies[mapping["category"]] = copies.get(mapping["category"], 0) + mapping["total_copies"]
+    for category, total in copies.items():
+        stats.add_copies(db, category, total)
+
+def _key(value):
+    # MySQL compares the keys case-insensitively, as the lookups do (see
+    # crud._lookup_key): "Ann@Example.com" duplicates "ann@example.com".
+    return value.lower() if isinstance(value, str) else value
+
+def insert_batch(db: Session, target: str, rows):
+    """Insert a batch of validated rows, skipping duplicate keys.
+
+    `rows` is a list of (row_number, schema). Returns (inserted, errors) where
+    errors is a list of schemas.ImportRowError.
+    """
+    model, key, _, extra = IMPORT_TARGETS[target]
+    key_column = getattr(model, key)
+    errors = []
+
+    keys = {getattr(row, key) for _, row in rows}
+    existing = {_key(value) for (value,) in db.query(key_column).filter(key_column.in_(keys))}
+
+    seen = set()
+    mappings = []
+    for row_number, row in rows:
+        value = getattr(row, key)
+        if _key(value) in existing or _key(value) in seen:
+            errors.append(schemas.ImportRowError(row=row_number, error=f"Duplicate {key}: {value}"))
+            continue
+        seen.add(_key(value))
+        mappings.append((row_number, {**row.dict(), **extra()}))
+
+    if not mappings:
+        return 0, errors
+
+    try:
+        db.bulk_insert_mappings(model, [mapping for _, mapping in mappings])
+        _record_inserted(db, target, [mapping for _, mapping in mappings])
+        db.commit()
+        return len(mappings), errors
+    except IntegrityError:
+        # Lost a race with a concurrent writer; retry row by row to find the culprits.
+        db.rollback()
+
+    inserted = 0
+    for row_number, mapping in mappings:
+        try:
+            db.bulk_insert_mappings(model, [mapping])
+            _record_inserted(db, target, [mapping])
+            db.commit()
+            inserted += 1
+        except IntegrityError as e:
+            db.rollback()
+            detail = str(e.orig).lower()
+            error = next(
+                (message for column, message in DUPLICATE_MESSAGES[target].items() if column in detail),
+                "Rejected by a database constraint"
+            )
+            errors.append(schemas.ImportRowError(row=row_number, error=error))
+    return inserted, errors
+
+def export_rows(schema, items, fmt: str):
+    """Serialize ORM objects as one NDJSON or CSV chunk."""
+    if fmt == "ndjson":
+        return "".join(schema.from_orm(item).json() + "\n" for item in items)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for item in items:
+        data = schema.from_orm(item).dict()
+        writer.writerow(["" if data[name] is None else data[name] for name in schema.__fields__])
+    return buffer.getvalue()
+
+def export_row_tuples(schema, rows, fmt: str):
+    """Serialize row tuples holding the schema's columns as one NDJSON or CSV chunk."""
+    if fmt == "ndjson":
+        return serialization.dump_ndjson_rows(schema, rows)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow(["" if value is None else value for value in row])
+    return buffer.getvalue()
+
+def export_csv_header(schema):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow(list(schema.__fields__))
+    return buffer.getvalue()
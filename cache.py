@@ -0,0 +1,174 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from fastapi.encoders import jsonable_encoder
+
+import schemas
+
+# Read-through cache for single-entity lookups (GET /books/{id}, /members/{id}).
+#
+# Entries are the serialized response bodies, so a hit skips both the query
+# and the ORM-to-schema conversion. Writes through crud.py invalidate the
+# affected key; the TTL bounds staleness for anything that bypasses crud.
+#
+# Configuration (env):
+#   CACHE_BACKEND      memory (default), redis or none
+#   CACHE_TTL          seconds an entry stays valid (default 30)
+#   CACHE_MAX_ENTRIES  per-entity LRU capacity for the memory backend (default 10000)
+#   REDIS_URL          used by the redis backend (requires the `redis` package)
+
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'memory')
+CACHE_TTL = float(os.getenv('CACHE_TTL', '30'))
+CACHE_MAX_ENTRIES = int(os.getenv('CACHE_MAX_ENTRIES', '10000'))
+REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
+
+class LRUBackend:
+    """In-process LRU with a per-entry TTL. Safe to share between threads."""
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl: float):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+class RedisBackend:
+    """Backend for any client speaking the redis-py get/set/delete API."""
+
+    def __init__(self, client):
+        self.client = client
+
+    def get(self, key):
+        raw = self.client.get(key)
+        return None if raw is None else json.loads(raw)
+
+    def set(self, key, value, ttl: float):
+        self.client.set(key, json.dumps(value), ex=max(1, int(ttl)))
+
+    def delete(self, key):
+        self.client.delete(key)
+
+    def clear(self):
+        pass
+
+    def __len__(self):
+        return 0
+
+class NullBackend:
+    def get(self, key):
+        return None
+
+    def set(self, key, value, ttl: float):
+        pass
+
+    def delete(self, key):
+        pass
+
+    def clear(self):
+        pass
+
+    def __len__(self):
+        return 0
+
+class EntityCache:
+    def __init__(self, name: str, schema, backend, ttl: float = CACHE_TTL):
+        self.name = name
+        self.schema = schema
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _key(self, entity_id):
+        return f"{self.name}:{entity_id}"
+
+    def get(self, entity_id):
+        """Return the cached body for `entity_id`, or None on a miss."""
+        value = self.backend.get(self._key(entity_id))
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    async def fetch(self, entity_id, loader):
+        """Return the cached body for `entity_id`, loading it on a miss.
+
+        `loader` is an awaitable factory returning the ORM object or None.
+        Misses for unknown ids are not cached.
+        """
+        value = self.get(entity_id)
+        if value is not None:
+            return value
+        return await self.load(entity_id, loader)
+
+    async def load(self, entity_id, loader):
+        """Load and cache the body for `entity_id` after a miss."""
+        obj = await loader()
+        if obj is None:
+            return None
+        value = jsonable_encoder(self.schema.from_orm(obj))
+        self.backend.set(self._key(entity_id), value, self.ttl)
+        return value
+
+    def invalidate(self, entity_id):
+        self.invalidations += 1
+        self.backend.delete(self._key(entity_id))
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "size": len(self.backend),
+        }
+
+def _make_backend():
+    if CACHE_BACKEND == 'none':
+        return NullBackend()
+    if CACHE_BACKEND == 'redis':
+        import redis
+        return RedisBackend(redis.Redis.from_url(REDIS_URL))
+    return LRUBackend()
+
+def configure(backend_factory):
+    """Swap the backend of every entity cache (used by tests)."""
+    for entity_cache in CACHES.values():
+        entity_cache.backend = backend_factory()
+
+books = EntityCache("book", schemas.Book, _make_backend())
+members = EntityCache("member", schemas.Member, _make_backend())
+
+CACHES = {"books": books, "members": members}
@@ -1,41 +1,152 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import or_
-from datetime import datetime, date
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy import and_, exists, func, insert, literal_column, or_, select, union_all, update
+from sqlalchemy.exc import IntegrityError
+from collections import Counter
+from contextlib import contextmanager
+from datetime import date, timedelta
 import logging
+import audit
+import cache
+import eligibility
 import models
 import schemas
+import stats
+from pagination import paginate
+import search as catalog_search
 
 logger = logging.getLogger(__name__)
 
+# Keys per IN (...) list in the batch lookups; keeps statements well under
+# max_allowed_packet and the bound-parameter limit of SQLite.
+LOOKUP_CHUNK_SIZE = 500
+
+def _lookup(db: Session, column, keys):
+    """Map each of `keys` to the row whose `column` equals it, or None.
+
+    One IN query per LOOKUP_CHUNK_SIZE distinct keys; the result keeps the
+    order of `keys` with duplicates removed.
+    """
+    keys = list(dict.fromkeys(keys))
+    found = {}
+    for start in range(0, len(keys), LOOKUP_CHUNK_SIZE):
+        chunk = keys[start:start + LOOKUP_CHUNK_SIZE]
+        for row in db.query(column.class_).filter(column.in_(chunk)):
+            found[_lookup_key(getattr(row, column.key))] = row
+    return {key: found.get(_lookup_key(key)) for key in keys}
+
+def _lookup_key(value):
+    # MySQL compares strings case-insensitively, so a row found for
+    # "Ann@Example.com" may store "ann@example.com".
+    return value.lower() if isinstance(value, str) else value
+
+# Writes
+#
+# Writes take as few round trips as the database allows. Duplicates are left
+# to the unique constraints instead of being looked up first; inserts are not
+# refreshed, since every column value is known once the row is flushed
+# (client-side defaults, see models.utcnow); updates go straight to the row by
+# primary key. Neither MySQL nor SQLite can UPDATE ... RETURNING here, so an
+# update reads its row back once, in the same transaction.
+
+@contextmanager
+def _duplicates_rejected(db: Session, duplicates: dict):
+    """Turn a unique violation on a column in `duplicates` into ValueError with its message."""
+    try:
+        yield
+    except IntegrityError as e:
+        db.rollback()
+        detail = str(e.orig).lower()
+        for column, message in duplicates.items():
+            if column in detail:
+                raise ValueError(message) from None
+        raise
+
+def _update_by_pk(db: Session, model, entity_id: int, values: dict, *criteria):
+    """UPDATE one row by primary key and return it as updated.
+
+    Returns None if no row matched the key and any extra `criteria`.
+    """
+    primary_key = model.__mapper__.primary_key[0]
+    result = db.execute(
+        update(model).where(primary_key == entity_id, *criteria).values(**values)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount == 0:
+        return None
+    return db.get(model, entity_id, populate_existing=True)
+
+MEMBER_DUPLICATES = {"email": "Email already registered"}
+BOOK_DUPLICATES = {"isbn": "Book with this ISBN already exists"}
+
 # Member CRUD operations
 def create_member(db: Session, member: schemas.MemberCreate):
-    # Check if email already exists
-    if db.query(models.Member).filter(models.Member.email == member.email).first():
-        raise ValueError("Email already registered")
-    
     db_member = models.Member(
         **member.dict(),
         membership_date=date.today(),
         membership_status='Active'
     )
     db.add(db_member)
-    db.commit()
-    db.refresh(db_member)
+    with _duplicates_rejected(db, MEMBER_DUPLICATES):
+        db.commit()
     return db_member
 
 def get_member(db: Session, member_id: int):
     return db.query(models.Member).filter(models.Member.member_id == member_id).first()
 
-def get_members(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.Member).offset(skip).limit(limit).all()
+def get_members(db: Session, skip: int = 0, limit: int = 100, cursor: str = None, sort_by: str = None, columns=None):
+    query = db.query(*columns) if columns else db.query(models.Member)
+    return paginate(query, models.Member, skip=skip, limit=limit, cursor=cursor, sort_by=sort_by).all()
+
+def get_member_dashboards(db: Session, member_ids):
+    """Members with their open loans and pending holds, each with its book.
+
+    Always three queries regardless of how many members or loans are involved:
+    members, loans joined to books, reservations joined to books.
+    """
+    members = db.query(models.Member).filter(models.Member.member_id.in_(member_ids)).options(
+        selectinload(models.Member.borrowing_records.and_(models.BorrowingRecord.return_date == None))
+        .joinedload(models.BorrowingRecord.book),
+        selectinload(models.Member.reservations.and_(models.Reservation.status == 'Pending'))
+        .joinedload(models.Reservation.book),
+    ).all()
+    by_id = {member.member_id: member for member in members}
+    return [
+        {
+            "member": member,
+            "open_loans": sorted(member.borrowing_records, key=lambda r: (r.due_date, r.record_id)),
+            "pending_reservations": sorted(member.reservations, key=lambda r: (r.reservation_date, r.reservation_id)),
+        }
+        for member in (by_id.get(member_id) for member_id in dict.fromkeys(member_ids))
+        if member is not None
+    ]
+
+def get_member_dashboard(db: Session, member_id: int):
+    dashboards = get_member_dashboards(db, [member_id])
+    return dashboards[0] if dashboards else None
+
+def get_member_eligibility(db: Session, member_id: int):
+    return eligibility.check(db, member_id)
+
+def lookup_members(db: Session, member_ids=(), emails=()):
+    by_id = _lookup(db, models.Member.member_id, member_ids)
+    by_email = _lookup(db, models.Member.email, emails)
+    return {
+        "by_id": by_id,
+        "by_email": by_email,
+        "missing": {
+            "member_ids": [key for key, row in by_id.items() if row is None],
+            "emails": [key for key, row in by_email.items() if row is None],
+        },
+    }
 
 def update_member(db: Session, member_id: int, member: schemas.MemberBase):
-    db_member = db.query(models.Member).filter(models.Member.member_id == member_id).first()
-    if db_member:
-        for key, value in member.dict(exclude_unset=True).items():
-            setattr(db_member, key, value)
+    with _duplicates_rejected(db, MEMBER_DUPLICATES):
+        db_member = _update_by_pk(db, models.Member, member_id, member.dict(exclude_unset=True))
+        if db_member is None:
+            db.rollback()
+            return None
         db.commit()
-        db.refresh(db_member)
+    cache.members.invalidate(member_id)
     return db_member
 
 def delete_member(db: Session, member_id: int):
@@ -43,129 +154,627 @@ def delete_member(db: Session, member_id: int):
     if db_member:
         db.delete(db_member)
         db.commit()
+        cache.members.invalidate(member_id)
         return True
     return False
 
 # Book CRUD operations
 def create_book(db: Session, book: schemas.BookCreate):
-    # Check if book with same ISBN already exists
-    if db.query(models.Book).filter(models.Book.isbn == book.isbn).first():
-        raise ValueError("Book with this ISBN already exists")
-    
     db_book = models.Book(**book.dict())
     db.add(db_book)
-    db.commit()
-    db.refresh(db_book)
+    stats.add_copies(db, db_book.category, db_book.total_copies)
+    with _duplicates_rejected(db, BOOK_DUPLICATES):
+        db.commit()
     return db_book
 
 def get_book(db: Session, book_id: int):
     return db.query(models.Book).filter(models.Book.book_id == book_id).first()
 
-def get_books(db: Session, skip: int = 0, limit: int = 100, search: str = None):
-    query = db.query(models.Book)
+def get_books(db: Session, skip: int = 0, limit: int = 100, search: str = None,
+              cursor: str = None, sort_by: str = None, columns=None):
+    # With `columns` the rows are plain tuples of those columns rather than
+    # Book objects (see serialization.py).
+    query = db.query(*columns) if columns else db.query(models.Book)
     if search:
-        search_term = f"%{search}%"
-        query = query.filter(
-            or_(
-                models.Book.title.ilike(search_term),
-                models.Book.author.ilike(search_term)
-            )
-        )
-    return query.offset(skip).limit(limit).all()
+        # Without an explicit sort or cursor, search results are ranked by
+        # relevance and paged with skip/limit.
+        ranked = not (cursor or sort_by)
+        query = catalog_search.filter_books(query, search, ranked=ranked)
+        if ranked:
+            return query.offset(skip).limit(limit).all()
+    return paginate(query, models.Book, skip=skip, limit=limit, cursor=cursor, sort_by=sort_by).all()
+
+def lookup_books(db: Session, book_ids=(), isbns=()):
+    by_id = _lookup(db, models.Book.book_id, book_ids)
+    by_isbn = _lookup(db, models.Book.isbn, isbns)
+    return {
+        "by_id": by_id,
+        "by_isbn": by_isbn,
+        "missing": {
+            "book_ids": [key for key, row in by_id.items() if row is None],
+            "isbns": [key for key, row in by_isbn.items() if row is None],
+        },
+    }
 
 def update_book(db: Session, book_id: int, book: schemas.BookBase):
-    db_book = db.query(models.Book).filter(models.Book.book_id == book_id).first()
-    if db_book:
-        for key, value in book.dict(exclude_unset=True).items():
-            setattr(db_book, key, value)
+    changes = book.dict(exclude_unset=True)
+    # Most edits leave the category and copy count alone, and then the
+    # statistics do not move: try the update on that assumption first.
+    unchanged = [getattr(models.Book, name) == changes[name] for name in ("category", "total_copies") if name in changes]
+    with _duplicates_rejected(db, BOOK_DUPLICATES):
+        db_book = _update_by_pk(db, models.Book, book_id, changes, *unchanged)
+        if db_book is None and unchanged:
+            before = db.query(models.Book.category, models.Book.total_copies).filter(
+                models.Book.book_id == book_id
+            ).with_for_update().first()
+            if before is not None:
+                db_book = _update_by_pk(db, models.Book, book_id, changes)
+                stats.add_copies(db, before.category, -before.total_copies)
+                stats.add_copies(db, db_book.category, db_book.total_copies)
+        if db_book is None:
+            db.rollback()
+            return None
         db.commit()
-        db.refresh(db_book)
+    cache.books.invalidate(book_id)
     return db_book
 
 def delete_book(db: Session, book_id: int):
     db_book = db.query(models.Book).filter(models.Book.book_id == book_id).first()
     if db_book:
         db.delete(db_book)
+        stats.add_copies(db, db_book.category, -db_book.total_copies)
+        db.commit()
+        cache.books.invalidate(book_id)
+        return True
+    return False
+
+# Staff CRUD operations
+STAFF_DUPLICATES = {"email": "Email already registered"}
+
+def create_staff(db: Session, staff: schemas.StaffCreate):
+    db_staff = models.Staff(**staff.dict())
+    db.add(db_staff)
+    with _duplicates_rejected(db, STAFF_DUPLICATES):
+        db.commit()
+    return db_staff
+
+def get_staff(db: Session, staff_id: int):
+    return db.query(models.Staff).filter(models.Staff.staff_id == staff_id).first()
+
+def get_staff_list(db: Session, skip: int = 0, limit: int = 100, cursor: str = None, sort_by: str = None, columns=None):
+    query = db.query(*columns) if columns else db.query(models.Staff)
+    return paginate(query, models.Staff, skip=skip, limit=limit, cursor=cursor, sort_by=sort_by).all()
+
+def update_staff(db: Session, staff_id: int, staff: schemas.StaffBase):
+    with _duplicates_rejected(db, STAFF_DUPLICATES):
+        db_staff = _update_by_pk(db, models.Staff, staff_id, staff.dict(exclude_unset=True))
+        if db_staff is None:
+            db.rollback()
+            return None
+        db.commit()
+    return db_staff
+
+def delete_staff(db: Session, staff_id: int):
+    # Loans they processed keep their history with staff_id set to NULL.
+    db_staff = get_staff(db, staff_id)
+    if db_staff:
+        db.delete(db_staff)
         db.commit()
         return True
     return False
 
 # Borrowing Record CRUD operations
+#
+# Checkout and return adjust books.available_copies with conditional UPDATEs in
+# the same transaction as the loan row, so concurrent desks can never lend more
+# copies than exist. The UPDATE itself takes the row lock; there is no
+# SELECT ... FOR UPDATE round trip. Every circulation path locks its books
+# before it writes any statistics row, so two desks never take the same locks
+# in opposite orders.
+def _take_copy(db: Session, book_id: int):
+    result = db.execute(
+        update(models.Book)
+        .where(models.Book.book_id == book_id, models.Book.available_copies > 0)
+        .values(available_copies=models.Book.available_copies - 1, updated_at=models.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
+
+# Loan period for copies handed straight to the next member in the hold queue.
+LOAN_PERIOD_DAYS = 14
+
+def _next_hold_query(db: Session, book_id: int, passed=()):
+    # Served by ix_reservations_book_id_status_queue: the head of
+    # the queue is a single index seek.
+    query = db.query(models.Reservation).filter(
+        models.Reservation.book_id == book_id,
+        models.Reservation.status == 'Pending'
+    )
+    if passed:
+        query = query.filter(models.Reservation.reservation_id.notin_(passed))
+    return query.order_by(models.Reservation.reservation_date, models.Reservation.reservation_id)
+
+def _fulfill_next_hold(db: Session, book_id: int, on_date: date, staff_id: int = None, lent: Counter = None):
+    """Lend a returned copy to the first member in the hold queue who may borrow.
+
+    Returns the new loan, or None if nobody eligible is waiting; the caller
+    counts it (see _hold_checkouts). Each hold member's standing is locked and
+    judged as on checkout (see eligibility.py); a member who may not borrow is
+    passed over, and the hold stays pending in its place for a later copy.
+    `lent` counts the loans made to each member earlier in the transaction,
+    which their counters do not show yet. Claiming the hold is a conditional
+    UPDATE, so two returns racing for the same hold cannot both win; the loser
+    moves on to the next one.
+    """
+    passed = []
+    while True:
+        hold = _next_hold_query(db, book_id, passed).first()
+        if hold is None:
+            return None
+        member = eligibility.standing(db, hold.member_id, lock=True)
+        reason = eligibility.refusal(member, 1 + (lent[hold.member_id] if lent else 0))
+        if reason:
+            logger.info(f"Hold {hold.reservation_id} on book {book_id} passed over: {reason}")
+            passed.append(hold.reservation_id)
+            continue
+        claimed = db.execute(
+            update(models.Reservation)
+            .where(models.Reservation.reservation_id == hold.reservation_id, models.Reservation.status == 'Pending')
+            .values(status='Fulfilled')
+            .execution_options(synchronize_session=False)
+        )
+        if claimed.rowcount == 1:
+            loan = models.BorrowingRecord(
+                book_id=book_id,
+                member_id=hold.member_id,
+                staff_id=staff_id,
+                borrow_date=on_date,
+                due_date=on_date + timedelta(days=LOAN_PERIOD_DAYS)
+            )
+            db.add(loan)
+            if lent is not None:
+                lent[hold.member_id] += 1
+            return loan
+
+def _hand_off_copy(db: Session, book_id: int, on_date: date, staff_id: int = None):
+    # Lock the book row first so a concurrent create_reservation cannot slip a
+    # hold in after the queue was found empty.
+    db.query(models.Book.book_id).filter(models.Book.book_id == book_id).with_for_update().first()
+    loan = _fulfill_next_hold(db, book_id, on_date, staff_id)
+    if loan is None:
+        _release_copy(db, book_id)
+    return loan
+
+def _hold_checkouts(*loans):
+    """stats.record_circulation checkouts for the loans made to holds (None where there was none)."""
+    return [(loan.borrow_date, loan.book_id, loan.member_id) for loan in loans if loan is not None]
+
+def _release_copy(db: Session, book_id: int):
+    db.execute(
+        update(models.Book)
+        .where(models.Book.book_id == book_id, models.Book.available_copies < models.Book.total_copies)
+        .values(available_copies=models.Book.available_copies + 1, updated_at=models.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+
 def create_borrowing_record(db: Session, borrowing: schemas.BorrowingRecordCreate):
-    # Check if book is available
-    book = get_book(db, borrowing.book_id)
-    if not book:
-        raise ValueError("Book not found")
-    
-    # Check if book is already borrowed
-    active_borrowing = db.query(models.BorrowingRecord).filter(
-        models.BorrowingRecord.book_id == borrowing.book_id,
-        models.BorrowingRecord.return_date == None
-    ).first()
-    
-    if active_borrowing:
-        raise ValueError("Book is already borrowed")
-    
+    # Locks the book row, then the member row, in the order returns do when
+    # they lend the copy to a hold (see _fulfill_next_hold).
+    if not _take_copy(db, borrowing.book_id):
+        db.rollback()
+        if eligibility.standing(db, borrowing.member_id) is None:
+            raise ValueError("Member not found")
+        if not get_book(db, borrowing.book_id):
+            raise ValueError("Book not found")
+        raise ValueError("Book is already borrowed: no copies available")
+    member = eligibility.standing(db, borrowing.member_id, lock=True)
+    if member is None:
+        db.rollback()
+        raise ValueError("Member not found")
+    reason = eligibility.refusal(member)
+    if reason:
+        db.rollback()
+        raise ValueError(reason)
+
     db_borrowing = models.BorrowingRecord(**borrowing.dict())
     db.add(db_borrowing)
+    stats.record_circulation(db, checkouts=[(borrowing.borrow_date, borrowing.book_id, borrowing.member_id)])
+    try:
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    cache.books.invalidate(borrowing.book_id)
+    audit.log.record("checkout", db_borrowing.record_id, borrowing.book_id, borrowing.member_id, borrowing.staff_id)
+    return db_borrowing
+
+def return_borrowing_record(db: Session, record_id: int, return_date: date = None, staff_id: int = None):
+    """Close an open loan and pass its copy on.
+
+    The copy goes to the oldest pending hold on the book, as a new loan in the
+    same transaction, or back on the shelf if nobody is waiting. `staff_id`
+    processed the return, and so also the loan to the hold. Returns the
+    record, or None if it does not exist. Raises ValueError if the loan was
+    already returned.
+    """
+    db_borrowing = get_borrowing_record(db, record_id)
+    if db_borrowing is None:
+        return None
+    return_date = return_date or date.today()
+    outstanding_fine = db_borrowing.fine_amount if db_borrowing.status == 'Overdue' else None
+    # The values are set explicitly so "evaluate" can apply them to the loaded
+    # record, which then needs no refresh.
+    result = db.execute(
+        update(models.BorrowingRecord)
+        .where(models.BorrowingRecord.record_id == record_id, models.BorrowingRecord.return_date == None)
+        .values(return_date=return_date, status='Returned', updated_at=models.utcnow())
+        .execution_options(synchronize_session="evaluate")
+    )
+    if result.rowcount != 1:
+        db.rollback()
+        raise ValueError("Borrowing record is already returned")
+    # The book row is locked before any statistics row, as on checkout.
+    handed_to = _hand_off_copy(db, db_borrowing.book_id, return_date, staff_id)
+    stats.record_circulation(
+        db, checkouts=_hold_checkouts(handed_to),
+        returns=[(return_date, db_borrowing.book_id, db_borrowing.member_id, outstanding_fine)]
+    )
     db.commit()
-    db.refresh(db_borrowing)
+    _record_return(db_borrowing, handed_to, staff_id)
+    if handed_to is not None:
+        logger.info(f"Book {db_borrowing.book_id} returned and lent to member {handed_to.member_id} from the hold queue")
+    cache.books.invalidate(db_borrowing.book_id)
     return db_borrowing
 
+def _record_return(loan, handed_to, staff_id):
+    audit.log.record("return", loan.record_id, loan.book_id, loan.member_id, staff_id)
+    if handed_to is not None:
+        audit.log.record("checkout", handed_to.record_id, handed_to.book_id, handed_to.member_id, staff_id)
+
+# Returned loans older than ARCHIVE_AFTER_DAYS live in borrowing_records_archive
+# (see archive.py). Reads of a single record and the history export look in
+# both tables; the list endpoint, dashboards and every write see only
+# borrowing_records, and archived records are read-only.
 def get_borrowing_record(db: Session, record_id: int):
-    return db.query(models.BorrowingRecord).filter(models.BorrowingRecord.record_id == record_id).first()
+    record = db.query(models.BorrowingRecord).filter(models.BorrowingRecord.record_id == record_id).first()
+    if record is None:
+        record = db.query(models.ArchivedBorrowingRecord).filter(
+            models.ArchivedBorrowingRecord.record_id == record_id
+        ).first()
+    return record
+
+def get_circulation_events(db: Session, record_id: int):
+    """Audit log entries for one loan, oldest first; events still queued in audit.log are not included."""
+    return db.query(models.CirculationEvent).filter(
+        models.CirculationEvent.record_id == record_id
+    ).order_by(models.CirculationEvent.event_id).all()
+
+def get_borrowing_records(db: Session, skip: int = 0, limit: int = 100, cursor: str = None, sort_by: str = None, columns=None):
+    query = db.query(*columns) if columns else db.query(models.BorrowingRecord)
+    return paginate(query, models.BorrowingRecord, skip=skip, limit=limit, cursor=cursor, sort_by=sort_by).all()
+
+def borrowing_history_query(columns, from_date: date = None, to_date: date = None, status: str = None):
+    """Borrowing records for export, archived ones included, in record_id order; dates filter borrow_date inclusively."""
+    def history(Loan):
+        query = select(*[getattr(Loan, column.key) for column in columns])
+        if from_date:
+            query = query.where(Loan.borrow_date >= from_date)
+        if to_date:
+            query = query.where(Loan.borrow_date <= to_date)
+        if status:
+            query = query.where(Loan.status == status)
+        return query
 
-def get_borrowing_records(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.BorrowingRecord).offset(skip).limit(limit).all()
+    return union_all(
+        history(models.BorrowingRecord), history(models.ArchivedBorrowingRecord)
+    ).order_by(literal_column("record_id"))
 
 def update_borrowing_record(db: Session, record_id: int, borrowing: schemas.BorrowingRecordBase):
     db_borrowing = db.query(models.BorrowingRecord).filter(models.BorrowingRecord.record_id == record_id).first()
     if db_borrowing:
+        was_open = db_borrowing.return_date is None
+        outstanding_fine = db_borrowing.fine_amount if db_borrowing.status == 'Overdue' else None
+        fined = (db_borrowing.status, db_borrowing.fine_amount)
         for key, value in borrowing.dict(exclude_unset=True).items():
             setattr(db_borrowing, key, value)
+        # Closing a loan through a plain update still passes its copy on.
+        returned = was_open and db_borrowing.return_date is not None
+        if returned:
+            handed_to = _hand_off_copy(db, db_borrowing.book_id, db_borrowing.return_date)
+            stats.record_circulation(
+                db, checkouts=_hold_checkouts(handed_to),
+                returns=[(db_borrowing.return_date, db_borrowing.book_id, db_borrowing.member_id, outstanding_fine)]
+            )
+        elif was_open and (db_borrowing.status, db_borrowing.fine_amount) != fined:
+            # Marked overdue, fined or waived by hand: the counters follow.
+            db.flush()
+            stats.record_fine_change(
+                db, db_borrowing.member_id, before=outstanding_fine,
+                after=db_borrowing.fine_amount if db_borrowing.status == 'Overdue' else None
+            )
         db.commit()
-        db.refresh(db_borrowing)
+        if returned:
+            # Nobody is recorded as processing a return made by editing the loan.
+            _record_return(db_borrowing, handed_to, None)
+            cache.books.invalidate(db_borrowing.book_id)
     return db_borrowing
 
+# Batched circulation: one desk transaction of several items.
+#
+# A batch costs a fixed number of statements however many items it holds: one
+# locking read of the rows involved, one set-based UPDATE, one executemany
+# INSERT for new loans, and for the statistics one upsert of the members'
+# counters and one executemany INSERT of deltas (see stats.py). Every item
+# gets an outcome. In "partial" mode the valid items are applied and the rest
+# rejected; in "all_or_nothing" mode one rejected item rolls the batch back.
+BATCH_PARTIAL = "partial"
+BATCH_ALL_OR_NOTHING = "all_or_nothing"
+
+def _batch_result(items, committed: bool):
+    if not committed:
+        for item in items:
+            if item["status"] == "pending":
+                item["status"] = "skipped"
+    return {"committed": committed, "items": items}
+
+def _reject(item, error: str):
+    item["status"] = "rejected"
+    item["error"] = error
+
+def _reject_repeats(items, key: str, error: str):
+    """Reject repeated keys after their first occurrence; returns the distinct keys."""
+    seen = []
+    for item in items:
+        if item[key] in seen:
+            _reject(item, error)
+        else:
+            seen.append(item[key])
+    return seen
+
+def batch_checkout(db: Session, checkout: schemas.BatchCheckout, mode: str = BATCH_PARTIAL):
+    """Lend several books to one member. Returns None if the member does not exist.
+
+    A member who may not borrow (see eligibility.py) has every item rejected;
+    items beyond the member's loan limit are rejected in list order. Raises
+    ValueError if availability changed under the batch, which the row locks
+    rule out on MySQL.
+    """
+    Book, Loan = models.Book, models.BorrowingRecord
+    borrow_date = checkout.borrow_date or date.today()
+    due_date = checkout.due_date or borrow_date + timedelta(days=LOAN_PERIOD_DAYS)
+    items = [{"book_id": book_id, "status": "pending"} for book_id in checkout.book_ids]
+    requested = _reject_repeats(items, "book_id", "Book listed more than once")
+
+    # Book rows before the member row, as in create_borrowing_record.
+    books = dict(
+        db.query(Book.book_id, Book.available_copies).filter(Book.book_id.in_(requested)).with_for_update()
+    )
+    member = eligibility.standing(db, checkout.member_id, lock=True)
+    if member is None:
+        db.rollback()
+        return None
+    for item in items:
+        if item["status"] != "pending":
+            continue
+        if item["book_id"] not in books:
+            _reject(item, "Book not found")
+        elif books[item["book_id"]] <= 0:
+            _reject(item, "Book is already borrowed: no copies available")
+    allowed = 0 if eligibility.refusal(member) else eligibility.loans_left(member)
+    over_limit = eligibility.refusal(member, allowed + 1)
+    for item in items:
+        if item["status"] != "pending":
+            continue
+        if allowed:
+            allowed -= 1
+        else:
+            _reject(item, over_limit)
+    lending = [item["book_id"] for item in items if item["status"] == "pending"]
+    rejected = len(lending) < len(items)
+    if not lending or (rejected and mode == BATCH_ALL_OR_NOTHING):
+        db.rollback()
+        return _batch_result(items, committed=False)
+
+    taken = db.execute(
+        update(Book)
+        .where(Book.book_id.in_(lending), Book.available_copies > 0)
+        .values(available_copies=Book.available_copies - 1, updated_at=models.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    if taken.rowcount != len(lending):
+        db.rollback()
+        raise ValueError("Availability changed during the checkout; retry")
+    db.execute(insert(Loan), [
+        {
+            "book_id": book_id,
+            "member_id": checkout.member_id,
+            "staff_id": checkout.staff_id,
+            "borrow_date": borrow_date,
+            "due_date": due_date,
+        }
+        for book_id in lending
+    ])
+    # No RETURNING on MySQL: the new loans are the member's newest open loans of
+    # these books, and the book row locks keep any other checkout of them out.
+    record_ids = dict(
+        db.query(Loan.book_id, func.max(Loan.record_id))
+        .filter(Loan.member_id == checkout.member_id, Loan.book_id.in_(lending), Loan.return_date == None)
+        .group_by(Loan.book_id)
+    )
+    stats.record_circulation(db, checkouts=[(borrow_date, book_id, checkout.member_id) for book_id in lending])
+    db.commit()
+
+    for item in items:
+        if item["status"] == "pending":
+            item.update(status="checked_out", record_id=record_ids[item["book_id"]], due_date=due_date)
+            cache.books.invalidate(item["book_id"])
+            audit.log.record("checkout", item["record_id"], item["book_id"], checkout.member_id, checkout.staff_id)
+    return _batch_result(items, committed=True)
+
+def batch_return(db: Session, batch: schemas.BatchReturn, mode: str = BATCH_PARTIAL):
+    """Close several loans, possibly of different members, and pass their copies on.
+
+    As return_borrowing_record, each copy goes to the head of its book's hold
+    queue or back on the shelf. Raises ValueError if a loan was returned by
+    someone else meanwhile, which the row locks rule out on MySQL.
+    """
+    Book, Loan = models.Book, models.BorrowingRecord
+    return_date = batch.return_date or date.today()
+    items = [{"record_id": record_id, "status": "pending"} for record_id in batch.record_ids]
+    requested = _reject_repeats(items, "record_id", "Borrowing record listed more than once")
+
+    # Locks the loans and their books, as _hand_off_copy does for one.
+    loans = {
+        loan.record_id: loan
+        for loan in db.query(Loan).join(Book, Book.book_id == Loan.book_id)
+        .filter(Loan.record_id.in_(requested)).with_for_update()
+    }
+    for item in items:
+        if item["status"] != "pending":
+            continue
+        if item["record_id"] not in loans:
+            _reject(item, "Borrowing record not found")
+            continue
+        loan = loans[item["record_id"]]
+        item["book_id"] = loan.book_id
+        if loan.return_date is not None:
+            _reject(item, "Borrowing record is already returned")
+    closing = [item["record_id"] for item in items if item["status"] == "pending"]
+    rejected = len(closing) < len(items)
+    if not closing or (rejected and mode == BATCH_ALL_OR_NOTHING):
+        db.rollback()
+        return _batch_result(items, committed=False)
+
+    returned = [
+        (loan, loan.fine_amount if loan.status == 'Overdue' else None)
+        for loan in (loans[record_id] for record_id in closing)
+    ]
+    closed = db.execute(
+        update(Loan)
+        .where(Loan.record_id.in_(closing), Loan.return_date == None)
+        .values(return_date=return_date, status='Returned', updated_at=models.utcnow())
+        .execution_options(synchronize_session="evaluate")
+    )
+    if closed.rowcount != len(closing):
+        db.rollback()
+        raise ValueError("A borrowing record was returned during the batch; retry")
+
+    copies = Counter(loan.book_id for loan, _ in returned)
+    held = {
+        book_id for (book_id,) in db.query(models.Reservation.book_id).filter(
+            models.Reservation.book_id.in_(list(copies)), models.Reservation.status == 'Pending'
+        ).distinct()
+    }
+    handed = {}
+    lent = Counter()
+    for loan, _ in returned:
+        if loan.book_id in held:
+            handed[loan.record_id] = _fulfill_next_hold(db, loan.book_id, return_date, batch.staff_id, lent)
+            if handed[loan.record_id] is not None:
+                copies[loan.book_id] -= 1
+    shelved = {}
+    for book_id, count in copies.items():
+        if count:
+            shelved.setdefault(count, []).append(book_id)
+    for count, book_ids in shelved.items():
+        db.execute(
+            update(Book)
+            .where(Book.book_id.in_(book_ids), Book.available_copies <= Book.total_copies - count)
+            .values(available_copies=Book.available_copies + count, updated_at=models.utcnow())
+            .execution_options(synchronize_session=False)
+        )
+    stats.record_circulation(
+        db, checkouts=_hold_checkouts(*handed.values()),
+        returns=[(return_date, loan.book_id, loan.member_id, fine) for loan, fine in returned]
+    )
+    db.commit()
+
+    for loan, _ in returned:
+        handed_to = handed.get(loan.record_id)
+        _record_return(loan, handed_to, batch.staff_id)
+        cache.books.invalidate(loan.book_id)
+    for item in items:
+        if item["status"] == "pending":
+            handed_to = handed.get(item["record_id"])
+            item.update(status="returned", held_for_member_id=handed_to.member_id if handed_to else None)
+    return _batch_result(items, committed=True)
+
 # Reservation CRUD operations
 def create_reservation(db: Session, reservation: schemas.ReservationCreate):
-    # Check if book exists
-    book = get_book(db, reservation.book_id)
-    if not book:
+    """Join the book's hold queue; holds are served in reservation_date order."""
+    # Check if book exists, locking its row so holds on one book are queued
+    # one at a time (see _hand_off_copy)
+    book_found = db.query(models.Book.book_id).filter(
+        models.Book.book_id == reservation.book_id
+    ).with_for_update().first()
+    if not book_found:
+        db.rollback()
         raise ValueError("Book not found")
-    
-    # Check if member exists
-    member = get_member(db, reservation.member_id)
-    if not member:
-        raise ValueError("Member not found")
-    
-    # Check if reservation already exists
-    existing_reservation = db.query(models.Reservation).filter(
+
+    # Check that the member exists and is not already queued for the book, in
+    # one query; there is no unique constraint to lean on, since only pending
+    # holds must be unique
+    already_queued = exists().where(and_(
         models.Reservation.book_id == reservation.book_id,
         models.Reservation.member_id == reservation.member_id,
-        models.Reservation.status == "pending"
+        models.Reservation.status == 'Pending'
+    ))
+    member = db.query(models.Member.member_id, already_queued).filter(
+        models.Member.member_id == reservation.member_id
     ).first()
-    
-    if existing_reservation:
+    if not member:
+        db.rollback()
+        raise ValueError("Member not found")
+    if member[1]:
+        db.rollback()
         raise ValueError("Reservation already exists")
-    
-    db_reservation = models.Reservation(**reservation.dict())
+
+    db_reservation = models.Reservation(**reservation.dict(exclude={"status"}), status='Pending')
     db.add(db_reservation)
     db.commit()
-    db.refresh(db_reservation)
     return db_reservation
 
+def get_queue_position(db: Session, reservation_id: int):
+    """1-based place of a pending hold in its book's queue, plus the queue length.
+
+    Returns None if the reservation does not exist; position is None once the
+    hold is no longer pending.
+    """
+    db_reservation = get_reservation(db, reservation_id)
+    if db_reservation is None:
+        return None
+    pending = db.query(func.count(models.Reservation.reservation_id)).filter(
+        models.Reservation.book_id == db_reservation.book_id,
+        models.Reservation.status == 'Pending'
+    )
+    position = None
+    if db_reservation.status == 'Pending':
+        position = pending.filter(or_(
+            models.Reservation.reservation_date < db_reservation.reservation_date,
+            and_(
+                models.Reservation.reservation_date == db_reservation.reservation_date,
+                models.Reservation.reservation_id <= db_reservation.reservation_id
+            )
+        )).scalar()
+    return {
+        "reservation_id": db_reservation.reservation_id,
+        "book_id": db_reservation.book_id,
+        "status": db_reservation.status,
+        "position": position,
+        "queue_length": pending.scalar(),
+    }
+
 def get_reservation(db: Session, reservation_id: int):
     return db.query(models.Reservation).filter(models.Reservation.reservation_id == reservation_id).first()
 
-def get_reservations(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.Reservation).offset(skip).limit(limit).all()
+def get_reservations(db: Session, skip: int = 0, limit: int = 100, cursor: str = None, sort_by: str = None, columns=None):
+    query = db.query(*columns) if columns else db.query(models.Reservation)
+    return paginate(query, models.Reservation, skip=skip, limit=limit, cursor=cursor, sort_by=sort_by).all()
 
 def update_reservation(db: Session, reservation_id: int, reservation: schemas.ReservationBase):
-    db_reservation = db.query(models.Reservation).filter(models.Reservation.reservation_id == reservation_id).first()
-    if db_reservation:
-        for key, value in reservation.dict(exclude_unset=True).items():
-            setattr(db_reservation, key, value)
-        db.commit()
-        db.refresh(db_reservation)
+    db_reservation = _update_by_pk(db, models.Reservation, reservation_id, reservation.dict(exclude_unset=True))
+    if db_reservation is None:
+        db.rollback()
+        return None
+    db.commit()
     return db_reservation 
\ No newline at end of file
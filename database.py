@@ -1,8 +1,15 @@
 from sqlalchemy import create_engine
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from dotenv import load_dotenv
+from starlette.requests import Request
+import asyncio
+import itertools
+import logging
 import os
+import time
 from urllib.parse import quote_plus
 
 # Load environment variables
@@ -15,30 +22,204 @@ DB_HOST = os.getenv('DB_HOST', 'localhost')
 DB_PORT = os.getenv('DB_PORT', '3306')
 DB_NAME = os.getenv('DB_NAME', 'library_management')
 
+# Connection pool settings shared by the sync and async engines
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '5'))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '10'))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '30'))  # seconds to wait for a free connection
+DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', '3600'))  # recycle connections after this many seconds
+
+# Read replicas: comma-separated host[:port] list, same credentials and schema
+# as the primary. Empty means every read goes to the primary.
+DB_REPLICA_HOSTS = [host.strip() for host in os.getenv('DB_REPLICA_HOSTS', '').split(',') if host.strip()]
+# How long a replica that failed its health check is skipped before it is tried again.
+DB_REPLICA_RETRY_SECONDS = float(os.getenv('DB_REPLICA_RETRY_SECONDS', '30'))
+# After a write, the same client reads from the primary for this long so it
+# sees its own changes despite replication lag.
+DB_READ_YOUR_WRITES_SECONDS = float(os.getenv('DB_READ_YOUR_WRITES_SECONDS', '5'))
+
+logger = logging.getLogger(__name__)
+
+def _database_url(driver: str, host: str = DB_HOST, port: str = DB_PORT):
+    return (
+        f"mysql+{driver}://{DB_USER}:{quote_plus(DB_PASSWORD)}@"
+        f"{host}:{port}/{DB_NAME}"
+        "?charset=utf8mb4"
+    )
+
 # Database connection URL with properly encoded password
-SQLALCHEMY_DATABASE_URL = (
-    f"mysql+pymysql://{DB_USER}:{quote_plus(DB_PASSWORD)}@"
-    f"{DB_HOST}:{DB_PORT}/{DB_NAME}"
-    "?charset=utf8mb4"
-)
-
-# Create SQLAlchemy engine with additional configuration
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL,
-    pool_pre_ping=True,  # Enable connection health checks
-    pool_recycle=3600,   # Recycle connections after 1 hour
-)
-
-# Create SessionLocal class
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+SQLALCHEMY_DATABASE_URL = _database_url("pymysql")
+ASYNC_SQLALCHEMY_DATABASE_URL = _database_url("aiomysql")
+
+# The async engine used by the API handlers holds a pooled connection per
+# in-flight request while it awaits the database instead of occupying a worker
+# thread, so its pool is sized well above the sync default of 5 + 10 overflow.
+DB_ASYNC_POOL_SIZE = int(os.getenv('DB_ASYNC_POOL_SIZE', '20'))
+DB_ASYNC_MAX_OVERFLOW = int(os.getenv('DB_ASYNC_MAX_OVERFLOW', '80'))
+
+# Connections each async engine (primary and replicas) opens at startup, so the
+# first requests a new worker serves do not pay for the handshake.
+DB_POOL_PREWARM = int(os.getenv('DB_POOL_PREWARM', '5'))
+
+# Session factories; init_engines() binds them.
+SessionLocal = sessionmaker(autocommit=False, autoflush=False)
+# expire_on_commit=False keeps committed objects readable while the response is
+# serialized, outside of any awaitable context.
+AsyncSessionLocal = sessionmaker(class_=AsyncSession, autocommit=False, autoflush=False, expire_on_commit=False)
+
+def _create_async_engine(url: str):
+    return create_async_engine(
+        url,
+        pool_pre_ping=True,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_size=DB_ASYNC_POOL_SIZE,
+        max_overflow=DB_ASYNC_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+    )
+
+class ReplicaRouter:
+    """Hands out connections for read-only requests.
+
+    Replicas are used round-robin. Checking out a connection pings it
+    (pool_pre_ping), so a replica that is down fails right there; it is then
+    skipped for `retry_seconds` and the next replica, or finally the primary,
+    serves the request.
+    """
+
+    def __init__(self, primary, replicas=(), retry_seconds: float = DB_REPLICA_RETRY_SECONDS):
+        self.primary = primary
+        self.replicas = list(replicas)
+        self.retry_seconds = retry_seconds
+        self._down_until = {}
+        self._next = itertools.count()
+
+    def _candidates(self):
+        if not self.replicas:
+            return []
+        start = next(self._next) % len(self.replicas)
+        now = time.monotonic()
+        ordered = self.replicas[start:] + self.replicas[:start]
+        return [replica for replica in ordered if self._down_until.get(replica, 0) <= now]
+
+    async def connect(self, use_primary: bool = False):
+        """Return (engine, connection) from a healthy replica or the primary."""
+        for replica in ([] if use_primary else self._candidates()):
+            try:
+                connection = await replica.connect()
+            except (DBAPIError, OSError) as e:
+                self._down_until[replica] = time.monotonic() + self.retry_seconds
+                logger.warning(f"Replica {replica.url.host or replica.url.database} unavailable, skipping it: {e}")
+                continue
+            self._down_until.pop(replica, None)
+            return replica, connection
+        return self.primary, await self.primary.connect()
+
+    def status(self):
+        now = time.monotonic()
+        return {
+            replica.url.render_as_string(hide_password=True): self._down_until.get(replica, 0) <= now
+            for replica in self.replicas
+        }
+
+    async def session(self, use_primary: bool = False):
+        _, connection = await self.connect(use_primary)
+        db = AsyncSession(bind=connection, autoflush=False, expire_on_commit=False)
+        try:
+            yield db
+        finally:
+            await db.close()
+            await connection.close()
+
+def _replica_engine(address: str):
+    host, _, port = address.partition(":")
+    return _create_async_engine(_database_url("aiomysql", host, port or DB_PORT))
+
+# Engines are created on first use rather than on import: building one loads the
+# driver, and a process that forks workers after importing the app (gunicorn
+# --preload) must not hand them a pool it has already opened. The app creates
+# them in its lifespan (main.py); scripts get them on first access.
+_ENGINE_ATTRIBUTES = ("engine", "async_engine", "read_router")
+
+def init_engines():
+    """Create the sync, async and replica engines and bind the session factories (once)."""
+    global engine, async_engine, read_router
+    if "read_router" in globals():
+        return
+    engine = create_engine(
+        SQLALCHEMY_DATABASE_URL,
+        pool_pre_ping=True,  # Enable connection health checks
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+    )
+    SessionLocal.configure(bind=engine)
+    async_engine = _create_async_engine(ASYNC_SQLALCHEMY_DATABASE_URL)
+    AsyncSessionLocal.configure(bind=async_engine)
+    read_router = ReplicaRouter(async_engine, [_replica_engine(address) for address in DB_REPLICA_HOSTS])
+
+def __getattr__(name):
+    if name in _ENGINE_ATTRIBUTES:
+        init_engines()
+        return globals()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+async def prewarm(pooled_engine, connections: int = DB_POOL_PREWARM):
+    """Open `connections` pooled connections at once and return them to the pool.
+
+    Returns how many were opened; a database that cannot be reached is logged
+    and left to fail the requests that need it.
+    """
+    if connections <= 0:
+        return 0
+    opened = await asyncio.gather(*(pooled_engine.connect() for _ in range(connections)), return_exceptions=True)
+    warmed = 0
+    for connection in opened:
+        if isinstance(connection, BaseException):
+            logger.warning(f"Could not prewarm a connection to {pooled_engine.url.host or pooled_engine.url.database}: {connection}")
+            continue
+        await connection.close()
+        warmed += 1
+    return warmed
+
+async def dispose_engines():
+    """Close every pooled connection; the engines are created again on next use."""
+    global engine, async_engine, read_router
+    if "read_router" not in globals():
+        return
+    for replica in read_router.replicas:
+        await replica.dispose()
+    await async_engine.dispose()
+    engine.dispose()
+    del engine, async_engine, read_router
 
 # Create Base class
 Base = declarative_base()
 
 # Dependency to get database session
 def get_db():
+    init_engines()
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close() 
\ No newline at end of file
+        db.close()
+
+# Async dependency used by the route handlers in main.py
+async def get_async_db():
+    init_engines()
+    async with AsyncSessionLocal() as db:
+        yield db
+
+# Cookie set after a write; while it is current, reads stay on the primary.
+READ_PRIMARY_COOKIE = "read_primary_until"
+
+# Dependency for the read-only GET handlers: replica when one is healthy,
+# primary for clients that have just written.
+async def get_read_db(request: Request):
+    try:
+        use_primary = float(request.cookies.get(READ_PRIMARY_COOKIE, 0)) > time.time()
+    except ValueError:
+        use_primary = False
+    init_engines()
+    async for db in read_router.session(use_primary):
+        yield db
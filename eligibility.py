@@ -0,0 +1,80 @@
+"""Checkout eligibility: may a member borrow more items?
+
+The rules read one row, the member joined to its stats_member_loans counters
+(open loans, open Overdue loans and their fines), which crud.py and the
+overdue sweep keep in the same transactions as the loans they count; checkout
+never aggregates the member's loan history. `python stats.py check` reports
+counters that drifted from the loans and `python stats.py rebuild` recomputes
+them.
+
+Configuration (env):
+  MAX_OPEN_LOANS          items a member may have on loan at once (default 10)
+  MAX_OUTSTANDING_FINES   fines on overdue loans above which checkout is
+                          refused (default 10.00)
+"""
+import os
+from decimal import Decimal
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+import models
+
+MAX_OPEN_LOANS = int(os.getenv('MAX_OPEN_LOANS', '10'))
+MAX_OUTSTANDING_FINES = Decimal(os.getenv('MAX_OUTSTANDING_FINES', '10.00'))
+
+def standing(db: Session, member_id: int, lock: bool = False):
+    """The member's status and loan counters, or None if there is no such member.
+
+    lock=True locks the member row until the transaction ends, so concurrent
+    checkouts for one member are judged one after the other.
+    """
+    Counters = models.MemberLoanStats
+    query = db.query(
+        models.Member.membership_status,
+        func.coalesce(Counters.open_loans, 0),
+        func.coalesce(Counters.overdue_loans, 0),
+        func.coalesce(Counters.outstanding_fines, 0),
+    ).outerjoin(Counters, Counters.member_id == models.Member.member_id).filter(
+        models.Member.member_id == member_id
+    )
+    if lock:
+        query = query.with_for_update(of=models.Member)
+    row = query.first()
+    if row is None:
+        return None
+    status, open_loans, overdue_loans, outstanding_fines = row
+    return {
+        "member_id": member_id,
+        "membership_status": status,
+        "open_loans": open_loans,
+        "overdue_loans": overdue_loans,
+        "outstanding_fines": Decimal(str(outstanding_fines)),
+    }
+
+def loans_left(member: dict):
+    return max(0, MAX_OPEN_LOANS - member["open_loans"])
+
+def refusal(member: dict, count: int = 1):
+    """Why the member may not borrow `count` more items, or None if they may."""
+    if member["membership_status"] == 'Suspended':
+        return "Membership is suspended"
+    if member["outstanding_fines"] > MAX_OUTSTANDING_FINES:
+        return f"Outstanding fines of {member['outstanding_fines']} exceed the limit of {MAX_OUTSTANDING_FINES}"
+    if count > loans_left(member):
+        return f"Loan limit of {MAX_OPEN_LOANS} items reached"
+    return None
+
+def check(db: Session, member_id: int):
+    """The member's standing with the limits and the verdict, or None if there is no such member."""
+    member = standing(db, member_id)
+    if member is None:
+        return None
+    reason = refusal(member)
+    return {
+        **member,
+        "max_open_loans": MAX_OPEN_LOANS,
+        "max_outstanding_fines": MAX_OUTSTANDING_FINES,
+        "eligible": reason is None,
+        "reason": reason,
+    }
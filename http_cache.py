@@ -0,0 +1,205 @@
+import hashlib
+import json
+import os
+import zlib
+
+from fastapi import Response
+from starlette.datastructures import Headers, MutableHeaders
+
+# HTTP caching for the catalog reads: validators, conditional requests,
+# Cache-Control policies and response compression.
+#
+# Single-entity routes (GET /books/{id}, /members/{id}) carry a weak ETag
+# hashed from the entity's JSON representation, so any change to the body
+# changes it, however close together two writes fall. They send no
+# Last-Modified: updated_at has one-second resolution, and two edits within a
+# second would leave it unchanged, so If-Modified-Since could answer 304 for a
+# stale copy. A conditional request on a cache miss selects only the schema's
+# columns, without loading an ORM object, and answers 304 from them; a cache
+# hit answers from the cached body without touching the database.
+#
+# List pages carry an ETag hashed from the encoded page, and no Last-Modified
+# either: the newest updated_at on a page cannot tell that a row was deleted
+# from it.
+#
+# Configuration (env):
+#   HTTP_CACHE_CONTROL     JSON object of route template -> Cache-Control value,
+#                          merged over CACHE_CONTROL below
+#   COMPRESSION_MIN_SIZE   smallest body compressed, in bytes (default 1024)
+#   GZIP_LEVEL             zlib level for gzip (default 6)
+#   BROTLI_QUALITY         quality for br (default 4); br is offered only when
+#                          the `brotli` package is installed
+
+CACHE_CONTROL = {
+    # Catalog data is public but availability changes with every checkout:
+    # clients keep it and revalidate, which costs a 304.
+    "/books/": "public, no-cache",
+    "/books/{book_id}": "public, no-cache",
+    "/members/": "private, no-cache",
+    "/members/{member_id}": "private, no-cache",
+    "/borrowing-records/": "private, no-cache",
+    "/reservations/": "private, no-cache",
+    "/stats/loans-per-day": "public, max-age=60",
+    "/stats/top-titles": "public, max-age=60",
+    "/stats/categories": "public, max-age=60",
+    "/stats/summary": "public, max-age=60",
+}
+CACHE_CONTROL.update(json.loads(os.getenv('HTTP_CACHE_CONTROL', '{}')))
+
+COMPRESSION_MIN_SIZE = int(os.getenv('COMPRESSION_MIN_SIZE', '1024'))
+GZIP_LEVEL = int(os.getenv('GZIP_LEVEL', '6'))
+BROTLI_QUALITY = int(os.getenv('BROTLI_QUALITY', '4'))
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Validators
+
+def entity_etag(body: dict):
+    """Weak ETag of one entity's JSON representation (the decoded response body)."""
+    canonical = json.dumps(body, sort_keys=True, separators=(",", ":"))
+    return 'W/"' + hashlib.blake2b(canonical.encode(), digest_size=8).hexdigest() + '"'
+
+def body_etag(body: bytes):
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+def is_conditional(headers):
+    return "if-none-match" in headers
+
+def _opaque(tag: str):
+    tag = tag.strip()
+    return tag[2:] if tag.startswith("W/") else tag
+
+def not_modified(headers, etag):
+    """True if the request's If-None-Match shows the client's copy is current (weak comparison)."""
+    if_none_match = headers.get("if-none-match")
+    if if_none_match is None:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return _opaque(etag) in {_opaque(tag) for tag in if_none_match.split(",")}
+
+def not_modified_response(etag, **extra_headers):
+    return Response(status_code=304, headers={"ETag": etag, **extra_headers})
+
+# Compression
+
+class _Gzip:
+    encoding = "gzip"
+
+    def __init__(self):
+        self._compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def flush(self):
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._compressor.flush()
+
+class _Brotli:
+    encoding = "br"
+
+    def __init__(self):
+        self._compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+
+    def compress(self, data):
+        return self._compressor.process(data)
+
+    def flush(self):
+        return self._compressor.flush()
+
+    def finish(self):
+        return self._compressor.finish()
+
+def _choose_encoder(accept_encoding: str):
+    accepted = set()
+    for part in accept_encoding.split(","):
+        coding, _, params = part.partition(";")
+        quality = params.strip().replace(" ", "")
+        try:
+            refused = quality.startswith("q=") and float(quality[2:]) == 0
+        except ValueError:
+            refused = False
+        if not refused:
+            accepted.add(coding.strip().lower())
+    if brotli is not None and "br" in accepted:
+        return _Brotli
+    if "gzip" in accepted:
+        return _Gzip
+    return None
+
+class CompressionMiddleware:
+    """Compress responses with br or gzip as the client allows.
+
+    Single-body responses below COMPRESSION_MIN_SIZE are sent as they are;
+    streamed responses (the exports) are compressed chunk by chunk, flushing
+    after each one so rows reach the client as they are produced. Strong
+    ETags are weakened because the encoded bytes differ from the identity
+    representation they were computed from.
+    """
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoder = _choose_encoder(Headers(scope=scope).get("accept-encoding", ""))
+        if encoder is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        compressor = None
+
+        async def compressing_send(message):
+            nonlocal start_message, compressor
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if start_message is not None:
+                headers = MutableHeaders(raw=start_message["headers"])
+                headers.add_vary_header("Accept-Encoding")
+                small = not more_body and len(body) < self.minimum_size
+                if small or "content-encoding" in headers or start_message["status"] in (204, 304):
+                    await send(start_message)
+                    start_message = None
+                    await send(message)
+                    return
+                compressor = encoder()
+                headers["Content-Encoding"] = compressor.encoding
+                etag = headers.get("etag")
+                if etag and not etag.startswith("W/"):
+                    headers["ETag"] = "W/" + etag
+                if "content-length" in headers:
+                    del headers["content-length"]
+                if not more_body:
+                    body = compressor.compress(body) + compressor.finish()
+                    headers["Content-Length"] = str(len(body))
+                    await send(start_message)
+                    await send({"type": "http.response.body", "body": body})
+                    return
+                await send(start_message)
+                start_message = None
+
+            if compressor is None:
+                await send(message)
+            elif more_body:
+                await send({"type": "http.response.body", "body": compressor.compress(body) + compressor.flush(), "more_body": True})
+            else:
+                await send({"type": "http.response.body", "body": compressor.compress(body) + compressor.finish()})
+
+        await self.app(scope, receive, compressing_send)
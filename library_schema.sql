@@ -2,8 +2,17 @@
 -- This schema includes tables for members, books, borrowing records, and reservations
 
 -- Drop existing tables if they exist
+DROP TABLE IF EXISTS stats_deltas;
+DROP TABLE IF EXISTS stats_totals;
+DROP TABLE IF EXISTS stats_member_loans;
+DROP TABLE IF EXISTS stats_categories;
+DROP TABLE IF EXISTS stats_book_loans;
+DROP TABLE IF EXISTS stats_daily_loans;
+DROP TABLE IF EXISTS circulation_audit_log;
+DROP TABLE IF EXISTS job_checkpoints;
 DROP TABLE IF EXISTS reservations;
 DROP TABLE IF EXISTS borrowing_records;
+DROP TABLE IF EXISTS borrowing_records_archive;
 DROP TABLE IF EXISTS books;
 DROP TABLE IF EXISTS members;
 DROP TABLE IF EXISTS staff;
@@ -50,7 +59,8 @@ CREATE TABLE books (
     CHECK (publication_year > 0),
     CHECK (total_copies >= 0),
     CHECK (available_copies >= 0),
-    CHECK (available_copies <= total_copies)
+    CHECK (available_copies <= total_copies),
+    FULLTEXT INDEX ft_books_search (title, author, publisher, category)
 );
 
 -- Create borrowing_records table
@@ -58,6 +68,7 @@ CREATE TABLE borrowing_records (
     record_id INT PRIMARY KEY AUTO_INCREMENT,
     book_id INT NOT NULL,
     member_id INT NOT NULL,
+    staff_id INT,
     borrow_date DATE NOT NULL,
     due_date DATE NOT NULL,
     return_date DATE,
@@ -67,8 +78,34 @@ CREATE TABLE borrowing_records (
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
     FOREIGN KEY (book_id) REFERENCES books(book_id) ON DELETE RESTRICT,
     FOREIGN KEY (member_id) REFERENCES members(member_id) ON DELETE RESTRICT,
+    CONSTRAINT fk_borrowing_records_staff_id FOREIGN KEY (staff_id) REFERENCES staff(staff_id) ON DELETE SET NULL,
     CHECK (borrow_date <= due_date),
-    CHECK (return_date IS NULL OR return_date >= borrow_date)
+    CHECK (return_date IS NULL OR return_date >= borrow_date),
+    INDEX ix_borrowing_records_status_due_date (status, due_date),
+    INDEX ix_borrowing_records_book_id_return_date (book_id, return_date),
+    INDEX ix_borrowing_records_member_id_return_date (member_id, return_date)
+);
+
+-- Create borrowing_records_archive table (returned loans moved out of
+-- borrowing_records by archive.py; same record_ids)
+CREATE TABLE borrowing_records_archive (
+    record_id INT PRIMARY KEY,
+    book_id INT NOT NULL,
+    member_id INT NOT NULL,
+    staff_id INT,
+    borrow_date DATE NOT NULL,
+    due_date DATE NOT NULL,
+    return_date DATE NOT NULL,
+    fine_amount DECIMAL(10,2) DEFAULT 0.00,
+    status ENUM('Borrowed', 'Returned', 'Overdue') NOT NULL DEFAULT 'Returned',
+    created_at TIMESTAMP NULL,
+    updated_at TIMESTAMP NULL,
+    archived_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (book_id) REFERENCES books(book_id) ON DELETE RESTRICT,
+    FOREIGN KEY (member_id) REFERENCES members(member_id) ON DELETE RESTRICT,
+    CONSTRAINT fk_borrowing_records_archive_staff_id FOREIGN KEY (staff_id) REFERENCES staff(staff_id) ON DELETE SET NULL,
+    INDEX ix_borrowing_records_archive_member_id (member_id),
+    INDEX ix_borrowing_records_archive_book_id (book_id)
 );
 
 -- Create reservations table
@@ -81,7 +118,80 @@ CREATE TABLE reservations (
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
     FOREIGN KEY (book_id) REFERENCES books(book_id) ON DELETE RESTRICT,
-    FOREIGN KEY (member_id) REFERENCES members(member_id) ON DELETE RESTRICT
+    FOREIGN KEY (member_id) REFERENCES members(member_id) ON DELETE RESTRICT,
+    INDEX ix_reservations_book_id_member_id_status (book_id, member_id, status),
+    INDEX ix_reservations_member_id_status (member_id, status),
+    INDEX ix_reservations_book_id_status_queue (book_id, status, reservation_date, reservation_id)
+);
+
+-- Create job_checkpoints table (progress of resumable batch jobs)
+CREATE TABLE job_checkpoints (
+    job_name VARCHAR(50) PRIMARY KEY,
+    as_of DATE NOT NULL,
+    last_due_date DATE,
+    last_record_id INT,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+);
+
+-- Create circulation_audit_log table (append-only, written in batches by audit.py)
+CREATE TABLE circulation_audit_log (
+    event_id INT PRIMARY KEY AUTO_INCREMENT,
+    event ENUM('checkout', 'return') NOT NULL,
+    record_id INT NOT NULL,
+    book_id INT NOT NULL,
+    member_id INT NOT NULL,
+    staff_id INT,
+    occurred_at TIMESTAMP NOT NULL,
+    INDEX ix_circulation_audit_log_record_id (record_id),
+    INDEX ix_circulation_audit_log_staff_id_occurred_at (staff_id, occurred_at)
+);
+
+-- Create statistics tables (aggregates maintained on checkout/return; see stats.py)
+CREATE TABLE stats_daily_loans (
+    stat_date DATE PRIMARY KEY,
+    checkouts INT NOT NULL DEFAULT 0,
+    returns INT NOT NULL DEFAULT 0
+);
+
+CREATE TABLE stats_book_loans (
+    book_id INT PRIMARY KEY,
+    checkouts INT NOT NULL DEFAULT 0,
+    open_loans INT NOT NULL DEFAULT 0,
+    FOREIGN KEY (book_id) REFERENCES books(book_id) ON DELETE CASCADE,
+    INDEX ix_stats_book_loans_checkouts (checkouts)
+);
+
+CREATE TABLE stats_categories (
+    category VARCHAR(50) PRIMARY KEY,
+    total_copies INT NOT NULL DEFAULT 0,
+    open_loans INT NOT NULL DEFAULT 0
+);
+
+CREATE TABLE stats_member_loans (
+    member_id INT PRIMARY KEY,
+    open_loans INT NOT NULL DEFAULT 0,
+    overdue_loans INT NOT NULL DEFAULT 0,
+    outstanding_fines DECIMAL(10,2) NOT NULL DEFAULT 0,
+    FOREIGN KEY (member_id) REFERENCES members(member_id) ON DELETE CASCADE
+);
+
+CREATE TABLE stats_totals (
+    name VARCHAR(50) PRIMARY KEY,
+    value DECIMAL(14, 2) NOT NULL DEFAULT 0
+);
+
+-- Append-only changes to the tables above, folded in by stats.py compact
+CREATE TABLE stats_deltas (
+    delta_id INT PRIMARY KEY AUTO_INCREMENT,
+    stat_date DATE,
+    book_id INT,
+    category VARCHAR(50),
+    checkouts INT NOT NULL DEFAULT 0,
+    returns INT NOT NULL DEFAULT 0,
+    open_loans INT NOT NULL DEFAULT 0,
+    total_copies INT NOT NULL DEFAULT 0,
+    active_members INT NOT NULL DEFAULT 0,
+    outstanding_fines DECIMAL(10,2) NOT NULL DEFAULT 0
 );
 
 -- Insert sample data for staff
@@ -98,9 +208,9 @@ INSERT INTO members (name, email, phone, address, membership_date, membership_st
 
 -- Insert sample data for books
 INSERT INTO books (title, author, isbn, publication_year, publisher, category, total_copies, available_copies, location) VALUES
-('The Great Gatsby', 'F. Scott Fitzgerald', '9780743273565', 1925, 'Scribner', 'Fiction', 3, 3, 'Fiction-A1'),
-('To Kill a Mockingbird', 'Harper Lee', '9780446310789', 1960, 'Grand Central', 'Fiction', 2, 2, 'Fiction-B2'),
-('1984', 'George Orwell', '9780451524935', 1949, 'Signet Classic', 'Fiction', 4, 4, 'Fiction-C3'),
+('The Great Gatsby', 'F. Scott Fitzgerald', '9780743273565', 1925, 'Scribner', 'Fiction', 3, 2, 'Fiction-A1'),
+('To Kill a Mockingbird', 'Harper Lee', '9780446310789', 1960, 'Grand Central', 'Fiction', 2, 1, 'Fiction-B2'),
+('1984', 'George Orwell', '9780451524935', 1949, 'Signet Classic', 'Fiction', 4, 3, 'Fiction-C3'),
 ('The Art of Programming', 'John Doe', '9781234567890', 2020, 'Tech Books', 'Computer Science', 2, 2, 'CS-A1'),
 ('Database Design', 'Jane Smith', '9780987654321', 2019, 'Data Press', 'Computer Science', 3, 3, 'CS-B2');
 
@@ -113,4 +223,26 @@ INSERT INTO borrowing_records (book_id, member_id, borrow_date, due_date, return
 -- Insert sample reservations
 INSERT INTO reservations (book_id, member_id, reservation_date, status) VALUES
 (4, 1, '2024-01-15', 'Pending'),
-(5, 2, '2024-01-16', 'Pending'); 
\ No newline at end of file
+(5, 2, '2024-01-16', 'Pending'); 
+
+-- Populate the statistics tables from the sample data (same as `python stats.py rebuild`)
+INSERT INTO stats_daily_loans (stat_date, checkouts, returns)
+SELECT borrow_date, COUNT(*), 0 FROM borrowing_records GROUP BY borrow_date;
+
+INSERT INTO stats_book_loans (book_id, checkouts, open_loans)
+SELECT book_id, COUNT(*), SUM(return_date IS NULL) FROM borrowing_records GROUP BY book_id;
+
+INSERT INTO stats_categories (category, total_copies, open_loans)
+SELECT b.category, SUM(b.total_copies),
+       (SELECT COUNT(*) FROM borrowing_records r JOIN books rb ON rb.book_id = r.book_id
+        WHERE rb.category = b.category AND r.return_date IS NULL)
+FROM books b GROUP BY b.category;
+
+INSERT INTO stats_member_loans (member_id, open_loans, overdue_loans, outstanding_fines)
+SELECT member_id, COUNT(*), SUM(status = 'Overdue'), SUM(CASE WHEN status = 'Overdue' THEN fine_amount ELSE 0 END)
+FROM borrowing_records WHERE return_date IS NULL GROUP BY member_id;
+
+INSERT INTO stats_totals (name, value) VALUES
+('open_loans', (SELECT COUNT(*) FROM borrowing_records WHERE return_date IS NULL)),
+('active_members', (SELECT COUNT(DISTINCT member_id) FROM borrowing_records WHERE return_date IS NULL)),
+('outstanding_fines', 0);
\ No newline at end of file
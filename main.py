@@ -1,21 +1,52 @@
-from fastapi import FastAPI, Depends, HTTPException, Query
-from fastapi.responses import JSONResponse
-from sqlalchemy.orm import Session
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.routing import Match
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
 from datetime import date
+import asyncio
 import logging
+import time
 
-import crud
+import async_crud
+import audit
+import cache
+import database
+import http_cache
+import metrics
 import models
 import schemas
-from database import engine, get_db
+import serialization
+import stats
+from database import get_async_db, get_read_db
+from pagination import next_cursor
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Create database tables
-models.Base.metadata.create_all(bind=engine)
+# The schema is managed by Alembic: run `alembic upgrade head` before starting
+# the app (see alembic.ini). Importing this module does not touch the database;
+# engines are created and prewarmed in the lifespan below. The import/export
+# routes import bulk.py when first called, keeping it off the startup path.
+
+# Cursor pagination: every list route accepts an opaque `cursor` and returns the
+# cursor for the following page in this header (absent on the last page).
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+# Keys accepted by one batch lookup request, IDs and ISBNs/emails together.
+MAX_LOOKUP_KEYS = 5000
+
+# POST routes that only read (the body carries the query); they do not pin
+# the client to the primary.
+READ_ONLY_POSTS = {"/books/lookup", "/members/lookup"}
+
+# Items accepted by one batch checkout or return.
+MAX_BATCH_ITEMS = 100
+
+# Rows fetched per query while streaming an export.
+EXPORT_CHUNK_SIZE = 1000
 
 app = FastAPI(
     title="Library Management System API",
@@ -23,150 +54,688 @@ app = FastAPI(
     version="1.0.0"
 )
 
+async def compact_stats_periodically():
+    # Folds the statistics deltas circulation appends (see stats.py). Every
+    # worker runs this; concurrent compactions wait for each other.
+    while True:
+        await asyncio.sleep(stats.STATS_COMPACT_SECONDS)
+        try:
+            async with database.AsyncSessionLocal() as db:
+                await async_crud.compact_stats(db)
+        except Exception:
+            logger.exception("Compacting statistics failed")
+
+async def lifespan(app: FastAPI):
+    # Engines and pools are per process: they are created here rather than on
+    # import, so workers forked from a preloaded app each open their own, and
+    # a worker has its connections open before it takes traffic.
+    started = time.perf_counter()
+    database.init_engines()
+    engines = [database.async_engine, *database.read_router.replicas]
+    for engine in engines:
+        metrics.instrument_engine(engine)
+    warmed = await asyncio.gather(*(database.prewarm(engine) for engine in engines))
+    await app.router.startup()
+    logger.info(f"Started in {(time.perf_counter() - started) * 1000:.0f} ms, {sum(warmed)} connections prewarmed")
+    compactor = asyncio.ensure_future(compact_stats_periodically()) if stats.STATS_COMPACT_SECONDS else None
+    yield
+    if compactor is not None:
+        compactor.cancel()
+    await app.router.shutdown()
+    # Write out circulation events still buffered in memory.
+    audit.log.close()
+    await database.dispose_engines()
+
+app.router.lifespan_context = lifespan
+
+def _route_template(request: Request):
+    # Label by path template so /books/1 and /books/2 share one series.
+    for route in request.app.router.routes:
+        match, _ = route.matches(request.scope)
+        if match == Match.FULL:
+            return route.path
+    return "unmatched"
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    stats = metrics.start_request()
+    started = time.perf_counter()
+    response = await call_next(request)
+    elapsed = time.perf_counter() - started
+    route = _route_template(request)
+    metrics.REQUEST_LATENCY.observe(elapsed, method=request.method, route=route, status=response.status_code)
+    metrics.REQUEST_QUERIES.observe(stats.queries, method=request.method, route=route)
+    metrics.REQUEST_DB_TIME.observe(stats.db_seconds, method=request.method, route=route)
+    if metrics.SERVER_TIMING:
+        response.headers["Server-Timing"] = stats.server_timing(elapsed)
+    return response
+
+@app.middleware("http")
+async def keep_readers_on_primary_after_writes(request: Request, call_next):
+    # Read-your-writes: replicas may lag, so a client that has just written
+    # reads from the primary for DB_READ_YOUR_WRITES_SECONDS.
+    response = await call_next(request)
+    writes = request.method not in ("GET", "HEAD") and request.url.path not in READ_ONLY_POSTS
+    if writes and response.status_code < 400 and database.read_router.replicas:
+        until = time.time() + database.DB_READ_YOUR_WRITES_SECONDS
+        response.set_cookie(
+            database.READ_PRIMARY_COOKIE, f"{until:.3f}",
+            max_age=int(database.DB_READ_YOUR_WRITES_SECONDS) + 1, httponly=True
+        )
+    return response
+
+@app.middleware("http")
+async def apply_cache_control(request: Request, call_next):
+    response = await call_next(request)
+    if request.method in ("GET", "HEAD") and response.status_code in (200, 304) and "cache-control" not in response.headers:
+        policy = http_cache.CACHE_CONTROL.get(_route_template(request))
+        if policy:
+            response.headers["Cache-Control"] = policy
+    return response
+
+# Outermost, so it sees the final headers and body.
+app.add_middleware(http_cache.CompressionMiddleware)
+
+def _set_next_cursor(response: Response, items, model, limit: int, sort_by: Optional[str]):
+    cursor = next_cursor(items, model, limit, sort_by)
+    if cursor:
+        response.headers[NEXT_CURSOR_HEADER] = cursor
+
+# List routes fetch only the schema's columns and encode the row tuples
+# directly; see serialization.py.
+LIST_COLUMNS = {
+    schema: serialization.schema_columns(model, schema)
+    for model, schema in (
+        (models.Member, schemas.Member),
+        (models.Book, schemas.Book),
+        (models.BorrowingRecord, schemas.BorrowingRecord),
+        (models.Reservation, schemas.Reservation),
+        (models.Staff, schemas.Staff),
+    )
+}
+
+def _list_response(request: Request, schema, rows, model, limit: int, sort_by: Optional[str], with_cursor: bool = True):
+    response = serialization.RowsResponse(schema, rows)
+    if with_cursor:
+        _set_next_cursor(response, rows, model, limit, sort_by)
+    etag = http_cache.body_etag(response.body)
+    if http_cache.not_modified(request.headers, etag):
+        cursor = response.headers.get(NEXT_CURSOR_HEADER)
+        return http_cache.not_modified_response(etag, **({NEXT_CURSOR_HEADER: cursor} if cursor else {}))
+    response.headers["ETag"] = etag
+    return response
+
+async def _read_entity(request: Request, db: AsyncSession, entity_cache, model, entity_id: int, load, not_found: str):
+    body = entity_cache.get(entity_id)
+    if body is None and http_cache.is_conditional(request.headers):
+        # Revalidation on a cache miss: one query of the schema's columns,
+        # without loading an ORM object.
+        schema = entity_cache.schema
+        row = await async_crud.get_columns(db, model, entity_id, schema.__fields__)
+        if row is None:
+            raise HTTPException(status_code=404, detail=not_found)
+        body = jsonable_encoder(schema(**dict(zip(schema.__fields__, row))))
+    if body is None:
+        body = await entity_cache.load(entity_id, load)
+        if body is None:
+            raise HTTPException(status_code=404, detail=not_found)
+    etag = http_cache.entity_etag(body)
+    if http_cache.not_modified(request.headers, etag):
+        return http_cache.not_modified_response(etag)
+    return JSONResponse(body, headers={"ETag": etag})
+
+async def _bulk_import(request: Request, target: str, fmt: Optional[str], batch_size: int, db: AsyncSession):
+    import bulk
+    if fmt is None:
+        fmt = "csv" if "csv" in request.headers.get("content-type", "") else "ndjson"
+    report = schemas.ImportReport()
+    batch = []
+
+    async def flush():
+        inserted, errors = await async_crud.insert_import_batch(db, target, batch)
+        report.inserted += inserted
+        report.errors.extend(errors)
+        batch.clear()
+
+    records = bulk.iter_records(bulk.iter_lines(request.stream()), fmt)
+    try:
+        async for row_number, record in records:
+            if isinstance(record, str):
+                report.errors.append(schemas.ImportRowError(row=row_number, error=record))
+                continue
+            row, error = bulk.validate_record(target, record)
+            if error:
+                report.errors.append(schemas.ImportRowError(row=row_number, error=error))
+                continue
+            batch.append((row_number, row))
+            if len(batch) >= batch_size:
+                await flush()
+    except ValueError as e:
+        # Undecodable upload; batches before it are already committed.
+        raise HTTPException(status_code=400, detail=f"{e}; {report.inserted} rows before it were imported")
+    if batch:
+        await flush()
+
+    report.errors.sort(key=lambda e: e.row)
+    logger.info(f"Imported {report.inserted} {target} with {len(report.errors)} rejected rows")
+    return report
+
+def _bulk_export(db: AsyncSession, model, schema, fetch, fmt: str, filename: str):
+    import bulk
+
+    async def body():
+        if fmt == "csv":
+            yield bulk.export_csv_header(schema)
+        cursor = None
+        while True:
+            items = await fetch(db, limit=EXPORT_CHUNK_SIZE, cursor=cursor)
+            if items:
+                yield bulk.export_rows(schema, items, fmt)
+            cursor = next_cursor(items, model, EXPORT_CHUNK_SIZE)
+            # Drop exported rows from the identity map so memory stays flat.
+            db.expunge_all()
+            if not cursor:
+                break
+
+    media_type = "text/csv" if fmt == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        body(),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{fmt}"'}
+    )
+
 # Member endpoints
 @app.post("/members/", response_model=schemas.Member)
-def create_member(member: schemas.MemberCreate, db: Session = Depends(get_db)):
+async def create_member(member: schemas.MemberCreate, db: AsyncSession = Depends(get_async_db)):
     try:
         logger.info(f"Creating new member: {member.email}")
-        return crud.create_member(db=db, member=member)
+        return await async_crud.create_member(db=db, member=member)
     except Exception as e:
         logger.error(f"Error creating member: {str(e)}")
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.get("/members/", response_model=List[schemas.Member])
-def read_members(
+async def read_members(
+    request: Request,
     skip: int = Query(0, ge=0, description="Number of records to skip"),
     limit: int = Query(100, ge=1, le=100, description="Number of records to return"),
-    db: Session = Depends(get_db)
+    cursor: Optional[str] = Query(None, description="Cursor from a previous page; overrides skip"),
+    sort_by: Optional[str] = Query(None, regex="^(name|membership_date)$", description="Sort key"),
+    db: AsyncSession = Depends(get_read_db)
 ):
     try:
-        logger.info(f"Fetching members with skip={skip} and limit={limit}")
-        members = crud.get_members(db, skip=skip, limit=limit)
-        return members
+        logger.info(f"Fetching members with skip={skip}, limit={limit}, cursor={cursor}, sort_by={sort_by}")
+        members = await async_crud.get_members(
+            db, skip=skip, limit=limit, cursor=cursor, sort_by=sort_by, columns=LIST_COLUMNS[schemas.Member]
+        )
+        return _list_response(request, schemas.Member, members, models.Member, limit, sort_by)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Error fetching members: {str(e)}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
-@app.get("/members/{member_id}", response_model=schemas.Member)
-def read_member(member_id: int, db: Session = Depends(get_db)):
-    db_member = crud.get_member(db, member_id=member_id)
-    if db_member is None:
+@app.post("/members/import", response_model=schemas.ImportReport)
+async def import_members(
+    request: Request,
+    format: Optional[str] = Query(None, regex="^(csv|ndjson)$", description="Upload format; defaults from Content-Type"),
+    batch_size: int = Query(500, ge=1, le=10000, description="Rows inserted per batch"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    return await _bulk_import(request, "members", format, batch_size, db)
+
+@app.get("/members/export")
+async def export_members(
+    format: str = Query("ndjson", regex="^(csv|ndjson)$"),
+    db: AsyncSession = Depends(get_read_db)
+):
+    return _bulk_export(db, models.Member, schemas.Member, async_crud.get_members, format, "members")
+
+@app.post("/members/lookup", response_model=schemas.MemberLookupResult)
+async def lookup_members(lookup: schemas.MemberLookup, db: AsyncSession = Depends(get_read_db)):
+    if len(lookup.member_ids) + len(lookup.emails) > MAX_LOOKUP_KEYS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_LOOKUP_KEYS} keys per request")
+    return await async_crud.lookup_members(db, member_ids=lookup.member_ids, emails=lookup.emails)
+
+@app.get("/members/dashboard", response_model=List[schemas.MemberDashboard])
+async def read_member_dashboards(
+    member_ids: List[int] = Query(..., description="Member IDs; unknown IDs are left out"),
+    db: AsyncSession = Depends(get_read_db)
+):
+    if len(member_ids) > 100:
+        raise HTTPException(status_code=400, detail="At most 100 member IDs per request")
+    return await async_crud.get_member_dashboards(db, member_ids=member_ids)
+
+@app.get("/members/{member_id}/dashboard", response_model=schemas.MemberDashboard)
+async def read_member_dashboard(member_id: int, db: AsyncSession = Depends(get_read_db)):
+    dashboard = await async_crud.get_member_dashboard(db, member_id=member_id)
+    if dashboard is None:
         raise HTTPException(status_code=404, detail="Member not found")
-    return db_member
+    return dashboard
+
+# Read from the primary, as checkout does: a lagging replica could answer
+# eligible for a member who has just reached a limit.
+@app.get("/members/{member_id}/eligibility", response_model=schemas.MemberEligibility)
+async def read_member_eligibility(member_id: int, db: AsyncSession = Depends(get_async_db)):
+    result = await async_crud.get_member_eligibility(db, member_id=member_id)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Member not found")
+    return result
+
+# Cached lookups fill from the primary: a lagging replica could re-cache a
+# row that a write has just invalidated.
+@app.get("/members/{member_id}", response_model=schemas.Member)
+async def read_member(member_id: int, request: Request, db: AsyncSession = Depends(get_async_db)):
+    return await _read_entity(
+        request, db, cache.members, models.Member, member_id,
+        lambda: async_crud.get_member(db, member_id=member_id), "Member not found"
+    )
 
 @app.put("/members/{member_id}", response_model=schemas.Member)
-def update_member(member_id: int, member: schemas.MemberBase, db: Session = Depends(get_db)):
-    db_member = crud.update_member(db, member_id=member_id, member=member)
+async def update_member(member_id: int, member: schemas.MemberBase, db: AsyncSession = Depends(get_async_db)):
+    try:
+        db_member = await async_crud.update_member(db, member_id=member_id, member=member)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     if db_member is None:
         raise HTTPException(status_code=404, detail="Member not found")
     return db_member
 
 @app.delete("/members/{member_id}")
-def delete_member(member_id: int, db: Session = Depends(get_db)):
-    success = crud.delete_member(db, member_id=member_id)
+async def delete_member(member_id: int, db: AsyncSession = Depends(get_async_db)):
+    success = await async_crud.delete_member(db, member_id=member_id)
     if not success:
         raise HTTPException(status_code=404, detail="Member not found")
     return {"message": "Member deleted successfully"}
 
 # Book endpoints
 @app.post("/books/", response_model=schemas.Book)
-def create_book(book: schemas.BookCreate, db: Session = Depends(get_db)):
+async def create_book(book: schemas.BookCreate, db: AsyncSession = Depends(get_async_db)):
     try:
         logger.info(f"Creating new book: {book.title}")
-        return crud.create_book(db=db, book=book)
+        return await async_crud.create_book(db=db, book=book)
     except Exception as e:
         logger.error(f"Error creating book: {str(e)}")
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.get("/books/", response_model=List[schemas.Book])
-def read_books(
+async def read_books(
+    request: Request,
     skip: int = Query(0, ge=0, description="Number of records to skip"),
     limit: int = Query(100, ge=1, le=100, description="Number of records to return"),
-    search: Optional[str] = Query(None, description="Search term for book title or author"),
-    db: Session = Depends(get_db)
+    search: Optional[str] = Query(None, description="Search terms matched against title, author, publisher and category; each term matches as a prefix"),
+    cursor: Optional[str] = Query(None, description="Cursor from a previous page; overrides skip"),
+    sort_by: Optional[str] = Query(None, regex="^(title|author|publication_year)$", description="Sort key"),
+    db: AsyncSession = Depends(get_read_db)
 ):
     try:
-        logger.info(f"Fetching books with skip={skip}, limit={limit}, search={search}")
-        books = crud.get_books(db, skip=skip, limit=limit, search=search)
-        return books
+        logger.info(f"Fetching books with skip={skip}, limit={limit}, search={search}, cursor={cursor}, sort_by={sort_by}")
+        books = await async_crud.get_books(
+            db, skip=skip, limit=limit, search=search, cursor=cursor, sort_by=sort_by,
+            columns=LIST_COLUMNS[schemas.Book]
+        )
+        # Relevance-ranked search pages are offset-only; pass sort_by to page a search by cursor.
+        return _list_response(
+            request, schemas.Book, books, models.Book, limit, sort_by, with_cursor=not search or cursor or sort_by
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Error fetching books: {str(e)}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
+@app.post("/books/import", response_model=schemas.ImportReport)
+async def import_books(
+    request: Request,
+    format: Optional[str] = Query(None, regex="^(csv|ndjson)$", description="Upload format; defaults from Content-Type"),
+    batch_size: int = Query(500, ge=1, le=10000, description="Rows inserted per batch"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    return await _bulk_import(request, "books", format, batch_size, db)
+
+@app.get("/books/export")
+async def export_books(
+    format: str = Query("ndjson", regex="^(csv|ndjson)$"),
+    db: AsyncSession = Depends(get_read_db)
+):
+    return _bulk_export(db, models.Book, schemas.Book, async_crud.get_books, format, "books")
+
+@app.post("/books/lookup", response_model=schemas.BookLookupResult)
+async def lookup_books(lookup: schemas.BookLookup, db: AsyncSession = Depends(get_read_db)):
+    if len(lookup.book_ids) + len(lookup.isbns) > MAX_LOOKUP_KEYS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_LOOKUP_KEYS} keys per request")
+    return await async_crud.lookup_books(db, book_ids=lookup.book_ids, isbns=lookup.isbns)
+
+# Cached lookups fill from the primary: a lagging replica could re-cache a
+# row that a write has just invalidated.
 @app.get("/books/{book_id}", response_model=schemas.Book)
-def read_book(book_id: int, db: Session = Depends(get_db)):
-    db_book = crud.get_book(db, book_id=book_id)
-    if db_book is None:
-        raise HTTPException(status_code=404, detail="Book not found")
-    return db_book
+async def read_book(book_id: int, request: Request, db: AsyncSession = Depends(get_async_db)):
+    return await _read_entity(
+        request, db, cache.books, models.Book, book_id,
+        lambda: async_crud.get_book(db, book_id=book_id), "Book not found"
+    )
 
 @app.put("/books/{book_id}", response_model=schemas.Book)
-def update_book(book_id: int, book: schemas.BookBase, db: Session = Depends(get_db)):
-    db_book = crud.update_book(db, book_id=book_id, book=book)
+async def update_book(book_id: int, book: schemas.BookBase, db: AsyncSession = Depends(get_async_db)):
+    try:
+        db_book = await async_crud.update_book(db, book_id=book_id, book=book)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     if db_book is None:
         raise HTTPException(status_code=404, detail="Book not found")
     return db_book
 
 @app.delete("/books/{book_id}")
-def delete_book(book_id: int, db: Session = Depends(get_db)):
-    success = crud.delete_book(db, book_id=book_id)
+async def delete_book(book_id: int, db: AsyncSession = Depends(get_async_db)):
+    success = await async_crud.delete_book(db, book_id=book_id)
     if not success:
         raise HTTPException(status_code=404, detail="Book not found")
     return {"message": "Book deleted successfully"}
 
+# Staff endpoints
+@app.post("/staff/", response_model=schemas.Staff)
+async def create_staff(staff: schemas.StaffCreate, db: AsyncSession = Depends(get_async_db)):
+    try:
+        logger.info(f"Creating new staff member: {staff.email}")
+        return await async_crud.create_staff(db=db, staff=staff)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/staff/", response_model=List[schemas.Staff])
+async def read_staff_list(
+    request: Request,
+    skip: int = Query(0, ge=0, description="Number of records to skip"),
+    limit: int = Query(100, ge=1, le=100, description="Number of records to return"),
+    cursor: Optional[str] = Query(None, description="Cursor from a previous page; overrides skip"),
+    sort_by: Optional[str] = Query(None, regex="^(name|hire_date)$", description="Sort key"),
+    db: AsyncSession = Depends(get_read_db)
+):
+    try:
+        staff = await async_crud.get_staff_list(
+            db, skip=skip, limit=limit, cursor=cursor, sort_by=sort_by, columns=LIST_COLUMNS[schemas.Staff]
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return _list_response(request, schemas.Staff, staff, models.Staff, limit, sort_by)
+
+@app.get("/staff/{staff_id}", response_model=schemas.Staff)
+async def read_staff(staff_id: int, db: AsyncSession = Depends(get_read_db)):
+    db_staff = await async_crud.get_staff(db, staff_id=staff_id)
+    if db_staff is None:
+        raise HTTPException(status_code=404, detail="Staff member not found")
+    return db_staff
+
+@app.put("/staff/{staff_id}", response_model=schemas.Staff)
+async def update_staff(staff_id: int, staff: schemas.StaffBase, db: AsyncSession = Depends(get_async_db)):
+    try:
+        db_staff = await async_crud.update_staff(db, staff_id=staff_id, staff=staff)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if db_staff is None:
+        raise HTTPException(status_code=404, detail="Staff member not found")
+    return db_staff
+
+@app.delete("/staff/{staff_id}")
+async def delete_staff(staff_id: int, db: AsyncSession = Depends(get_async_db)):
+    success = await async_crud.delete_staff(db, staff_id=staff_id)
+    if not success:
+        raise HTTPException(status_code=404, detail="Staff member not found")
+    return {"message": "Staff member deleted successfully"}
+
 # Borrowing Record endpoints
+async def _staff_known(db: AsyncSession, staff_id: Optional[int]):
+    # One primary-key lookup; None is a self-service loan or return.
+    if staff_id is not None and await async_crud.get_columns(db, models.Staff, staff_id, ("staff_id",)) is None:
+        raise HTTPException(status_code=400, detail="Staff member not found")
+
 @app.post("/borrowing-records/", response_model=schemas.BorrowingRecord)
-def create_borrowing_record(borrowing: schemas.BorrowingRecordCreate, db: Session = Depends(get_db)):
+async def create_borrowing_record(borrowing: schemas.BorrowingRecordCreate, db: AsyncSession = Depends(get_async_db)):
+    await _staff_known(db, borrowing.staff_id)
     try:
         logger.info(f"Creating new borrowing record for book_id={borrowing.book_id}")
-        return crud.create_borrowing_record(db=db, borrowing=borrowing)
+        return await async_crud.create_borrowing_record(db=db, borrowing=borrowing)
     except Exception as e:
         logger.error(f"Error creating borrowing record: {str(e)}")
         raise HTTPException(status_code=400, detail=str(e))
 
+# Batch circulation: several items in one transaction, with an outcome per
+# item. An all_or_nothing batch that was rolled back answers 409.
+BATCH_MODE_DESCRIPTION = "partial applies the items that can be; all_or_nothing applies none unless all can be"
+
+def _batch_items_allowed(count: int):
+    if not 0 < count <= MAX_BATCH_ITEMS:
+        raise HTTPException(status_code=400, detail=f"Between 1 and {MAX_BATCH_ITEMS} items per batch")
+
+def _batch_status(response: Response, result, mode: str):
+    if mode == "all_or_nothing" and not result["committed"]:
+        response.status_code = 409
+    return result
+
+@app.post("/borrowing-records/batch-checkout", response_model=schemas.BatchResult)
+async def batch_checkout(
+    checkout: schemas.BatchCheckout,
+    response: Response,
+    mode: str = Query("partial", regex="^(partial|all_or_nothing)$", description=BATCH_MODE_DESCRIPTION),
+    db: AsyncSession = Depends(get_async_db)
+):
+    _batch_items_allowed(len(checkout.book_ids))
+    await _staff_known(db, checkout.staff_id)
+    try:
+        result = await async_crud.batch_checkout(db, checkout, mode)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if result is None:
+        raise HTTPException(status_code=404, detail="Member not found")
+    return _batch_status(response, result, mode)
+
+@app.post("/borrowing-records/batch-return", response_model=schemas.BatchResult)
+async def batch_return(
+    batch: schemas.BatchReturn,
+    response: Response,
+    mode: str = Query("partial", regex="^(partial|all_or_nothing)$", description=BATCH_MODE_DESCRIPTION),
+    db: AsyncSession = Depends(get_async_db)
+):
+    _batch_items_allowed(len(batch.record_ids))
+    await _staff_known(db, batch.staff_id)
+    try:
+        result = await async_crud.batch_return(db, batch, mode)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return _batch_status(response, result, mode)
+
 @app.get("/borrowing-records/", response_model=List[schemas.BorrowingRecord])
-def read_borrowing_records(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    records = crud.get_borrowing_records(db, skip=skip, limit=limit)
-    return records
+async def read_borrowing_records(
+    request: Request,
+    skip: int = Query(0, ge=0, description="Number of records to skip"),
+    limit: int = Query(100, ge=1, le=100, description="Number of records to return"),
+    cursor: Optional[str] = Query(None, description="Cursor from a previous page; overrides skip"),
+    sort_by: Optional[str] = Query(None, regex="^(borrow_date|due_date)$", description="Sort key"),
+    db: AsyncSession = Depends(get_read_db)
+):
+    try:
+        records = await async_crud.get_borrowing_records(
+            db, skip=skip, limit=limit, cursor=cursor, sort_by=sort_by, columns=LIST_COLUMNS[schemas.BorrowingRecord]
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return _list_response(request, schemas.BorrowingRecord, records, models.BorrowingRecord, limit, sort_by)
+
+@app.get("/borrowing-records/export")
+async def export_borrowing_records(
+    format: str = Query("ndjson", regex="^(csv|ndjson)$"),
+    from_date: Optional[date] = Query(None, description="Earliest borrow_date, inclusive"),
+    to_date: Optional[date] = Query(None, description="Latest borrow_date, inclusive"),
+    status: Optional[str] = Query(None, regex="^(Borrowed|Returned|Overdue)$"),
+    db: AsyncSession = Depends(get_read_db)
+):
+    import bulk
+
+    # One query over a server-side cursor; only EXPORT_CHUNK_SIZE rows are held
+    # in memory at a time, however large the history is.
+    schema = schemas.BorrowingRecord
+    rows = async_crud.stream_borrowing_history(
+        db, LIST_COLUMNS[schema], from_date=from_date, to_date=to_date, status=status,
+        chunk_size=EXPORT_CHUNK_SIZE
+    )
+
+    async def body():
+        if format == "csv":
+            yield bulk.export_csv_header(schema)
+        async for chunk in rows:
+            yield bulk.export_row_tuples(schema, chunk, format)
+
+    return StreamingResponse(
+        body(),
+        media_type="text/csv" if format == "csv" else "application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="borrowing-records.{format}"'}
+    )
 
 @app.get("/borrowing-records/{record_id}", response_model=schemas.BorrowingRecord)
-def read_borrowing_record(record_id: int, db: Session = Depends(get_db)):
-    db_record = crud.get_borrowing_record(db, record_id=record_id)
+async def read_borrowing_record(record_id: int, db: AsyncSession = Depends(get_read_db)):
+    db_record = await async_crud.get_borrowing_record(db, record_id=record_id)
     if db_record is None:
         raise HTTPException(status_code=404, detail="Borrowing record not found")
     return db_record
 
+@app.get("/borrowing-records/{record_id}/audit", response_model=List[schemas.CirculationEvent])
+async def read_circulation_events(record_id: int, db: AsyncSession = Depends(get_read_db)):
+    # Written in the background; the newest events can take up to
+    # AUDIT_FLUSH_SECONDS to appear.
+    return await async_crud.get_circulation_events(db, record_id=record_id)
+
 @app.put("/borrowing-records/{record_id}", response_model=schemas.BorrowingRecord)
-def update_borrowing_record(record_id: int, borrowing: schemas.BorrowingRecordBase, db: Session = Depends(get_db)):
-    db_record = crud.update_borrowing_record(db, record_id=record_id, borrowing=borrowing)
+async def update_borrowing_record(record_id: int, borrowing: schemas.BorrowingRecordBase, db: AsyncSession = Depends(get_async_db)):
+    await _staff_known(db, borrowing.staff_id)
+    db_record = await async_crud.update_borrowing_record(db, record_id=record_id, borrowing=borrowing)
+    if db_record is None:
+        raise HTTPException(status_code=404, detail="Borrowing record not found")
+    return db_record
+
+@app.post("/borrowing-records/{record_id}/return", response_model=schemas.BorrowingRecord)
+async def return_borrowing_record(
+    record_id: int,
+    return_date: Optional[date] = Query(None, description="Defaults to today"),
+    staff_id: Optional[int] = Query(None, description="Staff member processing the return; omit for self-service"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    await _staff_known(db, staff_id)
+    try:
+        db_record = await async_crud.return_borrowing_record(
+            db, record_id=record_id, return_date=return_date, staff_id=staff_id
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     if db_record is None:
         raise HTTPException(status_code=404, detail="Borrowing record not found")
     return db_record
 
 # Reservation endpoints
 @app.post("/reservations/", response_model=schemas.Reservation)
-def create_reservation(reservation: schemas.ReservationCreate, db: Session = Depends(get_db)):
-    return crud.create_reservation(db=db, reservation=reservation)
+async def create_reservation(reservation: schemas.ReservationCreate, db: AsyncSession = Depends(get_async_db)):
+    try:
+        return await async_crud.create_reservation(db=db, reservation=reservation)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 @app.get("/reservations/", response_model=List[schemas.Reservation])
-def read_reservations(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    reservations = crud.get_reservations(db, skip=skip, limit=limit)
-    return reservations
+async def read_reservations(
+    request: Request,
+    skip: int = Query(0, ge=0, description="Number of records to skip"),
+    limit: int = Query(100, ge=1, le=100, description="Number of records to return"),
+    cursor: Optional[str] = Query(None, description="Cursor from a previous page; overrides skip"),
+    sort_by: Optional[str] = Query(None, regex="^reservation_date$", description="Sort key"),
+    db: AsyncSession = Depends(get_read_db)
+):
+    try:
+        reservations = await async_crud.get_reservations(
+            db, skip=skip, limit=limit, cursor=cursor, sort_by=sort_by, columns=LIST_COLUMNS[schemas.Reservation]
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return _list_response(request, schemas.Reservation, reservations, models.Reservation, limit, sort_by)
+
+@app.get("/reservations/{reservation_id}/position", response_model=schemas.QueuePosition)
+async def read_queue_position(reservation_id: int, db: AsyncSession = Depends(get_async_db)):
+    position = await async_crud.get_queue_position(db, reservation_id=reservation_id)
+    if position is None:
+        raise HTTPException(status_code=404, detail="Reservation not found")
+    return position
 
 @app.get("/reservations/{reservation_id}", response_model=schemas.Reservation)
-def read_reservation(reservation_id: int, db: Session = Depends(get_db)):
-    db_reservation = crud.get_reservation(db, reservation_id=reservation_id)
+async def read_reservation(reservation_id: int, db: AsyncSession = Depends(get_read_db)):
+    db_reservation = await async_crud.get_reservation(db, reservation_id=reservation_id)
     if db_reservation is None:
         raise HTTPException(status_code=404, detail="Reservation not found")
     return db_reservation
 
 @app.put("/reservations/{reservation_id}", response_model=schemas.Reservation)
-def update_reservation(reservation_id: int, reservation: schemas.ReservationBase, db: Session = Depends(get_db)):
-    db_reservation = crud.update_reservation(db, reservation_id=reservation_id, reservation=reservation)
+async def update_reservation(reservation_id: int, reservation: schemas.ReservationBase, db: AsyncSession = Depends(get_async_db)):
+    db_reservation = await async_crud.update_reservation(db, reservation_id=reservation_id, reservation=reservation)
     if db_reservation is None:
         raise HTTPException(status_code=404, detail="Reservation not found")
     return db_reservation
 
+# Admin endpoints
+@app.post("/admin/overdue-sweep", response_model=schemas.OverdueSweepReport)
+async def run_overdue_sweep(
+    as_of: Optional[date] = Query(None, description="Date fines are computed for; defaults to today"),
+    chunk_size: int = Query(5000, ge=1, le=100000, description="Loans updated per transaction"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    logger.info(f"Running overdue sweep as_of={as_of}, chunk_size={chunk_size}")
+    return await async_crud.run_overdue_sweep(db, as_of=as_of, chunk_size=chunk_size)
+
+@app.post("/admin/archive", response_model=schemas.ArchiveReport)
+async def run_archive(
+    before: Optional[date] = Query(None, description="Archive loans returned before this date; defaults to ARCHIVE_AFTER_DAYS ago"),
+    chunk_size: int = Query(5000, ge=1, le=100000, description="Loans moved per transaction"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    logger.info(f"Archiving returned loans before={before}, chunk_size={chunk_size}")
+    return await async_crud.run_archive(db, before=before, chunk_size=chunk_size)
+
+@app.post("/admin/stats/compact", response_model=schemas.StatsCompactionReport)
+async def compact_stats(db: AsyncSession = Depends(get_async_db)):
+    return await async_crud.compact_stats(db)
+
+# Statistics endpoints: each reads a few rows of the aggregate tables kept by
+# stats.py, never borrowing_records itself; they trail circulation by up to
+# STATS_COMPACT_SECONDS.
+@app.get("/stats/loans-per-day", response_model=List[schemas.DailyLoans])
+async def read_loans_per_day(
+    from_date: date = Query(..., description="First day, inclusive"),
+    to_date: date = Query(..., description="Last day, inclusive"),
+    db: AsyncSession = Depends(get_read_db)
+):
+    if (to_date - from_date).days > 366:
+        raise HTTPException(status_code=400, detail="At most 366 days per request")
+    return await async_crud.get_loans_per_day(db, from_date=from_date, to_date=to_date)
+
+@app.get("/stats/top-titles", response_model=List[schemas.TopTitle])
+async def read_top_titles(
+    limit: int = Query(10, ge=1, le=100),
+    db: AsyncSession = Depends(get_read_db)
+):
+    return await async_crud.get_top_titles(db, limit=limit)
+
+@app.get("/stats/categories", response_model=List[schemas.CategoryUtilization])
+async def read_category_utilization(db: AsyncSession = Depends(get_read_db)):
+    return await async_crud.get_category_utilization(db)
+
+@app.get("/stats/summary", response_model=schemas.LibrarySummary)
+async def read_stats_summary(db: AsyncSession = Depends(get_read_db)):
+    return await async_crud.get_stats_summary(db)
+
+# Cache endpoints
+@app.get("/cache/stats")
+async def read_cache_stats():
+    return {name: entity_cache.stats() for name, entity_cache in cache.CACHES.items()}
+
+# Metrics endpoint
+@app.get("/metrics", response_class=PlainTextResponse)
+async def read_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 # Error handlers
 @app.exception_handler(Exception)
 async def global_exception_handler(request, exc):
@@ -0,0 +1,222 @@
+import logging
+import os
+import threading
+import time
+from contextvars import ContextVar
+
+from sqlalchemy import event
+
+import audit
+import cache
+
+# Request and SQL instrumentation, exposed in the Prometheus text format on
+# GET /metrics.
+#
+# main.py's middleware opens a RequestStats for each request; the cursor
+# listeners installed by instrument_engine() add every statement's duration to
+# it, and the pool wrapper adds the time spent waiting for a connection.
+#
+# Configuration (env):
+#   SLOW_QUERY_SECONDS  statements slower than this are logged at WARNING (default 0.5)
+#   SERVER_TIMING       1 to add a Server-Timing header to every response (default off)
+
+SLOW_QUERY_SECONDS = float(os.getenv('SLOW_QUERY_SECONDS', '0.5'))
+SERVER_TIMING = os.getenv('SERVER_TIMING', '0') == '1'
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+logger = logging.getLogger(__name__)
+
+class Counter:
+    def __init__(self, name: str, help: str, labels=()):
+        self.name, self.help, self.labels = name, help, labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(labels.get(label, "") for label in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            yield f"{self.name}{_labels(self.labels, key)} {_number(value)}"
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels=(), buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.labels, self.buckets = name, help, labels, buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels.get(label, "") for label in self.labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def count(self, **labels):
+        key = tuple(labels.get(label, "") for label in self.labels)
+        with self._lock:
+            series = self._series.get(key)
+            return series[2] if series else 0
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            series = sorted((key, ([*b], s, c)) for key, (b, s, c) in self._series.items())
+        for key, (bucket_counts, total, count) in series:
+            for bound, bucket_count in zip(self.buckets, bucket_counts):
+                le = _labels(self.labels + ("le",), key + (_number(bound),))
+                yield f"{self.name}_bucket{le} {bucket_count}"
+            yield f"{self.name}_bucket{_labels(self.labels + ('le',), key + ('+Inf',))} {count}"
+            yield f"{self.name}_sum{_labels(self.labels, key)} {_number(total)}"
+            yield f"{self.name}_count{_labels(self.labels, key)} {count}"
+
+def _labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "Request latency by route.", labels=("method", "route", "status")
+)
+REQUEST_QUERIES = Histogram(
+    "http_request_db_queries", "SQL statements executed per request.",
+    labels=("method", "route"), buckets=QUERY_COUNT_BUCKETS
+)
+REQUEST_DB_TIME = Histogram(
+    "http_request_db_duration_seconds", "Time spent in SQL statements per request.", labels=("method", "route")
+)
+QUERY_LATENCY = Histogram("db_query_duration_seconds", "Latency of individual SQL statements.")
+POOL_WAIT = Histogram("db_pool_checkout_wait_seconds", "Time spent waiting for a pooled connection.")
+SLOW_QUERIES = Counter("db_slow_queries_total", "SQL statements slower than SLOW_QUERY_SECONDS.")
+
+METRICS = [REQUEST_LATENCY, REQUEST_QUERIES, REQUEST_DB_TIME, QUERY_LATENCY, POOL_WAIT, SLOW_QUERIES]
+
+class RequestStats:
+    __slots__ = ("queries", "db_seconds", "pool_wait_seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.pool_wait_seconds = 0.0
+
+    def server_timing(self, total_seconds: float):
+        return (
+            f'db;dur={self.db_seconds * 1000:.1f};desc="{self.queries} queries", '
+            f'pool;dur={self.pool_wait_seconds * 1000:.1f}, '
+            f'app;dur={total_seconds * 1000:.1f}'
+        )
+
+_current = ContextVar("request_stats", default=None)
+
+def start_request():
+    """Begin collecting SQL stats for the current request (or task)."""
+    stats = RequestStats()
+    _current.set(stats)
+    return stats
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_started"].pop()
+    QUERY_LATENCY.observe(elapsed)
+    stats = _current.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_seconds += elapsed
+    if elapsed >= SLOW_QUERY_SECONDS:
+        SLOW_QUERIES.inc()
+        logger.warning(f"Slow query ({elapsed:.3f}s): {statement} {parameters!r}")
+
+def _handle_error(exception_context):
+    started = exception_context.connection.info.get("query_started") if exception_context.connection else None
+    if started:
+        started.pop()
+
+_timed_pool_classes = {}
+
+def _timed_pool_class(pool_class):
+    # The pool is re-created from its class on engine.dispose(), so timing is
+    # added by subclassing rather than by wrapping the instance.
+    if pool_class not in _timed_pool_classes:
+        def _do_get(self):
+            started = time.perf_counter()
+            try:
+                return super(timed, self)._do_get()
+            finally:
+                waited = time.perf_counter() - started
+                POOL_WAIT.observe(waited)
+                stats = _current.get()
+                if stats is not None:
+                    stats.pool_wait_seconds += waited
+        timed = type(f"Timed{pool_class.__name__}", (pool_class,), {"_do_get": _do_get})
+        _timed_pool_classes[pool_class] = timed
+    return _timed_pool_classes[pool_class]
+
+def instrument_engine(engine):
+    """Time every statement and pool checkout on a sync or async engine."""
+    sync_engine = getattr(engine, "sync_engine", engine)
+    if event.contains(sync_engine, "before_cursor_execute", _before_cursor_execute):
+        return
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(sync_engine, "handle_error", _handle_error)
+    sync_engine.pool.__class__ = _timed_pool_class(type(sync_engine.pool))
+
+def _render_caches():
+    stats = {name: entity_cache.stats() for name, entity_cache in cache.CACHES.items()}
+    for field, kind, help in (
+        ("hits", "counter", "Read-through cache hits."),
+        ("misses", "counter", "Read-through cache misses."),
+        ("invalidations", "counter", "Read-through cache invalidations."),
+        ("size", "gauge", "Entries currently cached."),
+    ):
+        name = f"cache_{field}_total" if kind == "counter" else f"cache_{field}"
+        yield f"# HELP {name} {help}"
+        yield f"# TYPE {name} {kind}"
+        for cache_name, values in sorted(stats.items()):
+            yield f'{name}{{cache="{cache_name}"}} {values[field]}'
+
+def _render_audit():
+    stats = audit.log.stats()
+    for field, kind, help in (
+        ("written", "counter", "Circulation audit events written."),
+        ("blocked", "counter", "Times circulation waited for room in the full audit queue."),
+        ("write_errors", "counter", "Failed audit batch writes (each is retried)."),
+        ("dropped", "counter", "Audit events given up on and logged instead of written."),
+        ("pending", "gauge", "Audit events queued for writing."),
+    ):
+        name = f"audit_events_{field}_total" if kind == "counter" else f"audit_events_{field}"
+        yield f"# HELP {name} {help}"
+        yield f"# TYPE {name} {kind}"
+        yield f"{name} {stats[field]}"
+
+def render():
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    lines.extend(_render_caches())
+    lines.extend(_render_audit())
+    return "\n".join(lines) + "\n"
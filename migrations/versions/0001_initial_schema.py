@@ -0,0 +1,144 @@
+"""Initial schema
+
+Matches library_schema.sql before the access-path indexes. Databases that
+were created from that script can be adopted with `alembic stamp 0001`.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+FTS_STATEMENTS = (
+    "CREATE VIRTUAL TABLE books_fts USING fts5("
+    "title, author, publisher, category, content='books', content_rowid='book_id')",
+    "CREATE TRIGGER books_fts_ai AFTER INSERT ON books BEGIN "
+    "INSERT INTO books_fts(rowid, title, author, publisher, category) "
+    "VALUES (new.book_id, new.title, new.author, new.publisher, new.category); END",
+    "CREATE TRIGGER books_fts_ad AFTER DELETE ON books BEGIN "
+    "INSERT INTO books_fts(books_fts, rowid, title, author, publisher, category) "
+    "VALUES ('delete', old.book_id, old.title, old.author, old.publisher, old.category); END",
+    "CREATE TRIGGER books_fts_au AFTER UPDATE ON books BEGIN "
+    "INSERT INTO books_fts(books_fts, rowid, title, author, publisher, category) "
+    "VALUES ('delete', old.book_id, old.title, old.author, old.publisher, old.category); "
+    "INSERT INTO books_fts(rowid, title, author, publisher, category) "
+    "VALUES (new.book_id, new.title, new.author, new.publisher, new.category); END",
+)
+
+
+def _timestamps():
+    on_update = " ON UPDATE CURRENT_TIMESTAMP" if op.get_bind().dialect.name == "mysql" else ""
+    return [
+        sa.Column('created_at', sa.TIMESTAMP(), server_default=sa.text('CURRENT_TIMESTAMP'), nullable=True),
+        sa.Column('updated_at', sa.TIMESTAMP(), server_default=sa.text('CURRENT_TIMESTAMP' + on_update), nullable=True),
+    ]
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+
+    op.create_table(
+        'staff',
+        sa.Column('staff_id', sa.Integer(), primary_key=True),
+        sa.Column('name', sa.String(100), nullable=False),
+        sa.Column('email', sa.String(100), nullable=False, unique=True),
+        sa.Column('phone', sa.String(20), nullable=False),
+        sa.Column('role', sa.String(50), nullable=False),
+        sa.Column('hire_date', sa.Date(), nullable=False),
+        *_timestamps(),
+    )
+    op.create_index('ix_staff_staff_id', 'staff', ['staff_id'])
+
+    op.create_table(
+        'members',
+        sa.Column('member_id', sa.Integer(), primary_key=True),
+        sa.Column('name', sa.String(100), nullable=False),
+        sa.Column('email', sa.String(100), nullable=False, unique=True),
+        sa.Column('phone', sa.String(20), nullable=False),
+        sa.Column('address', sa.Text(), nullable=False),
+        sa.Column('membership_date', sa.Date(), nullable=False),
+        sa.Column('membership_status', sa.Enum('Active', 'Inactive', 'Suspended'),
+                  nullable=False, server_default='Active'),
+        *_timestamps(),
+    )
+    op.create_index('ix_members_member_id', 'members', ['member_id'])
+
+    op.create_table(
+        'books',
+        sa.Column('book_id', sa.Integer(), primary_key=True),
+        sa.Column('title', sa.String(200), nullable=False),
+        sa.Column('author', sa.String(100), nullable=False),
+        sa.Column('isbn', sa.String(13), nullable=False, unique=True),
+        sa.Column('publication_year', sa.Integer(), nullable=False),
+        sa.Column('publisher', sa.String(100), nullable=False),
+        sa.Column('category', sa.String(50), nullable=False),
+        sa.Column('total_copies', sa.Integer(), nullable=False, server_default='1'),
+        sa.Column('available_copies', sa.Integer(), nullable=False, server_default='1'),
+        sa.Column('location', sa.String(50), nullable=False),
+        *_timestamps(),
+        sa.CheckConstraint('publication_year > 0'),
+        sa.CheckConstraint('total_copies >= 0'),
+        sa.CheckConstraint('available_copies >= 0'),
+        sa.CheckConstraint('available_copies <= total_copies'),
+    )
+    op.create_index('ix_books_book_id', 'books', ['book_id'])
+    if dialect == "mysql":
+        op.execute("ALTER TABLE books ADD FULLTEXT INDEX ft_books_search (title, author, publisher, category)")
+    elif dialect == "sqlite":
+        for statement in FTS_STATEMENTS:
+            op.execute(statement)
+
+    op.create_table(
+        'borrowing_records',
+        sa.Column('record_id', sa.Integer(), primary_key=True),
+        sa.Column('book_id', sa.Integer(), sa.ForeignKey('books.book_id', ondelete='RESTRICT'), nullable=False),
+        sa.Column('member_id', sa.Integer(), sa.ForeignKey('members.member_id', ondelete='RESTRICT'), nullable=False),
+        sa.Column('borrow_date', sa.Date(), nullable=False),
+        sa.Column('due_date', sa.Date(), nullable=False),
+        sa.Column('return_date', sa.Date(), nullable=True),
+        sa.Column('fine_amount', sa.DECIMAL(10, 2), server_default='0.00', nullable=True),
+        sa.Column('status', sa.Enum('Borrowed', 'Returned', 'Overdue'), nullable=False, server_default='Borrowed'),
+        *_timestamps(),
+        sa.CheckConstraint('borrow_date <= due_date'),
+        sa.CheckConstraint('return_date IS NULL OR return_date >= borrow_date'),
+    )
+    op.create_index('ix_borrowing_records_record_id', 'borrowing_records', ['record_id'])
+    op.create_index('ix_borrowing_records_status_due_date', 'borrowing_records', ['status', 'due_date'])
+
+    op.create_table(
+        'reservations',
+        sa.Column('reservation_id', sa.Integer(), primary_key=True),
+        sa.Column('book_id', sa.Integer(), sa.ForeignKey('books.book_id', ondelete='RESTRICT'), nullable=False),
+        sa.Column('member_id', sa.Integer(), sa.ForeignKey('members.member_id', ondelete='RESTRICT'), nullable=False),
+        sa.Column('reservation_date', sa.Date(), nullable=False),
+        sa.Column('status', sa.Enum('Pending', 'Fulfilled', 'Cancelled'), nullable=False, server_default='Pending'),
+        *_timestamps(),
+    )
+    op.create_index('ix_reservations_reservation_id', 'reservations', ['reservation_id'])
+
+    op.create_table(
+        'job_checkpoints',
+        sa.Column('job_name', sa.String(50), primary_key=True),
+        sa.Column('as_of', sa.Date(), nullable=False),
+        sa.Column('last_due_date', sa.Date(), nullable=True),
+        sa.Column('last_record_id', sa.Integer(), nullable=True),
+        _timestamps()[1],
+    )
+
+
+def downgrade():
+    op.drop_table('job_checkpoints')
+    op.drop_table('reservations')
+    op.drop_table('borrowing_records')
+    if op.get_bind().dialect.name == "sqlite":
+        op.execute("DROP TABLE IF EXISTS books_fts")
+    op.drop_table('books')
+    op.drop_table('members')
+    op.drop_table('staff')
@@ -0,0 +1,38 @@
+"""Access-path indexes for the loan and reservation queries
+
+- borrowing_records (book_id, return_date): open loans of a book
+- borrowing_records (member_id, return_date): a member's loans, open first
+- reservations (book_id, member_id, status): duplicate-hold check
+- reservations (member_id, status): a member's holds
+
+In MySQL the composite indexes also serve the foreign keys on book_id and
+member_id.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-17
+"""
+from alembic import op
+
+
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+INDEXES = (
+    ('ix_borrowing_records_book_id_return_date', 'borrowing_records', ['book_id', 'return_date']),
+    ('ix_borrowing_records_member_id_return_date', 'borrowing_records', ['member_id', 'return_date']),
+    ('ix_reservations_book_id_member_id_status', 'reservations', ['book_id', 'member_id', 'status']),
+    ('ix_reservations_member_id_status', 'reservations', ['member_id', 'status']),
+)
+
+
+def upgrade():
+    for name, table, columns in INDEXES:
+        op.create_index(name, table, columns)
+
+
+def downgrade():
+    for name, table, _ in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
@@ -0,0 +1,28 @@
+"""Hold queue index on reservations
+
+reservations (book_id, status, reservation_date, reservation_id) lets the
+next pending hold on a book, and a hold's place in the queue, be read in
+FIFO order straight from the index.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-17
+"""
+from alembic import op
+
+
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(
+        'ix_reservations_book_id_status_queue', 'reservations',
+        ['book_id', 'status', 'reservation_date', 'reservation_id']
+    )
+
+
+def downgrade():
+    op.drop_index('ix_reservations_book_id_status_queue', table_name='reservations')
@@ -0,0 +1,59 @@
+"""Aggregate tables for circulation statistics
+
+Kept up to date by crud.py on checkout and return (see stats.py). Existing
+data is not backfilled here; run `python stats.py rebuild` once after
+upgrading.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'stats_daily_loans',
+        sa.Column('stat_date', sa.Date(), primary_key=True),
+        sa.Column('checkouts', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('returns', sa.Integer(), nullable=False, server_default='0'),
+    )
+    op.create_table(
+        'stats_book_loans',
+        sa.Column('book_id', sa.Integer(), sa.ForeignKey('books.book_id', ondelete='CASCADE'), primary_key=True),
+        sa.Column('checkouts', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('open_loans', sa.Integer(), nullable=False, server_default='0'),
+    )
+    op.create_index('ix_stats_book_loans_checkouts', 'stats_book_loans', ['checkouts'])
+    op.create_table(
+        'stats_categories',
+        sa.Column('category', sa.String(50), primary_key=True),
+        sa.Column('total_copies', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('open_loans', sa.Integer(), nullable=False, server_default='0'),
+    )
+    op.create_table(
+        'stats_member_loans',
+        sa.Column('member_id', sa.Integer(), sa.ForeignKey('members.member_id', ondelete='CASCADE'), primary_key=True),
+        sa.Column('open_loans', sa.Integer(), nullable=False, server_default='0'),
+    )
+    op.create_table(
+        'stats_totals',
+        sa.Column('name', sa.String(50), primary_key=True),
+        sa.Column('value', sa.DECIMAL(14, 2), nullable=False, server_default='0'),
+    )
+
+
+def downgrade():
+    op.drop_table('stats_totals')
+    op.drop_table('stats_member_loans')
+    op.drop_table('stats_categories')
+    op.drop_index('ix_stats_book_loans_checkouts', table_name='stats_book_loans')
+    op.drop_table('stats_book_loans')
+    op.drop_table('stats_daily_loans')
@@ -0,0 +1,49 @@
+"""Staff on borrowing records and the circulation audit log
+
+borrowing_records.staff_id records who processed a checkout (NULL for
+self-service and for loans made before this revision).
+circulation_audit_log is the append-only trail written by audit.py.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('borrowing_records') as batch_op:
+        batch_op.add_column(sa.Column('staff_id', sa.Integer(), nullable=True))
+        batch_op.create_foreign_key(
+            'fk_borrowing_records_staff_id', 'staff', ['staff_id'], ['staff_id'], ondelete='SET NULL'
+        )
+    op.create_table(
+        'circulation_audit_log',
+        sa.Column('event_id', sa.Integer(), primary_key=True),
+        sa.Column('event', sa.Enum('checkout', 'return'), nullable=False),
+        sa.Column('record_id', sa.Integer(), nullable=False),
+        sa.Column('book_id', sa.Integer(), nullable=False),
+        sa.Column('member_id', sa.Integer(), nullable=False),
+        sa.Column('staff_id', sa.Integer(), nullable=True),
+        sa.Column('occurred_at', sa.TIMESTAMP(), nullable=False),
+    )
+    op.create_index('ix_circulation_audit_log_record_id', 'circulation_audit_log', ['record_id'])
+    op.create_index(
+        'ix_circulation_audit_log_staff_id_occurred_at', 'circulation_audit_log', ['staff_id', 'occurred_at']
+    )
+
+
+def downgrade():
+    op.drop_index('ix_circulation_audit_log_staff_id_occurred_at', table_name='circulation_audit_log')
+    op.drop_index('ix_circulation_audit_log_record_id', table_name='circulation_audit_log')
+    op.drop_table('circulation_audit_log')
+    with op.batch_alter_table('borrowing_records') as batch_op:
+        batch_op.drop_constraint('fk_borrowing_records_staff_id', type_='foreignkey')
+        batch_op.drop_column('staff_id')
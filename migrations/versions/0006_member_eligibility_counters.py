@@ -0,0 +1,30 @@
+"""Overdue counters per member for checkout eligibility
+
+stats_member_loans gains the number of open Overdue loans and their fines,
+kept by crud.py and the overdue sweep. Existing rows start at zero; run
+`python stats.py rebuild` once after upgrading.
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('stats_member_loans') as batch_op:
+        batch_op.add_column(sa.Column('overdue_loans', sa.Integer(), nullable=False, server_default='0'))
+        batch_op.add_column(sa.Column('outstanding_fines', sa.DECIMAL(10, 2), nullable=False, server_default='0'))
+
+
+def downgrade():
+    with op.batch_alter_table('stats_member_loans') as batch_op:
+        batch_op.drop_column('outstanding_fines')
+        batch_op.drop_column('overdue_loans')
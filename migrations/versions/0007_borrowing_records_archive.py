@@ -0,0 +1,45 @@
+"""Archive table for returned borrowing records
+
+borrowing_records_archive holds returned loans that archive.py moved out of
+borrowing_records, under their original record_ids.
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0007'
+down_revision = '0006'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'borrowing_records_archive',
+        sa.Column('record_id', sa.Integer(), primary_key=True, autoincrement=False),
+        sa.Column('book_id', sa.Integer(), sa.ForeignKey('books.book_id', ondelete='RESTRICT'), nullable=False),
+        sa.Column('member_id', sa.Integer(), sa.ForeignKey('members.member_id', ondelete='RESTRICT'), nullable=False),
+        sa.Column('staff_id', sa.Integer(), sa.ForeignKey(
+            'staff.staff_id', ondelete='SET NULL', name='fk_borrowing_records_archive_staff_id'
+        ), nullable=True),
+        sa.Column('borrow_date', sa.Date(), nullable=False),
+        sa.Column('due_date', sa.Date(), nullable=False),
+        sa.Column('return_date', sa.Date(), nullable=False),
+        sa.Column('fine_amount', sa.DECIMAL(10, 2), nullable=True),
+        sa.Column('status', sa.Enum('Borrowed', 'Returned', 'Overdue'), nullable=False),
+        sa.Column('created_at', sa.TIMESTAMP(), nullable=True),
+        sa.Column('updated_at', sa.TIMESTAMP(), nullable=True),
+        sa.Column('archived_at', sa.TIMESTAMP(), nullable=False),
+    )
+    op.create_index('ix_borrowing_records_archive_member_id', 'borrowing_records_archive', ['member_id'])
+    op.create_index('ix_borrowing_records_archive_book_id', 'borrowing_records_archive', ['book_id'])
+
+
+def downgrade():
+    op.drop_index('ix_borrowing_records_archive_book_id', table_name='borrowing_records_archive')
+    op.drop_index('ix_borrowing_records_archive_member_id', table_name='borrowing_records_archive')
+    op.drop_table('borrowing_records_archive')
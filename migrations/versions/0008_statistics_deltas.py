@@ -0,0 +1,38 @@
+"""Append-only deltas for the shared statistics rows
+
+Circulation appends its changes to the daily, per-book, per-category and
+total statistics to stats_deltas instead of updating those rows in place;
+stats.compact folds them in.
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0008'
+down_revision = '0007'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'stats_deltas',
+        sa.Column('delta_id', sa.Integer(), primary_key=True),
+        sa.Column('stat_date', sa.Date(), nullable=True),
+        sa.Column('book_id', sa.Integer(), nullable=True),
+        sa.Column('category', sa.String(50), nullable=True),
+        sa.Column('checkouts', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('returns', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('open_loans', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('total_copies', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('active_members', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('outstanding_fines', sa.DECIMAL(10, 2), nullable=False, server_default='0'),
+    )
+
+
+def downgrade():
+    op.drop_table('stats_deltas')
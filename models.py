@@ -1,8 +1,14 @@
-from sqlalchemy import Column, Integer, String, Date, Enum, Text, DECIMAL, ForeignKey, TIMESTAMP
+from sqlalchemy import Column, Integer, String, Date, Enum, Text, DECIMAL, ForeignKey, TIMESTAMP, DDL, Index, event
 from sqlalchemy.orm import relationship
 from database import Base
 from datetime import datetime
 
+def utcnow():
+    # TIMESTAMP columns store whole seconds. Generating the value at that
+    # precision keeps a written object's timestamps equal to the stored ones,
+    # so writes need not read the row back (see crud.py).
+    return datetime.utcnow().replace(microsecond=0)
+
 class Member(Base):
     __tablename__ = "members"
 
@@ -13,8 +19,8 @@ class Member(Base):
     address = Column(Text, nullable=False)
     membership_date = Column(Date, nullable=False)
     membership_status = Column(Enum('Active', 'Inactive', 'Suspended'), nullable=False, default='Active')
-    created_at = Column(TIMESTAMP, default=datetime.utcnow)
-    updated_at = Column(TIMESTAMP, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = Column(TIMESTAMP, default=utcnow)
+    updated_at = Column(TIMESTAMP, default=utcnow, onupdate=utcnow)
 
     borrowing_records = relationship("BorrowingRecord", back_populates="member")
     reservations = relationship("Reservation", back_populates="member")
@@ -32,12 +38,38 @@ class Book(Base):
     total_copies = Column(Integer, nullable=False, default=1)
     available_copies = Column(Integer, nullable=False, default=1)
     location = Column(String(50), nullable=False)
-    created_at = Column(TIMESTAMP, default=datetime.utcnow)
-    updated_at = Column(TIMESTAMP, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = Column(TIMESTAMP, default=utcnow)
+    updated_at = Column(TIMESTAMP, default=utcnow, onupdate=utcnow)
 
     borrowing_records = relationship("BorrowingRecord", back_populates="book")
     reservations = relationship("Reservation", back_populates="book")
 
+# Full-text search index for the catalog (see search.py). MySQL gets a native
+# FULLTEXT index; SQLite gets an external-content FTS5 table kept in sync by
+# triggers.
+event.listen(Book.__table__, "after_create", DDL(
+    "ALTER TABLE books ADD FULLTEXT INDEX ft_books_search (title, author, publisher, category)"
+).execute_if(dialect="mysql"))
+
+for _statement in (
+    "CREATE VIRTUAL TABLE books_fts USING fts5("
+    "title, author, publisher, category, content='books', content_rowid='book_id')",
+    "CREATE TRIGGER books_fts_ai AFTER INSERT ON books BEGIN "
+    "INSERT INTO books_fts(rowid, title, author, publisher, category) "
+    "VALUES (new.book_id, new.title, new.author, new.publisher, new.category); END",
+    "CREATE TRIGGER books_fts_ad AFTER DELETE ON books BEGIN "
+    "INSERT INTO books_fts(books_fts, rowid, title, author, publisher, category) "
+    "VALUES ('delete', old.book_id, old.title, old.author, old.publisher, old.category); END",
+    "CREATE TRIGGER books_fts_au AFTER UPDATE ON books BEGIN "
+    "INSERT INTO books_fts(books_fts, rowid, title, author, publisher, category) "
+    "VALUES ('delete', old.book_id, old.title, old.author, old.publisher, old.category); "
+    "INSERT INTO books_fts(rowid, title, author, publisher, category) "
+    "VALUES (new.book_id, new.title, new.author, new.publisher, new.category); END",
+):
+    event.listen(Book.__table__, "after_create", DDL(_statement).execute_if(dialect="sqlite"))
+
+event.listen(Book.__table__, "before_drop", DDL("DROP TABLE IF EXISTS books_fts").execute_if(dialect="sqlite"))
+
 class Staff(Base):
     __tablename__ = "staff"
 
@@ -47,10 +79,8 @@ class Staff(Base):
     phone = Column(String(20), nullable=False)
     role = Column(String(50), nullable=False)
     hire_date = Column(Date, nullable=False)
-    created_at = Column(TIMESTAMP, default=datetime.utcnow)
-    updated_at = Column(TIMESTAMP, default=datetime.utcnow, onupdate=datetime.utcnow)
-
-    borrowing_records = relationship("BorrowingRecord", back_populates="staff")
+    created_at = Column(TIMESTAMP, default=utcnow)
+    updated_at = Column(TIMESTAMP, default=utcnow, onupdate=utcnow)
 
 class BorrowingRecord(Base):
     __tablename__ = "borrowing_records"
@@ -58,16 +88,60 @@ class BorrowingRecord(Base):
     record_id = Column(Integer, primary_key=True, index=True)
     book_id = Column(Integer, ForeignKey('books.book_id', ondelete='RESTRICT'), nullable=False)
     member_id = Column(Integer, ForeignKey('members.member_id', ondelete='RESTRICT'), nullable=False)
+    # Staff member who processed the checkout; None for self-service
+    staff_id = Column(Integer, ForeignKey('staff.staff_id', ondelete='SET NULL', name='fk_borrowing_records_staff_id'))
     borrow_date = Column(Date, nullable=False)
     due_date = Column(Date, nullable=False)
     return_date = Column(Date)
     fine_amount = Column(DECIMAL(10, 2), default=0.00)
     status = Column(Enum('Borrowed', 'Returned', 'Overdue'), nullable=False, default='Borrowed')
-    created_at = Column(TIMESTAMP, default=datetime.utcnow)
-    updated_at = Column(TIMESTAMP, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = Column(TIMESTAMP, default=utcnow)
+    updated_at = Column(TIMESTAMP, default=utcnow, onupdate=utcnow)
 
     book = relationship("Book", back_populates="borrowing_records")
     member = relationship("Member", back_populates="borrowing_records")
+    staff = relationship("Staff")
+
+    @property
+    def book_title(self):
+        return self.book.title
+
+    # Keep in step with the Alembic migrations in migrations/versions.
+    __table_args__ = (
+        # Overdue sweep: open loans by status whose due date has passed
+        Index('ix_borrowing_records_status_due_date', 'status', 'due_date'),
+        # Open loans of a book / of a member
+        Index('ix_borrowing_records_book_id_return_date', 'book_id', 'return_date'),
+        Index('ix_borrowing_records_member_id_return_date', 'member_id', 'return_date'),
+    )
+
+class ArchivedBorrowingRecord(Base):
+    """Returned loans moved out of borrowing_records by archive.py.
+
+    Same columns and record_ids, so a record reads the same from either table.
+    """
+    __tablename__ = "borrowing_records_archive"
+
+    record_id = Column(Integer, primary_key=True, autoincrement=False)
+    book_id = Column(Integer, ForeignKey('books.book_id', ondelete='RESTRICT'), nullable=False)
+    member_id = Column(Integer, ForeignKey('members.member_id', ondelete='RESTRICT'), nullable=False)
+    staff_id = Column(Integer, ForeignKey(
+        'staff.staff_id', ondelete='SET NULL', name='fk_borrowing_records_archive_staff_id'
+    ))
+    borrow_date = Column(Date, nullable=False)
+    due_date = Column(Date, nullable=False)
+    return_date = Column(Date, nullable=False)
+    fine_amount = Column(DECIMAL(10, 2), default=0.00)
+    status = Column(Enum('Borrowed', 'Returned', 'Overdue'), nullable=False, default='Returned')
+    created_at = Column(TIMESTAMP)
+    updated_at = Column(TIMESTAMP)
+    archived_at = Column(TIMESTAMP, nullable=False, default=utcnow)
+
+    __table_args__ = (
+        # A member's or a book's past loans
+        Index('ix_borrowing_records_archive_member_id', 'member_id'),
+        Index('ix_borrowing_records_archive_book_id', 'book_id'),
+    )
 
 class Reservation(Base):
     __tablename__ = "reservations"
@@ -77,8 +151,111 @@ class Reservation(Base):
     member_id = Column(Integer, ForeignKey('members.member_id', ondelete='RESTRICT'), nullable=False)
     reservation_date = Column(Date, nullable=False)
     status = Column(Enum('Pending', 'Fulfilled', 'Cancelled'), nullable=False, default='Pending')
-    created_at = Column(TIMESTAMP, default=datetime.utcnow)
-    updated_at = Column(TIMESTAMP, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = Column(TIMESTAMP, default=utcnow)
+    updated_at = Column(TIMESTAMP, default=utcnow, onupdate=utcnow)
 
     book = relationship("Book", back_populates="reservations")
-    member = relationship("Member", back_populates="reservations") 
\ No newline at end of file
+    member = relationship("Member", back_populates="reservations")
+
+    @property
+    def book_title(self):
+        return self.book.title
+
+    __table_args__ = (
+        # Duplicate-hold check and a member's holds
+        Index('ix_reservations_book_id_member_id_status', 'book_id', 'member_id', 'status'),
+        Index('ix_reservations_member_id_status', 'member_id', 'status'),
+        # Per-book hold queue: head lookup and queue position in FIFO order
+        Index('ix_reservations_book_id_status_queue', 'book_id', 'status', 'reservation_date', 'reservation_id'),
+    )
+
+class CirculationEvent(Base):
+    """Append-only log of checkouts and returns, written in batches by audit.py.
+
+    No foreign keys: entries outlive the rows they describe, and inserts stay
+    cheap.
+    """
+    __tablename__ = "circulation_audit_log"
+
+    event_id = Column(Integer, primary_key=True)
+    event = Column(Enum('checkout', 'return'), nullable=False)
+    record_id = Column(Integer, nullable=False)
+    book_id = Column(Integer, nullable=False)
+    member_id = Column(Integer, nullable=False)
+    staff_id = Column(Integer)
+    occurred_at = Column(TIMESTAMP, nullable=False)
+
+    __table_args__ = (
+        Index('ix_circulation_audit_log_record_id', 'record_id'),
+        Index('ix_circulation_audit_log_staff_id_occurred_at', 'staff_id', 'occurred_at'),
+    )
+
+class JobCheckpoint(Base):
+    __tablename__ = "job_checkpoints"
+
+    job_name = Column(String(50), primary_key=True)
+    as_of = Column(Date, nullable=False)
+    last_due_date = Column(Date)
+    last_record_id = Column(Integer)
+    updated_at = Column(TIMESTAMP, default=utcnow, onupdate=utcnow)
+
+# Incrementally maintained statistics (see stats.py)
+class DailyLoanStats(Base):
+    __tablename__ = "stats_daily_loans"
+
+    stat_date = Column(Date, primary_key=True)
+    checkouts = Column(Integer, nullable=False, default=0)
+    returns = Column(Integer, nullable=False, default=0)
+
+class BookLoanStats(Base):
+    __tablename__ = "stats_book_loans"
+
+    book_id = Column(Integer, ForeignKey('books.book_id', ondelete='CASCADE'), primary_key=True)
+    checkouts = Column(Integer, nullable=False, default=0)
+    open_loans = Column(Integer, nullable=False, default=0)
+
+    book = relationship("Book")
+
+    __table_args__ = (
+        # Top titles
+        Index('ix_stats_book_loans_checkouts', 'checkouts'),
+    )
+
+class CategoryStats(Base):
+    __tablename__ = "stats_categories"
+
+    category = Column(String(50), primary_key=True)
+    total_copies = Column(Integer, nullable=False, default=0)
+    open_loans = Column(Integer, nullable=False, default=0)
+
+class MemberLoanStats(Base):
+    __tablename__ = "stats_member_loans"
+
+    member_id = Column(Integer, ForeignKey('members.member_id', ondelete='CASCADE'), primary_key=True)
+    open_loans = Column(Integer, nullable=False, default=0)
+    overdue_loans = Column(Integer, nullable=False, default=0)
+    # Fines on the member's open Overdue loans.
+    outstanding_fines = Column(DECIMAL(10, 2), nullable=False, default=0)
+
+class StatsTotal(Base):
+    __tablename__ = "stats_totals"
+
+    name = Column(String(50), primary_key=True)
+    value = Column(DECIMAL(14, 2), nullable=False, default=0)
+
+class StatsDelta(Base):
+    # Append-only: circulation adds rows, stats.compact folds them into the
+    # tables above and deletes them.
+    __tablename__ = "stats_deltas"
+
+    delta_id = Column(Integer, primary_key=True)
+    stat_date = Column(Date)
+    # No foreign key: appending must not lock or check the book row.
+    book_id = Column(Integer)
+    category = Column(String(50))
+    checkouts = Column(Integer, nullable=False, default=0)
+    returns = Column(Integer, nullable=False, default=0)
+    open_loans = Column(Integer, nullable=False, default=0)
+    total_copies = Column(Integer, nullable=False, default=0)
+    active_members = Column(Integer, nullable=False, default=0)
+    outstanding_fines = Column(DECIMAL(10, 2), nullable=False, default=0)
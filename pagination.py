@@ -0,0 +1,87 @@
+import base64
+import json
+from datetime import date, datetime
+
+from sqlalchemy import and_, or_
+
+# Keyset (cursor) pagination helpers.
+#
+# A cursor is an opaque, URL-safe token holding the sort key and primary key of
+# the last row on the previous page. The next page is then fetched with
+# "WHERE (sort, pk) > (last_sort, last_pk) ORDER BY sort, pk LIMIT n", which
+# walks the index instead of scanning and discarding `skip` rows like OFFSET.
+
+def _to_json(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+def _from_json(column, value):
+    python_type = column.type.python_type
+    if value is None:
+        return None
+    if python_type is datetime:
+        return datetime.fromisoformat(value)
+    if python_type is date:
+        return date.fromisoformat(value)
+    return python_type(value)
+
+def encode_cursor(sort_by, sort_value, pk_value):
+    payload = json.dumps([sort_by, _to_json(sort_value), pk_value], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        sort_by, sort_value, pk_value = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return sort_by, sort_value, int(pk_value)
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+
+def _pk_column(model):
+    return model.__mapper__.primary_key[0]
+
+def paginate(query, model, skip=0, limit=100, cursor=None, sort_by=None):
+    """Apply a stable ordering plus either OFFSET or keyset pagination.
+
+    `sort_by` names a column on `model`; the primary key is always appended as
+    a tie-breaker so the ordering is total. When `cursor` is given `skip` is
+    ignored.
+    """
+    pk = _pk_column(model)
+    sort_column = getattr(model, sort_by) if sort_by else None
+
+    if cursor:
+        cursor_sort_by, sort_value, pk_value = decode_cursor(cursor)
+        if cursor_sort_by != sort_by:
+            raise ValueError("Cursor does not match the requested sort order")
+        if sort_column is None:
+            query = query.filter(pk > pk_value)
+        else:
+            try:
+                sort_value = _from_json(sort_column, sort_value)
+            except (ValueError, TypeError):
+                raise ValueError("Invalid cursor")
+            query = query.filter(
+                or_(
+                    sort_column > sort_value,
+                    and_(sort_column == sort_value, pk > pk_value)
+                )
+            )
+
+    if sort_column is not None:
+        query = query.order_by(sort_column, pk)
+    else:
+        query = query.order_by(pk)
+    if skip and not cursor:
+        query = query.offset(skip)
+    return query.limit(limit)
+
+def next_cursor(items, model, limit, sort_by=None):
+    """Return the cursor for the page after `items`, or None on the last page."""
+    if not items or len(items) < limit:
+        return None
+    last = items[-1]
+    pk_value = getattr(last, _pk_column(model).key)
+    sort_value = getattr(last, sort_by) if sort_by else None
+    return encode_cursor(sort_by, sort_value, pk_value)
@@ -1,6 +1,6 @@
 from pydantic import BaseModel, EmailStr
 from datetime import date, datetime
-from typing import Optional
+from typing import Dict, List, Optional
 from decimal import Decimal
 
 # Member schemas
@@ -21,8 +21,24 @@ class Member(MemberBase):
     updated_at: datetime
 
     class Config:
+        orm_mode = True
         from_attributes = True
 
+# Batch lookup: every requested key appears in the result, null when unknown,
+# and is also listed under `missing`.
+class MemberLookup(BaseModel):
+    member_ids: List[int] = []
+    emails: List[str] = []
+
+class MemberLookupMissing(BaseModel):
+    member_ids: List[int] = []
+    emails: List[str] = []
+
+class MemberLookupResult(BaseModel):
+    by_id: Dict[int, Optional[Member]] = {}
+    by_email: Dict[str, Optional[Member]] = {}
+    missing: MemberLookupMissing
+
 # Book schemas
 class BookBase(BaseModel):
     title: str
@@ -44,8 +60,22 @@ class Book(BookBase):
     updated_at: datetime
 
     class Config:
+        orm_mode = True
         from_attributes = True
 
+class BookLookup(BaseModel):
+    book_ids: List[int] = []
+    isbns: List[str] = []
+
+class BookLookupMissing(BaseModel):
+    book_ids: List[int] = []
+    isbns: List[str] = []
+
+class BookLookupResult(BaseModel):
+    by_id: Dict[int, Optional[Book]] = {}
+    by_isbn: Dict[str, Optional[Book]] = {}
+    missing: BookLookupMissing
+
 # Staff schemas
 class StaffBase(BaseModel):
     name: str
@@ -63,12 +93,14 @@ class Staff(StaffBase):
     updated_at: datetime
 
     class Config:
+        orm_mode = True
         from_attributes = True
 
 # Borrowing Record schemas
 class BorrowingRecordBase(BaseModel):
     book_id: int
     member_id: int
+    staff_id: Optional[int] = None
     borrow_date: date
     due_date: date
     return_date: Optional[date] = None
@@ -84,8 +116,50 @@ class BorrowingRecord(BorrowingRecordBase):
     updated_at: datetime
 
     class Config:
+        orm_mode = True
+        from_attributes = True
+
+class CirculationEvent(BaseModel):
+    event_id: int
+    event: str
+    record_id: int
+    book_id: int
+    member_id: int
+    staff_id: Optional[int] = None
+    occurred_at: datetime
+
+    class Config:
+        orm_mode = True
         from_attributes = True
 
+# Batch circulation: every requested item gets an outcome, "checked_out" or
+# "returned" when applied, "rejected" with an error, or "skipped" when an
+# all-or-nothing batch was rolled back because of another item.
+class BatchCheckout(BaseModel):
+    member_id: int
+    book_ids: List[int]
+    staff_id: Optional[int] = None
+    borrow_date: Optional[date] = None  # defaults to today
+    due_date: Optional[date] = None  # defaults to the standard loan period
+
+class BatchReturn(BaseModel):
+    record_ids: List[int]
+    staff_id: Optional[int] = None
+    return_date: Optional[date] = None  # defaults to today
+
+class BatchItemOutcome(BaseModel):
+    book_id: Optional[int] = None
+    record_id: Optional[int] = None
+    status: str
+    error: Optional[str] = None
+    due_date: Optional[date] = None
+    # Set when the returned copy went straight to this member's hold.
+    held_for_member_id: Optional[int] = None
+
+class BatchResult(BaseModel):
+    committed: bool
+    items: List[BatchItemOutcome]
+
 # Reservation schemas
 class ReservationBase(BaseModel):
     book_id: int
@@ -102,4 +176,92 @@ class Reservation(ReservationBase):
     updated_at: datetime
 
     class Config:
-        from_attributes = True 
\ No newline at end of file
+        orm_mode = True
+        from_attributes = True
+
+class QueuePosition(BaseModel):
+    reservation_id: int
+    book_id: int
+    status: str
+    position: Optional[int] = None
+    queue_length: int
+
+# Member dashboard schemas
+class DashboardLoan(BorrowingRecord):
+    book_title: str
+
+class DashboardReservation(Reservation):
+    book_title: str
+
+class MemberDashboard(BaseModel):
+    member: Member
+    open_loans: List[DashboardLoan]
+    pending_reservations: List[DashboardReservation]
+
+class MemberEligibility(BaseModel):
+    member_id: int
+    membership_status: str
+    open_loans: int
+    overdue_loans: int
+    outstanding_fines: Decimal
+    max_open_loans: int
+    max_outstanding_fines: Decimal
+    eligible: bool
+    reason: Optional[str] = None
+
+# Bulk import schemas
+class ImportRowError(BaseModel):
+    row: int
+    error: str
+
+class ImportReport(BaseModel):
+    inserted: int = 0
+    errors: List[ImportRowError] = []
+
+# Batch job schemas
+class OverdueSweepReport(BaseModel):
+    as_of: date
+    marked_overdue: int
+    fines_updated: int
+    rows_touched: int
+    chunks: int
+    resumed_from_record_id: Optional[int] = None
+    elapsed_seconds: float
+
+class ArchiveReport(BaseModel):
+    before: date
+    archived: int
+    chunks: int
+    elapsed_seconds: float
+
+# Statistics schemas
+class DailyLoans(BaseModel):
+    stat_date: date
+    checkouts: int
+    returns: int
+
+    class Config:
+        orm_mode = True
+        from_attributes = True
+
+class TopTitle(BaseModel):
+    book_id: int
+    title: str
+    author: str
+    checkouts: int
+    open_loans: int
+
+class CategoryUtilization(BaseModel):
+    category: str
+    total_copies: int
+    open_loans: int
+    utilization: Optional[float] = None
+
+class LibrarySummary(BaseModel):
+    open_loans: int
+    active_members: int
+    outstanding_fines: Decimal
+
+class StatsCompactionReport(BaseModel):
+    folded: int
+    elapsed_seconds: float
\ No newline at end of file
@@ -0,0 +1,72 @@
+import re
+
+from sqlalchemy import column, or_, table, text
+from sqlalchemy.dialects.mysql import match
+
+import models
+
+# Full-text catalog search.
+#
+# MySQL uses the FULLTEXT index `ft_books_search` with a boolean-mode MATCH, so
+# every term must appear and each term matches as a prefix ("gats" -> "Gatsby").
+# SQLite (used by the tests) uses the FTS5 table `books_fts`, which triggers in
+# models.py keep in sync with `books`. Any other dialect falls back to
+# per-term ILIKE filters without ranking.
+
+SEARCH_COLUMNS = ("title", "author", "publisher", "category")
+
+books_fts = table("books_fts", column("rowid"))
+
+def tokenize(term: str):
+    return re.findall(r"\w+", term.lower())
+
+def _mysql_query(tokens):
+    return " ".join(f"+{token}*" for token in tokens)
+
+def _sqlite_query(tokens):
+    return " ".join(f'"{token}"*' for token in tokens)
+
+def filter_books(query, term: str, ranked: bool = True):
+    """Restrict a `Book` query to rows matching `term`.
+
+    With `ranked` the query is also ordered by relevance, best match first.
+    """
+    tokens = tokenize(term)
+    if not tokens:
+        return query.order_by(models.Book.book_id) if ranked else query
+
+    dialect = query.session.get_bind().dialect.name
+    if dialect == "mysql":
+        score = match(
+            *(getattr(models.Book, name) for name in SEARCH_COLUMNS),
+            against=_mysql_query(tokens)
+        ).in_boolean_mode()
+        query = query.filter(score)
+        if ranked:
+            query = query.order_by(score.desc(), models.Book.book_id)
+        return query
+
+    if dialect == "sqlite":
+        query = query.join(books_fts, books_fts.c.rowid == models.Book.book_id).filter(
+            text("books_fts MATCH :search_query").bindparams(search_query=_sqlite_query(tokens))
+        )
+        if ranked:
+            query = query.order_by(text("bm25(books_fts)"), models.Book.book_id)
+        return query
+
+    for token in tokens:
+        query = query.filter(
+            or_(*(getattr(models.Book, name).ilike(f"%{token}%") for name in SEARCH_COLUMNS))
+        )
+    if ranked:
+        query = query.order_by(models.Book.book_id)
+    return query
+
+def rebuild_index(db):
+    """Re-index every book, e.g. after loading rows with triggers disabled.
+
+    MySQL maintains its FULLTEXT index itself, so this only matters for SQLite.
+    """
+    if db.get_bind().dialect.name == "sqlite":
+        db.execute(text("INSERT INTO books_fts(books_fts) VALUES ('rebuild')"))
+        db.commit()
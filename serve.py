@@ -0,0 +1,196 @@
+"""Production launcher: gunicorn with uvicorn workers, sized to the machine.
+
+    python serve.py [--bind 0.0.0.0:8000] [--workers N] [--check]
+    gunicorn -c python:serve main:app        # the same, as a config module
+
+Workers default to the CPUs this process may use (affinity and cgroup quota
+respected); each is a single-threaded event loop, so more workers than cores
+only adds context switches. Every worker opens its own pools (see the lifespan
+in main.py), so the global DB_CONNECTION_BUDGET is split between them. On
+reload (SIGHUP) gunicorn starts a full new set of workers while the old set
+drains, so for up to WEB_GRACEFUL_TIMEOUT seconds twice the workers hold
+connections; the budget is therefore split over 2 * workers. Each worker gets
+one connection for the sync engine, which only the audit writer uses in the
+API, and the rest for its async pool, a fifth of it held open and the
+remainder as overflow. Replica engines get the same per-worker pools on their
+own servers. The plan is exported as the DB_* variables database.py reads, set
+in the master before the app is imported.
+
+The read-through cache (cache.py) is per process by default: a write
+invalidates only the cache of the worker that handled it, so the others would
+serve the old body, and 304s for it, until CACHE_TTL expires. With more than
+one worker the in-process cache is therefore turned off (CACHE_BACKEND=none)
+unless CACHE_BACKEND=redis shares one cache between them.
+
+Counters are per process too: /metrics and /cache/stats report those of
+whichever worker answers the request, not totals for the server.
+
+Workers are recycled after WEB_MAX_REQUESTS requests (with jitter, so they do
+not all restart at once) or when their resident memory passes
+WEB_MAX_WORKER_MEMORY_MB, checked every WEB_TIMEOUT / 2 seconds. A recycled
+worker and every worker on reload (SIGHUP) stops accepting connections,
+finishes the requests in flight, flushes the audit log and closes its pools
+before it exits; WEB_GRACEFUL_TIMEOUT bounds the wait. A recycled worker is
+replaced only once it has exited, so recycling never overlaps generations the
+way a reload does.
+
+Configuration (env):
+  WEB_BIND                    address to listen on (default 0.0.0.0:8000)
+  WEB_CONCURRENCY             worker processes (default: usable CPUs)
+  DB_CONNECTION_BUDGET        connections all workers may open to one database
+                              server together (default 100)
+  WEB_MAX_REQUESTS            requests before a worker is recycled (default
+                              10000; 0 disables)
+  WEB_MAX_WORKER_MEMORY_MB    resident memory that recycles a worker (default
+                              512; 0 disables)
+  WEB_GRACEFUL_TIMEOUT        seconds a stopping worker gets to drain (default 30)
+  WEB_TIMEOUT                 seconds of silence before a worker is killed (default 60)
+  WEB_KEEPALIVE               seconds an idle keep-alive connection is held (default 5)
+  WEB_PRELOAD                 import the app once in the master (default 0;
+                              saves memory, but SIGHUP then cannot load new code)
+  CACHE_BACKEND               as in cache.py; memory becomes none with more than
+                              one worker
+"""
+import math
+import os
+import signal
+import sys
+
+from uvicorn.workers import UvicornWorker
+
+DB_CONNECTION_BUDGET = int(os.getenv('DB_CONNECTION_BUDGET', '100'))
+WEB_MAX_WORKER_MEMORY_MB = int(os.getenv('WEB_MAX_WORKER_MEMORY_MB', '512'))
+
+# Connections a worker needs at least: the audit writer's and a few for requests.
+SYNC_CONNECTIONS = 1
+MIN_WORKER_CONNECTIONS = SYNC_CONNECTIONS + 3
+# Worker sets holding connections at once: the old one drains during a reload.
+RELOAD_GENERATIONS = 2
+
+def usable_cpus():
+    """CPUs this process may run on, within the container's CPU quota if there is one."""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            cpus = min(cpus, max(1, math.ceil(int(quota) / int(period))))
+    except (OSError, ValueError):
+        pass
+    return cpus
+
+def default_workers(budget: int = DB_CONNECTION_BUDGET):
+    if os.getenv('WEB_CONCURRENCY'):
+        return int(os.environ['WEB_CONCURRENCY'])
+    return max(1, min(usable_cpus(), budget // (MIN_WORKER_CONNECTIONS * RELOAD_GENERATIONS)))
+
+def connection_plan(workers: int, budget: int = DB_CONNECTION_BUDGET):
+    """The DB_* pool settings that keep `workers` processes within `budget` connections, reloads included."""
+    per_worker = budget // (workers * RELOAD_GENERATIONS)
+    if per_worker < MIN_WORKER_CONNECTIONS:
+        raise ValueError(
+            f"DB_CONNECTION_BUDGET={budget} gives {workers} workers {per_worker} connections each "
+            f"(halved for reloads); each needs at least {MIN_WORKER_CONNECTIONS}"
+        )
+    async_connections = per_worker - SYNC_CONNECTIONS
+    pool_size = max(1, async_connections // 5)
+    return {
+        "DB_POOL_SIZE": SYNC_CONNECTIONS,
+        "DB_MAX_OVERFLOW": 0,
+        "DB_ASYNC_POOL_SIZE": pool_size,
+        "DB_ASYNC_MAX_OVERFLOW": async_connections - pool_size,
+        "DB_POOL_PREWARM": min(int(os.getenv('DB_POOL_PREWARM', '5')), pool_size),
+    }
+
+def cache_backend(workers: int):
+    """The CACHE_BACKEND for `workers` processes: the in-process cache only for a single one."""
+    backend = os.getenv('CACHE_BACKEND', 'memory')
+    if backend == 'memory' and workers > 1:
+        return 'none'
+    return backend
+
+def serving_env(workers: int, budget: int = DB_CONNECTION_BUDGET):
+    """The environment the app is imported with: the connection plan and the cache backend."""
+    return {**connection_plan(workers, budget), "CACHE_BACKEND": cache_backend(workers)}
+
+def resident_memory_mb():
+    """This process's resident set size, or None where it cannot be read."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, IndexError):
+        return None
+
+class RecyclingUvicornWorker(UvicornWorker):
+    """UvicornWorker that also leaves, gracefully, once it uses too much memory."""
+
+    max_memory_mb = WEB_MAX_WORKER_MEMORY_MB
+    recycling = False
+
+    async def callback_notify(self):
+        await super().callback_notify()
+        if not self.max_memory_mb or self.recycling:
+            return
+        rss = resident_memory_mb()
+        if rss is not None and rss > self.max_memory_mb:
+            self.recycling = True
+            self.log.info(f"Worker {self.pid} uses {rss:.0f} MB (limit {self.max_memory_mb} MB); recycling it")
+            # uvicorn's SIGTERM handler stops accepting and drains, as on
+            # shutdown; the arbiter then starts a replacement.
+            os.kill(self.pid, signal.SIGTERM)
+
+# Gunicorn settings, read when this module is the config (-c python:serve).
+bind = os.getenv('WEB_BIND', '0.0.0.0:8000')
+workers = default_workers()
+worker_class = "serve.RecyclingUvicornWorker"
+max_requests = int(os.getenv('WEB_MAX_REQUESTS', '10000'))
+max_requests_jitter = max_requests // 10
+graceful_timeout = int(os.getenv('WEB_GRACEFUL_TIMEOUT', '30'))
+timeout = int(os.getenv('WEB_TIMEOUT', '60'))
+keepalive = int(os.getenv('WEB_KEEPALIVE', '5'))
+preload_app = os.getenv('WEB_PRELOAD', '0') == '1'
+accesslog = "-"
+
+# Set by gunicorn in the master before it loads the app, preloaded or not.
+raw_env = [f"{name}={value}" for name, value in serving_env(workers).items()]
+
+def on_starting(server):
+    # Runs in the master before any worker exists, after command-line options
+    # were applied: a -w that overrides `workers` needs its own plan.
+    plan = serving_env(server.cfg.workers)
+    if server.cfg.workers != workers:
+        if server.cfg.preload_app:
+            raise RuntimeError("With WEB_PRELOAD=1 set the worker count through WEB_CONCURRENCY, not -w")
+        os.environ.update({name: str(value) for name, value in plan.items()})
+    server.log.info(
+        f"{server.cfg.workers} workers, DB_CONNECTION_BUDGET={DB_CONNECTION_BUDGET}: "
+        + ", ".join(f"{name}={value}" for name, value in plan.items())
+    )
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Serve the API with gunicorn and uvicorn workers.")
+    parser.add_argument("--bind", default=bind)
+    parser.add_argument("--workers", type=int, default=workers)
+    parser.add_argument("--check", action="store_true", help="print the worker and connection plan and exit")
+    args = parser.parse_args()
+
+    if args.check:
+        print(f"workers: {args.workers} (usable CPUs: {usable_cpus()})")
+        print(f"DB_CONNECTION_BUDGET: {DB_CONNECTION_BUDGET}")
+        for name, value in serving_env(args.workers).items():
+            print(f"{name}: {value}")
+        return 0
+
+    # Passed through the environment so the config module (imported afresh
+    # by gunicorn) plans for them, preloaded or not.
+    os.environ.update(WEB_BIND=args.bind, WEB_CONCURRENCY=str(args.workers))
+    from gunicorn.app.wsgiapp import run
+    sys.argv = ["gunicorn", "--config", "python:serve", "main:app"]
+    return run()
+
+if __name__ == "__main__":
+    sys.exit(main())
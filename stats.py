@@ -0,0 +1,409 @@
+"""Circulation statistics kept in small aggregate tables.
+
+The /stats endpoints read a handful of rows instead of grouping
+borrowing_records:
+
+    stats_daily_loans    checkouts and returns per day
+    stats_book_loans     checkouts and open loans per book (top titles)
+    stats_categories     copies and open loans per category (utilization)
+    stats_member_loans   open loans, overdue loans and their fines per member
+                         (active members, loan eligibility)
+    stats_totals         open_loans, active_members, outstanding_fines
+
+Checkout and return in crud.py update the member's row in the same
+transaction as the loan itself, since eligibility reads it there. Their
+changes to the rows every desk shares (today's date, the totals, a popular
+title) are appended to stats_deltas instead, and `compact` folds them in, so
+circulation never waits on another desk for a statistics row. Those tables lag
+by up to STATS_COMPACT_SECONDS: the app compacts that often (see the lifespan
+in main.py), as do `python stats.py compact` and POST /admin/stats/compact.
+
+Outstanding fines change in bulk during the overdue sweep, which refreshes
+the members it touches with each chunk and appends the chunk's change to the
+total as a delta, like circulation; the total is only ever changed by folding
+deltas, so nothing is counted twice.
+Archival (archive.py) moves returned loans without touching the counters.
+Anything that bypasses crud.py can make the tables drift; `check` reports
+drift and `rebuild` recomputes everything from the base tables, archived
+loans included.
+
+    python stats.py check|rebuild|compact
+
+Configuration (env):
+  STATS_COMPACT_SECONDS   seconds between compactions in each app process
+                          (default 10; 0 disables)
+"""
+import logging
+import os
+import sys
+import time
+from collections import Counter, defaultdict
+from datetime import date
+
+from sqlalchemy import and_, delete, distinct, func, insert, select, update
+from sqlalchemy.dialects import mysql
+from sqlalchemy.orm import Session
+
+import models
+from database import SessionLocal, init_engines
+
+logger = logging.getLogger(__name__)
+
+Loan = models.BorrowingRecord
+
+TOTALS = ("open_loans", "active_members", "outstanding_fines")
+
+STATS_COMPACT_SECONDS = float(os.getenv('STATS_COMPACT_SECONDS', '10'))
+COMPACT_CHUNK_SIZE = 5000
+
+def _bump(db: Session, model, key: dict, increments: dict):
+    """Add `increments` to the row identified by `key`, creating it if needed."""
+    _bump_rows(db, model, tuple(key), [{**key, **increments}])
+
+def _bump_rows(db: Session, model, key: tuple, rows):
+    """_bump for several rows in one statement.
+
+    Each row holds the `key` columns and the increments, the same increment
+    columns in every row.
+    """
+    if not rows:
+        return
+    table = model.__table__
+    increments = [name for name in rows[0] if name not in key]
+    dialect = db.get_bind().dialect.name
+    if dialect == "mysql":
+        statement = mysql.insert(table).values(rows)
+        statement = statement.on_duplicate_key_update(
+            {name: table.c[name] + statement.inserted[name] for name in increments}
+        )
+    elif dialect == "sqlite":
+        # Imported here: only the test and benchmark databases are SQLite.
+        from sqlalchemy.dialects import sqlite
+        statement = sqlite.insert(table).values(rows)
+        statement = statement.on_conflict_do_update(
+            index_elements=list(key),
+            set_={name: table.c[name] + statement.excluded[name] for name in increments}
+        )
+    else:
+        for row in rows:
+            where = [table.c[name] == row[name] for name in key]
+            updated = db.execute(
+                table.update().where(*where).values({name: table.c[name] + row[name] for name in increments})
+            )
+            if not updated.rowcount:
+                db.execute(table.insert().values(**row))
+        return
+    db.execute(statement)
+
+# Columns of stats_deltas that say which rows a delta applies to; the others
+# are increments.
+DELTA_KEYS = ("stat_date", "book_id", "category")
+
+def _append(db: Session, deltas):
+    """Append delta rows; each names the columns it sets, the rest stay empty or zero."""
+    if not deltas:
+        return
+    columns = [column.key for column in models.StatsDelta.__table__.columns if not column.primary_key]
+    db.execute(insert(models.StatsDelta), [
+        {name: delta.get(name, None if name in DELTA_KEYS else 0) for name in columns} for delta in deltas
+    ])
+
+def record_circulation(db: Session, checkouts=(), returns=()):
+    """Count the checkouts and returns of one transaction.
+
+    `checkouts` holds (on_date, book_id, member_id) per new loan; `returns`
+    holds (on_date, book_id, member_id, outstanding_fine) per closed loan,
+    outstanding_fine being the fine it carried if it was Overdue, else None.
+    Call it after the books involved are locked: it updates the members' rows
+    (in member_id order, one statement) and appends the rest.
+    """
+    members = defaultdict(lambda: {"open_loans": 0, "overdue_loans": 0, "outstanding_fines": 0})
+    deltas = []
+    for on_date, book_id, member_id in checkouts:
+        members[member_id]["open_loans"] += 1
+        deltas.append({"stat_date": on_date, "book_id": book_id, "checkouts": 1, "open_loans": 1})
+    for on_date, book_id, member_id, outstanding_fine in returns:
+        member = members[member_id]
+        member["open_loans"] -= 1
+        if outstanding_fine is not None:
+            member["overdue_loans"] -= 1
+            member["outstanding_fines"] -= outstanding_fine
+        deltas.append({
+            "stat_date": on_date, "book_id": book_id, "returns": 1, "open_loans": -1,
+            "outstanding_fines": -(outstanding_fine or 0),
+        })
+    if not deltas:
+        return
+    _bump_rows(db, models.MemberLoanStats, ("member_id",), [
+        {"member_id": member_id, **members[member_id]} for member_id in sorted(members)
+    ])
+    # A member is active while they have open loans.
+    Counters = models.MemberLoanStats
+    active = 0
+    for member_id, open_loans in db.query(Counters.member_id, Counters.open_loans).filter(
+        Counters.member_id.in_(list(members))
+    ):
+        active += (open_loans > 0) - (open_loans - members[member_id]["open_loans"] > 0)
+    deltas[0]["active_members"] = active
+    _append(db, deltas)
+
+def refresh_member_fines(db: Session, member_ids):
+    """Recompute overdue_loans and outstanding_fines of these members from their open loans.
+
+    Called in the transaction that changed their loans' status or fines (the
+    overdue sweep, loan edits); pending ORM changes must be flushed first.
+    """
+    if not member_ids:
+        return
+    Counters = models.MemberLoanStats
+    overdue = and_(Loan.member_id == Counters.member_id, Loan.status == 'Overdue', Loan.return_date == None)
+    db.execute(
+        update(Counters)
+        .where(Counters.member_id.in_(list(member_ids)))
+        .values(
+            overdue_loans=select(func.count(Loan.record_id)).where(overdue).scalar_subquery(),
+            outstanding_fines=select(func.coalesce(func.sum(Loan.fine_amount), 0)).where(overdue).scalar_subquery(),
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+def record_fine_change(db: Session, member_id: int, before=None, after=None):
+    """An open loan's outstanding fine went from `before` to `after`; None where it was or is not Overdue."""
+    refresh_member_fines(db, [member_id])
+    add_fines(db, (after or 0) - (before or 0))
+
+def add_fines(db: Session, delta):
+    """Fines on open Overdue loans changed by `delta` in this transaction."""
+    if delta:
+        _append(db, [{"outstanding_fines": delta}])
+
+def add_copies(db: Session, category: str, delta: int):
+    if delta:
+        _append(db, [{"category": category, "total_copies": delta}])
+
+def _outstanding_fines(db: Session):
+    return db.query(func.coalesce(func.sum(Loan.fine_amount), 0)).filter(
+        Loan.status == 'Overdue', Loan.return_date == None
+    ).scalar()
+
+# Compaction: fold stats_deltas into the aggregate tables
+
+def _fold(db: Session, deltas):
+    """Add a chunk of delta rows to the aggregate tables, each table's rows in key order."""
+    book_ids = {delta.book_id for delta in deltas if delta.book_id is not None}
+    # Loans count towards their book's current category, as in rebuild.
+    categories = dict(
+        db.query(models.Book.book_id, models.Book.category).filter(models.Book.book_id.in_(book_ids))
+    ) if book_ids else {}
+    daily, books, by_category = defaultdict(Counter), defaultdict(Counter), defaultdict(Counter)
+    totals = {name: 0 for name in TOTALS}
+    for delta in deltas:
+        if delta.stat_date is not None:
+            daily[delta.stat_date].update(checkouts=delta.checkouts, returns=delta.returns)
+        category = delta.category
+        if delta.book_id is not None:
+            # A deleted book took its statistics with it.
+            if delta.book_id in categories:
+                books[delta.book_id].update(checkouts=delta.checkouts, open_loans=delta.open_loans)
+            category = categories.get(delta.book_id)
+        if category is not None:
+            by_category[category].update(total_copies=delta.total_copies, open_loans=delta.open_loans)
+        totals["open_loans"] += delta.open_loans
+        totals["active_members"] += delta.active_members
+        totals["outstanding_fines"] += delta.outstanding_fines
+
+    def rows(name, counts, increments):
+        return [
+            {name: key, **{column: counts[key][column] for column in increments}}
+            for key in sorted(counts) if any(counts[key].values())
+        ]
+
+    _bump_rows(db, models.DailyLoanStats, ("stat_date",), rows("stat_date", daily, ("checkouts", "returns")))
+    _bump_rows(db, models.BookLoanStats, ("book_id",), rows("book_id", books, ("checkouts", "open_loans")))
+    _bump_rows(db, models.CategoryStats, ("category",), rows(
+        "category", by_category, ("total_copies", "open_loans")
+    ))
+    _bump_rows(db, models.StatsTotal, ("name",), [
+        {"name": name, "value": value} for name, value in sorted(totals.items()) if value
+    ])
+
+def compact(db: Session, chunk_size: int = COMPACT_CHUNK_SIZE):
+    """Fold pending deltas into the aggregate tables, oldest first; returns the number folded.
+
+    Each chunk is folded and deleted in its own transaction. Its rows are
+    locked by primary key, which leaves appends free to carry on, and a
+    concurrent compaction waits for them and then finds them gone, so every
+    delta is folded once.
+    """
+    Delta = models.StatsDelta
+    folded = 0
+    while True:
+        ids = [delta_id for delta_id, in db.query(Delta.delta_id).order_by(Delta.delta_id).limit(chunk_size)]
+        if not ids:
+            break
+        deltas = db.execute(select(Delta.__table__).where(Delta.delta_id.in_(ids)).with_for_update()).all()
+        _fold(db, deltas)
+        db.execute(delete(Delta).where(Delta.delta_id.in_([delta.delta_id for delta in deltas])))
+        db.commit()
+        folded += len(deltas)
+        if len(ids) < chunk_size:
+            break
+    db.commit()
+    return folded
+
+def run_compaction(db: Session):
+    """compact() and return a report dict (see schemas.StatsCompactionReport)."""
+    started = time.perf_counter()
+    folded = compact(db)
+    return {"folded": folded, "elapsed_seconds": round(time.perf_counter() - started, 3)}
+
+# Reads used by the /stats endpoints
+
+def loans_per_day(db: Session, from_date: date, to_date: date):
+    return db.query(models.DailyLoanStats).filter(
+        models.DailyLoanStats.stat_date >= from_date,
+        models.DailyLoanStats.stat_date <= to_date
+    ).order_by(models.DailyLoanStats.stat_date).all()
+
+def top_titles(db: Session, limit: int = 10):
+    rows = db.query(models.BookLoanStats, models.Book.title, models.Book.author).join(
+        models.Book, models.Book.book_id == models.BookLoanStats.book_id
+    ).order_by(models.BookLoanStats.checkouts.desc(), models.BookLoanStats.book_id).limit(limit).all()
+    return [
+        {
+            "book_id": stats.book_id,
+            "title": title,
+            "author": author,
+            "checkouts": stats.checkouts,
+            "open_loans": stats.open_loans,
+        }
+        for stats, title, author in rows
+    ]
+
+def category_utilization(db: Session):
+    return [
+        {
+            "category": row.category,
+            "total_copies": row.total_copies,
+            "open_loans": row.open_loans,
+            "utilization": round(row.open_loans / row.total_copies, 4) if row.total_copies else None,
+        }
+        for row in db.query(models.CategoryStats).order_by(models.CategoryStats.category)
+    ]
+
+def summary(db: Session):
+    values = dict(db.query(models.StatsTotal.name, models.StatsTotal.value))
+    return {
+        "open_loans": int(values.get("open_loans", 0)),
+        "active_members": int(values.get("active_members", 0)),
+        "outstanding_fines": values.get("outstanding_fines", 0),
+    }
+
+# Consistency: recompute every table from the base tables
+
+def _computed(db: Session):
+    tables = defaultdict(lambda: defaultdict(dict))
+    open_loan = Loan.return_date == None
+
+    # Checkout and return counts cover the archived loans too (see archive.py).
+    daily = tables[models.DailyLoanStats]
+    books = tables[models.BookLoanStats]
+    for model in (Loan, models.ArchivedBorrowingRecord):
+        for day, count in db.query(model.borrow_date, func.count()).group_by(model.borrow_date):
+            daily[(day,)]["checkouts"] = daily[(day,)].get("checkouts", 0) + count
+        for day, count in db.query(model.return_date, func.count()).filter(model.return_date != None).group_by(model.return_date):
+            daily[(day,)]["returns"] = daily[(day,)].get("returns", 0) + count
+        for book_id, count in db.query(model.book_id, func.count()).group_by(model.book_id):
+            books[(book_id,)]["checkouts"] = books[(book_id,)].get("checkouts", 0) + count
+    for book_id, count in db.query(Loan.book_id, func.count()).filter(open_loan).group_by(Loan.book_id):
+        books[(book_id,)]["open_loans"] = count
+
+    categories = tables[models.CategoryStats]
+    for category, copies in db.query(models.Book.category, func.sum(models.Book.total_copies)).group_by(models.Book.category):
+        categories[(category,)]["total_copies"] = copies
+    for category, count in db.query(models.Book.category, func.count()).join(
+        Loan, Loan.book_id == models.Book.book_id
+    ).filter(open_loan).group_by(models.Book.category):
+        categories[(category,)]["open_loans"] = count
+
+    members = tables[models.MemberLoanStats]
+    for member_id, count in db.query(Loan.member_id, func.count()).filter(open_loan).group_by(Loan.member_id):
+        members[(member_id,)]["open_loans"] = count
+    for member_id, count, fines in db.query(Loan.member_id, func.count(), func.sum(Loan.fine_amount)).filter(
+        open_loan, Loan.status == 'Overdue'
+    ).group_by(Loan.member_id):
+        members[(member_id,)]["overdue_loans"] = count
+        members[(member_id,)]["outstanding_fines"] = fines
+
+    totals = tables[models.StatsTotal]
+    totals[("open_loans",)]["value"] = db.query(func.count()).select_from(Loan).filter(open_loan).scalar()
+    totals[("active_members",)]["value"] = db.query(func.count(distinct(Loan.member_id))).filter(open_loan).scalar()
+    totals[("outstanding_fines",)]["value"] = _outstanding_fines(db)
+    return tables
+
+def _value_columns(model):
+    return [column.key for column in model.__table__.columns if not column.primary_key]
+
+def _normalize(model, values):
+    # Rows that are all zero carry no information, stored or not.
+    row = {name: round(float(values.get(name) or 0), 2) for name in _value_columns(model)}
+    return row if any(row.values()) else None
+
+def check(db: Session):
+    """Fold pending deltas, then compare the stored aggregates with a fresh computation; return the differences."""
+    compact(db)
+    differences = []
+    for model, expected_rows in _computed(db).items():
+        key_columns = [column.key for column in model.__table__.primary_key.columns]
+        stored_rows = {
+            tuple(getattr(row, name) for name in key_columns): {name: getattr(row, name) for name in _value_columns(model)}
+            for row in db.query(model)
+        }
+        for key in set(expected_rows) | set(stored_rows):
+            expected = _normalize(model, expected_rows.get(key, {}))
+            stored = _normalize(model, stored_rows.get(key, {}))
+            if expected != stored:
+                differences.append({"table": model.__tablename__, "key": key, "expected": expected, "stored": stored})
+    return differences
+
+def rebuild(db: Session):
+    """Replace every aggregate with values computed from the base tables."""
+    tables = _computed(db)
+    # Pending deltas are part of the computation.
+    db.query(models.StatsDelta).delete(synchronize_session=False)
+    for model, rows in tables.items():
+        key_columns = [column.key for column in model.__table__.primary_key.columns]
+        db.query(model).delete(synchronize_session=False)
+        db.bulk_insert_mappings(model, [
+            {**dict(zip(key_columns, key)), **{name: 0 for name in _value_columns(model)}, **values}
+            for key, values in rows.items()
+        ])
+    db.commit()
+    logger.info(f"Rebuilt statistics: {', '.join(f'{m.__tablename__}={len(r)}' for m, r in tables.items())}")
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Check, rebuild or compact the circulation statistics tables.")
+    parser.add_argument("command", choices=("check", "rebuild", "compact"))
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    init_engines()
+    db = SessionLocal()
+    try:
+        if args.command == "rebuild":
+            rebuild(db)
+            return 0
+        if args.command == "compact":
+            print(f"folded: {compact(db)}")
+            return 0
+        differences = check(db)
+    finally:
+        db.close()
+    for difference in differences:
+        print(difference)
+    print(f"{len(differences)} difference(s)")
+    return 1 if differences else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,82 @@
+import os
+import re
+from datetime import date
+
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+import pytest
+
+import crud
+import models
+
+# Builds the schema from the Alembic migrations and checks with EXPLAIN QUERY
+# PLAN that each hot query is answered from its index rather than a table scan.
+
+HOT_QUERIES = [
+    (
+        "open loans of a book",
+        lambda db: db.query(models.BorrowingRecord).filter(
+            models.BorrowingRecord.book_id == 1,
+            models.BorrowingRecord.return_date == None
+        ),
+        "ix_borrowing_records_book_id_return_date",
+    ),
+    (
+        "loans of a member",
+        lambda db: db.query(models.BorrowingRecord).filter(models.BorrowingRecord.member_id == 1),
+        "ix_borrowing_records_member_id_return_date",
+    ),
+    (
+        "overdue sweep",
+        lambda db: db.query(models.BorrowingRecord.record_id).filter(
+            models.BorrowingRecord.status == "Borrowed",
+            models.BorrowingRecord.due_date < date(2024, 1, 1),
+            models.BorrowingRecord.return_date == None
+        ),
+        "ix_borrowing_records_status_due_date",
+    ),
+    (
+        "duplicate reservation check",
+        lambda db: db.query(models.Reservation).filter(
+            models.Reservation.book_id == 1,
+            models.Reservation.member_id == 1,
+            models.Reservation.status == "Pending"
+        ),
+        "ix_reservations_book_id_member_id_status",
+    ),
+    (
+        "holds of a member",
+        lambda db: db.query(models.Reservation).filter(
+            models.Reservation.member_id == 1,
+            models.Reservation.status == "Pending"
+        ),
+        "ix_reservations_member_id_status",
+    ),
+    (
+        "head of a book's hold queue",
+        lambda db: crud._next_hold_query(db, 1).limit(1),
+        "ix_reservations_book_id_status_queue",
+    ),
+]
+
+@pytest.fixture(scope="module")
+def migrated_db(tmp_path_factory):
+    url = f"sqlite:///{tmp_path_factory.mktemp('migrations') / 'indexes.db'}"
+    config = Config(os.path.join(os.path.dirname(os.path.abspath(__file__)), "alembic.ini"))
+    config.set_main_option("sqlalchemy.url", url)
+    command.upgrade(config, "head")
+    engine = create_engine(url)
+    db = sessionmaker(bind=engine)()
+    yield db
+    db.close()
+    engine.dispose()
+
+@pytest.mark.parametrize("name,build_query,index", HOT_QUERIES, ids=[q[0] for q in HOT_QUERIES])
+def test_hot_query_uses_index(migrated_db, name, build_query, index):
+    statement = build_query(migrated_db).statement.compile(
+        dialect=migrated_db.get_bind().dialect, compile_kwargs={"literal_binds": True}
+    )
+    plan = [row[-1] for row in migrated_db.execute(text(f"EXPLAIN QUERY PLAN {statement}"))]
+    assert any(re.search(rf"INDEX {index}\b", step) for step in plan), f"{name} does not use {index}: {plan}"